@@ -0,0 +1,79 @@
+#
+# bench_adaptive_limit.py - fixed versus adaptive Orchestrator concurrency
+# Validates preconfigs from a pool of threads through OrchHelper against a mock Orchestrator whose
+# latency grows with the requests it is handling, once with every thread sending freely and once
+# through sp_limiter.AdaptiveLimiter, and reports calls/sec, p50/p99 latency (including time queued
+# in the limiter), the peak requests the Orchestrator handled at once and the limiter summary
+#
+# Usage: python benchmarks/bench_adaptive_limit.py [--calls N] [--threads N] [--latency S]
+#            [--latency-per-request S] [--max-rps N]
+#
+
+# Standard library imports
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Local application imports
+from mock_orchestrator import MockOrchestrator
+from sp_limiter import AdaptiveLimiter
+from sp_orchhelper import OrchHelper
+
+PRECONFIG = "applianceInfo:\n  hostname: bench\n"
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run(url, calls, threads, limiter):
+    orch = OrchHelper(url, "admin", "admin", pool_size=threads, limiter=limiter)
+    orch.login()
+    latencies = []
+
+    def validate(i):
+        start = time.perf_counter()
+        orch.validate_preconfig("bench-{0}".format(i), "SERIAL", PRECONFIG, False)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(validate, range(calls)))
+    elapsed = time.perf_counter() - start
+    orch.logout()
+    return calls / elapsed, percentile(latencies, 0.50), percentile(latencies, 0.99)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--latency-per-request", type=float, default=0.01)
+    parser.add_argument("--max-rps", type=float)
+    args = parser.parse_args()
+
+    print(
+        "{0:>10} {1:>10} {2:>10} {3:>10} {4:>10}  limiter".format("mode", "calls/sec", "p50 ms", "p99 ms", "peak orch")
+    )
+    for mode in ("fixed", "adaptive"):
+        limiter = None
+        if mode == "adaptive" or args.max_rps:
+            limiter = AdaptiveLimiter(max_limit=args.threads, adaptive=mode == "adaptive", max_rps=args.max_rps)
+        with MockOrchestrator(latency=args.latency, latency_per_request=args.latency_per_request) as mock:
+            rate, p50, p99 = run(mock.url, args.calls, args.threads, limiter)
+        print(
+            "{0:>10} {1:>10.1f} {2:>10.1f} {3:>10.1f} {4:>10}  {5}".format(
+                mode,
+                rate,
+                p50 * 1000,
+                p99 * 1000,
+                mock.peak_active_requests,
+                limiter.summary() if limiter is not None else "-",
+            )
+        )
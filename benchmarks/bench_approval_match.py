@@ -0,0 +1,109 @@
+#
+# bench_approval_match.py - indexed versus nested-loop matching for the auto-denied approval phase
+# Builds a synthetic inventory (default 50k preconfigs / 10k denied appliances / 10k hosts),
+# times the indexed matcher at full size, and times the original nested loop on a host sample
+# to extrapolate its full-size cost
+#
+# Usage: python benchmarks/bench_approval_match.py [--preconfigs N] [--denied N] [--hosts N] [--naive-hosts N]
+#
+
+# Standard library imports
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Local application imports
+from preconfig_approval import (
+    index_denied_appliances,
+    index_preconfigs,
+    match_denied_appliances,
+)
+
+
+def synthetic_inventory(preconfig_count, denied_count, host_count):
+    preconfigs = [
+        {"id": str(i), "name": "site-{0}".format(i)} for i in range(preconfig_count)
+    ]
+    # Every other denied appliance is reachable, spread across the preconfig names
+    denied_appliances = [
+        {
+            "id": "{0}.NE".format(i),
+            "applianceInfo": {
+                "site": "site-{0}".format(i * 5 % preconfig_count),
+                "reachabilityStatus": 1 if i % 2 == 0 else 2,
+            },
+        }
+        for i in range(denied_count)
+    ]
+    hostnames = ["site-{0}".format(i) for i in range(host_count)]
+    return hostnames, preconfigs, denied_appliances
+
+
+def naive_match(hostnames, preconfigs, denied_appliances):
+    # Original nested loop from silverpeak-preconfig-from-jinja.py
+    approve_dict = {}
+    for host in hostnames:
+        for preconfig in preconfigs:
+            for appliance in denied_appliances:
+                if (
+                    host == preconfig["name"] == appliance["applianceInfo"]["site"]
+                    and appliance["applianceInfo"]["reachabilityStatus"] == 1
+                ):
+                    approve_dict[host] = {
+                        "discovered_id": appliance["id"],
+                        "preconfig_id": preconfig["id"],
+                    }
+    return approve_dict
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--preconfigs", type=int, default=50000)
+    parser.add_argument("--denied", type=int, default=10000)
+    parser.add_argument("--hosts", type=int, default=10000)
+    parser.add_argument("--naive-hosts", help="host sample for the nested loop", type=int, default=1)
+    args = parser.parse_args()
+
+    hostnames, preconfigs, denied_appliances = synthetic_inventory(
+        args.preconfigs, args.denied, args.hosts
+    )
+
+    start = time.perf_counter()
+    match = match_denied_appliances(
+        hostnames,
+        index_preconfigs(preconfigs),
+        index_denied_appliances(denied_appliances),
+    )
+    indexed_elapsed = time.perf_counter() - start
+
+    sample = hostnames[: args.naive_hosts]
+    start = time.perf_counter()
+    naive = naive_match(sample, preconfigs, denied_appliances)
+    naive_sample_elapsed = time.perf_counter() - start
+    naive_elapsed = naive_sample_elapsed / len(sample) * len(hostnames)
+
+    # Indexed and nested-loop matches must agree on the sampled hosts
+    for host in sample:
+        assert naive.get(host) == match["approve"].get(host), host
+
+    print(
+        "preconfigs: {0}, denied: {1}, hosts: {2}".format(
+            args.preconfigs, args.denied, args.hosts
+        )
+    )
+    print(
+        "indexed:     {0:10.3f}s  approve {1}, unmatched {2}, duplicates {3}".format(
+            indexed_elapsed,
+            len(match["approve"]),
+            len(match["unmatched"]),
+            len(match["duplicates"]),
+        )
+    )
+    print(
+        "nested loop: {0:10.1f}s  (extrapolated from {1} hosts in {2:.3f}s)".format(
+            naive_elapsed, len(sample), naive_sample_elapsed
+        )
+    )
@@ -0,0 +1,75 @@
+#
+# bench_async_client.py - throughput of OrchHelper versus AsyncOrchHelper
+# Issues the same number of preconfig, approval and template group calls with each client
+# against a local mock Orchestrator with simulated latency and reports calls/sec
+#
+# Usage: python benchmarks/bench_async_client.py [--calls N] [--latency SECONDS] [--limit N]
+#
+
+# Standard library imports
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Local application imports
+from mock_orchestrator import MockOrchestrator
+from sp_orchhelper import OrchHelper
+from sp_orchhelper_async import AsyncOrchHelper
+
+
+def run_sync(url, calls):
+    orch = OrchHelper(url, "admin", "admin")
+    orch.login()
+    start = time.perf_counter()
+    for i in range(calls):
+        if i % 3 == 0:
+            orch.get_all_preconfig()
+        elif i % 3 == 1:
+            orch.approve_and_apply_preconfig(str(i), str(i))
+        else:
+            orch.get_all_template_groups()
+    elapsed = time.perf_counter() - start
+    orch.logout()
+    return elapsed
+
+
+async def run_async(url, calls, limit):
+    async with AsyncOrchHelper(url, "admin", "admin", limit=limit) as orch:
+        await orch.login()
+        start = time.perf_counter()
+        tasks = []
+        for i in range(calls):
+            if i % 3 == 0:
+                tasks.append(orch.get_all_preconfig())
+            elif i % 3 == 1:
+                tasks.append(orch.approve_and_apply_preconfig(str(i), str(i)))
+            else:
+                tasks.append(orch.get_all_template_groups())
+        results = await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        failed = len([result for result in results if result is False])
+        if failed:
+            print("{0} async calls failed".format(failed))
+        await orch.logout()
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", help="number of calls per client", type=int, default=300)
+    parser.add_argument("--latency", help="simulated Orchestrator latency (seconds)", type=float, default=0.02)
+    parser.add_argument("--limit", help="async client connection limit", type=int, default=100)
+    args = parser.parse_args()
+
+    with MockOrchestrator(latency=args.latency) as mock:
+        sync_elapsed = run_sync(mock.url, args.calls)
+        async_elapsed = asyncio.run(run_async(mock.url, args.calls, args.limit))
+
+    print("calls: {0}, latency: {1}s".format(args.calls, args.latency))
+    print("sync  OrchHelper:      {0:8.3f}s {1:10.1f} calls/sec".format(sync_elapsed, args.calls / sync_elapsed))
+    print("async AsyncOrchHelper: {0:8.3f}s {1:10.1f} calls/sec".format(async_elapsed, args.calls / async_elapsed))
+    print("speedup: {0:.1f}x".format(sync_elapsed / async_elapsed))
@@ -0,0 +1,83 @@
+#
+# bench_columnar_input.py - csv.DictReader versus columnar (pyarrow) inventory ingest
+# Writes a synthetic inventory as CSV and Parquet, optionally with extra warehouse columns the
+# template never reads, then reads every row as the main script does before rendering:
+# csv.DictReader with comma_separate list splitting per row, and preconfig_columnar.ColumnarRows
+# over the same CSV and over the Parquet file, which normalise a batch of rows per column and
+# read only the template's columns. Reports rows/sec and total seconds for each reader
+# Needs pyarrow
+#
+# Usage: python benchmarks/bench_columnar_input.py [--rows N] [--extra-columns N] [--directory DIR]
+#
+
+# Standard library imports
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Third party imports
+import pyarrow
+import pyarrow.csv
+import pyarrow.parquet
+
+# Local application imports
+from generate_csv import get_preconfig_vars
+from preconfig_inputs import open_input_rows, split_list_columns
+from synthetic_inventory import DEFAULT_TEMPLATE, write_inventory
+
+
+def read_rows(filename, input_format, columns):
+    start = time.perf_counter()
+    rows = 0
+    for row_number, row in open_input_rows(filename, input_format, columns=columns):
+        # List columns are split per row for CSV, already split by the columnar readers
+        split_list_columns(row)
+        rows = rows + 1
+    return rows, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--extra-columns", type=int, default=0)
+    parser.add_argument("--directory", help="directory for the generated inventories")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(dir=args.directory)
+    try:
+        csv_filename = os.path.join(directory, "inventory.csv")
+        parquet_filename = os.path.join(directory, "inventory.parquet")
+        write_inventory(csv_filename, args.rows)
+        # All text, as exported from the warehouse
+        columns = pyarrow.csv.read_csv(csv_filename).column_names
+        table = pyarrow.csv.read_csv(
+            csv_filename,
+            convert_options=pyarrow.csv.ConvertOptions(
+                column_types=dict((name, pyarrow.string()) for name in columns)
+            ),
+        )
+        for extra in range(args.extra_columns):
+            table = table.append_column(
+                "warehouse_{0}".format(extra),
+                pyarrow.array(["warehouse-{0}".format(i) for i in range(args.rows)]),
+            )
+        pyarrow.parquet.write_table(table, parquet_filename)
+        pyarrow.csv.write_csv(table, csv_filename)
+        # Columns the main script reads, as it passes them to open_input_rows
+        template_columns = set(get_preconfig_vars(DEFAULT_TEMPLATE)) | set(("hostname", "serial_number"))
+
+        print("{0:>14} {1:>10} {2:>10} {3:>12}".format("reader", "rows", "total s", "rows/sec"))
+        for name, filename, input_format in (
+            ("csv", csv_filename, "csv"),
+            ("columnar-csv", csv_filename, "columnar-csv"),
+            ("parquet", parquet_filename, "parquet"),
+        ):
+            rows, elapsed = read_rows(filename, input_format, template_columns)
+            print("{0:>14} {1:>10} {2:>10.2f} {3:>12.0f}".format(name, rows, elapsed, rows / elapsed))
+    finally:
+        shutil.rmtree(directory)
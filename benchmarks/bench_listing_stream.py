@@ -0,0 +1,88 @@
+#
+# bench_listing_stream.py - buffered versus streamed retrieval of a large preconfig listing
+# Seeds the mock Orchestrator with preconfigs carrying their YAML, then indexes the full listing
+# (filter=None, as --sync fetches it) once from get_all_preconfig().json() and once from
+# iter_all_preconfig(), reporting time to the first entry, total time and tracemalloc peak memory
+# The mock runs in its own process so its memory is not counted
+#
+# Usage: python benchmarks/bench_listing_stream.py [--preconfigs N] [--config-bytes N]
+#
+
+# Standard library imports
+import argparse
+import base64
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Local application imports
+from mock_orchestrator import MockOrchestrator
+from preconfig_approval import index_preconfigs
+from sp_orchhelper import OrchHelper
+
+
+def serve(preconfigs, urls, stop):
+    with MockOrchestrator(preconfigs=preconfigs) as mock:
+        urls.put(mock.url)
+        stop.wait()
+
+
+def listing(orch, streamed):
+    if streamed:
+        return orch.iter_all_preconfig(filter=None)
+    return orch.get_all_preconfig(filter=None).json()
+
+
+def run(url, streamed):
+    orch = OrchHelper(url, "admin", "admin")
+    orch.login()
+    first_entry = []
+
+    def timed(entries):
+        for entry in entries:
+            if not first_entry:
+                first_entry.append(time.perf_counter() - start)
+            yield entry
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = index_preconfigs(timed(listing(orch, streamed)))
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    orch.logout()
+    return len(index), first_entry[0] if first_entry else 0.0, elapsed, peak, current
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--preconfigs", type=int, default=20000)
+    parser.add_argument("--config-bytes", type=int, default=3000)
+    args = parser.parse_args()
+
+    config_data = base64.b64encode(b"x" * args.config_bytes).decode("ascii")
+    preconfigs = [
+        {"id": i, "name": "site-{0:07d}".format(i), "serialNum": "", "configData": config_data}
+        for i in range(args.preconfigs)
+    ]
+
+    print("{0:>10} {1:>10} {2:>12} {3:>10} {4:>12} {5:>12}".format(
+        "mode", "entries", "first ms", "total s", "peak MiB", "index MiB"
+    ))
+    urls = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(preconfigs, urls, stop), daemon=True)
+    server.start()
+    url = urls.get()
+    del preconfigs
+    for mode in ("buffered", "streamed"):
+        entries, first, elapsed, peak, current = run(url, mode == "streamed")
+        print("{0:>10} {1:>10} {2:>12.1f} {3:>10.2f} {4:>12.1f} {5:>12.1f}".format(
+            mode, entries, first * 1000, elapsed, peak / 1048576.0, current / 1048576.0
+        ))
+    stop.set()
+    server.join()
@@ -0,0 +1,73 @@
+#
+# bench_output_writer.py - per-row preconfig file writes versus the batched output writers
+# Writes N synthetic preconfigs into a fresh directory with one open/write/close per file (the
+# previous behaviour), then with preconfig_writer.DirectoryWriter, then again with the
+# DirectoryWriter over the same unchanged files, and finally into a tar.gz ArchiveWriter. Reports
+# the time spent handing files to each writer, the total time including the final flush, and the
+# files written and left unchanged
+#
+# Usage: python benchmarks/bench_output_writer.py [--files N] [--bytes N] [--directory DIR]
+#
+
+# Standard library imports
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Local application imports
+from preconfig_writer import ArchiveWriter, DirectoryWriter
+
+
+def preconfigs(files, size):
+    body = "# " + "x" * (size - 3) + "\n"
+    for i in range(files):
+        yield "site-{0:07d}_preconfig.yml".format(i), "applianceInfo:\n  hostname: site-{0:07d}\n{1}".format(i, body)
+
+
+def per_row(directory, files, size):
+    start = time.perf_counter()
+    for filename, text in preconfigs(files, size):
+        with open(os.path.join(directory, filename), "w") as preconfig_file:
+            preconfig_file.write(text)
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, {"written": files, "unchanged": 0}
+
+
+def batched(writer, files, size):
+    start = time.perf_counter()
+    for filename, text in preconfigs(files, size):
+        writer.write(filename, text)
+    queued = time.perf_counter() - start
+    writer.close()
+    return queued, time.perf_counter() - start, writer.summary()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--bytes", type=int, default=6000)
+    parser.add_argument("--directory", help="parent directory, e.g. on a network filesystem")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(dir=args.directory)
+    try:
+        runs = (
+            ("per-row", "per_row", lambda: per_row(os.path.join(root, "per_row"), args.files, args.bytes)),
+            ("directory", "batched", lambda: batched(DirectoryWriter(os.path.join(root, "batched")), args.files, args.bytes)),
+            ("unchanged", "batched", lambda: batched(DirectoryWriter(os.path.join(root, "batched")), args.files, args.bytes)),
+            ("archive", "archive", lambda: batched(ArchiveWriter(os.path.join(root, "archive", "run.tar.gz")), args.files, args.bytes)),
+        )
+        print("{0:>10} {1:>10} {2:>10} {3:>10} {4:>10}".format("mode", "queued s", "total s", "written", "unchanged"))
+        for mode, directory, run in runs:
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+            queued, total, summary = run()
+            print("{0:>10} {1:>10.3f} {2:>10.3f} {3:>10} {4:>10}".format(
+                mode, queued, total, summary["written"], summary["unchanged"]
+            ))
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,224 @@
+#
+# bench_pipeline.py - end-to-end preconfig pipeline benchmark against a mock Orchestrator
+# For each scenario size a synthetic inventory is generated, then rendered, validated and
+# uploaded through PreconfigPipeline and OrchHelper against benchmarks/mock_orchestrator.py.
+# Each scenario runs in its own process so peak RSS is measured per scenario.
+#
+# Reports rows/sec, p50/p99 per-row latency (render start to the row's last Orchestrator call)
+# and peak RSS.
+# Results are written as JSON (--output) tagged with the current git commit; pass a previous
+# results file as --baseline to flag regressions beyond --threshold percent (exit status 1).
+#
+# Usage: python benchmarks/bench_pipeline.py [--sizes 100 10000 100000] [--workers N]
+#            [--latency S] [--jitter S] [--error-rate F] [--output FILE] [--baseline FILE]
+#
+
+# Standard library imports
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPO_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, "..")
+sys.path.insert(0, REPO_DIRECTORY)
+
+# Metrics compared against a baseline and whether higher values are better
+COMPARED_METRICS = {
+    "rows_per_sec": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "peak_rss_kb": False,
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def run_scenario(url, rows, workers, streaming):
+    # Child process: generate the inventory, run the pipeline and print a JSON result line
+    from preconfig_inputs import read_csv_rows, split_list_columns
+    from preconfig_pipeline import PreconfigPipeline
+    from preconfig_templates import load_environment
+    from sp_orchhelper import OrchHelper
+    from synthetic_inventory import write_inventory
+
+    directory = tempfile.mkdtemp(prefix="pipeline_bench_")
+    inventory = os.path.join(directory, "inventory.csv.gz")
+    write_inventory(inventory, rows)
+
+    template = load_environment(os.path.join(REPO_DIRECTORY, "templates"), cache_directory=None).get_template(
+        "ec_preconfig_template.jinja2"
+    )
+    orch = OrchHelper(url, "admin", "admin")
+    orch.login()
+
+    starts = {}
+    latencies = []
+
+    def render(result, row):
+        starts[result["index"]] = time.perf_counter()
+        return template.render(data=split_list_columns(row))
+
+    def validate(result, row, preconfig):
+        response = orch.validate_preconfig(row["hostname"], row["serial_number"], preconfig, False)
+        result["finished_at"] = time.perf_counter()
+        if response.status_code != 200:
+            return False
+        with open(os.path.join(directory, "{}_preconfig.yml".format(row["hostname"])), "w") as preconfig_file:
+            preconfig_file.write(preconfig)
+        return True
+
+    def upload(result, row, preconfig):
+        created = orch.create_preconfig(row["hostname"], row["serial_number"], preconfig, False)
+        result["finished_at"] = time.perf_counter()
+        if created is False:
+            raise RuntimeError("create failed")
+
+    def report(result):
+        # Buffered runs report at the end, so latency is measured to the row's last stage
+        finished = result.get("finished_at", time.perf_counter())
+        latencies.append(finished - starts.pop(result["index"]))
+
+    start = time.perf_counter()
+    pipeline = PreconfigPipeline(render, validate, upload, workers=workers, report=report, streaming=streaming)
+    for row_number, row in enumerate(read_csv_rows(inventory), 1):
+        pipeline.submit(row_number, row)
+    pipeline.close()
+    elapsed = time.perf_counter() - start
+    orch.logout()
+
+    for filename in os.listdir(directory):
+        os.remove(os.path.join(directory, filename))
+    os.rmdir(directory)
+
+    summary = pipeline.summary()
+    return {
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "statuses": summary,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIRECTORY, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline, threshold):
+    # Returns list of regression descriptions
+    regressions = []
+    previous = dict((str(scenario["rows"]), scenario) for scenario in baseline["scenarios"])
+    for scenario in results["scenarios"]:
+        before = previous.get(str(scenario["rows"]))
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old = before[metric]
+            new = scenario[metric]
+            if not old:
+                continue
+            change = (new - old) * 100.0 / old
+            regressed = change < -threshold if higher_is_better else change > threshold
+            print(
+                "{0:>8} rows {1:>13}: {2:>12} -> {3:>12} ({4:+.1f}%){5}".format(
+                    scenario["rows"], metric, old, new, change, "  REGRESSION" if regressed else ""
+                )
+            )
+            if regressed:
+                regressions.append("{0} rows {1} {2:+.1f}%".format(scenario["rows"], metric, change))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--stream", action="store_true", help="run the pipeline in streaming mode")
+    parser.add_argument("--latency", type=float, default=0.002, help="mock Orchestrator latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="additional random latency (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 500")
+    parser.add_argument("--output", type=str, help="write results JSON to this file")
+    parser.add_argument("--baseline", type=str, help="results JSON from a previous commit to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    parser.add_argument("--run-scenario", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        # Internal: url,rows for a single scenario in a child process
+        url, rows = args.run_scenario.rsplit(",", 1)
+        print(json.dumps(run_scenario(url, int(rows), args.workers, args.stream)))
+        sys.exit(0)
+
+    from mock_orchestrator import MockOrchestrator
+
+    results = {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {
+            "workers": args.workers,
+            "stream": args.stream,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+        },
+        "scenarios": [],
+    }
+
+    print("{0:>8} {1:>10} {2:>10} {3:>10} {4:>12}  statuses".format("rows", "rows/sec", "p50 ms", "p99 ms", "peak RSS KB"))
+    for rows in args.sizes:
+        with MockOrchestrator(latency=args.latency, latency_jitter=args.jitter, error_rate=args.error_rate, seed=rows) as mock:
+            command = [
+                sys.executable,
+                os.path.abspath(__file__),
+                "--run-scenario",
+                "{0},{1}".format(mock.url, rows),
+                "--workers",
+                str(args.workers),
+            ]
+            if args.stream:
+                command.append("--stream")
+            output = subprocess.check_output(command, cwd=REPO_DIRECTORY)
+        scenario = json.loads(output.decode().strip().splitlines()[-1])
+        results["scenarios"].append(scenario)
+        print(
+            "{0:>8} {1:>10} {2:>10} {3:>10} {4:>12}  {5}".format(
+                scenario["rows"],
+                scenario["rows_per_sec"],
+                scenario["p50_ms"],
+                scenario["p99_ms"],
+                scenario["peak_rss_kb"],
+                scenario["statuses"],
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        print("Comparing against {0} ({1})".format(args.baseline, baseline.get("commit")))
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Regressions: {0}".format(", ".join(regressions)))
+            sys.exit(1)
@@ -0,0 +1,147 @@
+#
+# bench_streaming_memory.py - peak memory of streaming versus buffered runs
+# Writes gzip'd synthetic inventories of increasing size, then reads and renders each through
+# PreconfigPipeline with a stand-in validate stage under tracemalloc. Then runs the main script
+# end to end (--offline --stream: input reading, column checks, rendering, the output writer,
+# journal and metrics) on synthetic inventories under tracemalloc in a child process, measuring the
+# memory still held once every row is done. Streaming mode must keep both flat as the row count
+# grows; the script exits non-zero if it does not.
+#
+# Usage: python benchmarks/bench_streaming_memory.py [--rows N N ...] [--main-rows N N ...] [--workers N]
+#        [--tolerance BYTES] [--local-validation]
+#
+
+# Standard library imports
+import argparse
+import csv
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Local application imports
+from preconfig_inputs import read_csv_rows
+from preconfig_pipeline import PreconfigPipeline
+from preconfig_templates import load_environment
+from synthetic_inventory import write_inventory as write_synthetic_inventory
+
+PACKAGE_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TEMPLATE_DIRECTORY = os.path.join(PACKAGE_DIRECTORY, "templates")
+MAIN_SCRIPT = os.path.join(PACKAGE_DIRECTORY, "silverpeak-preconfig-from-jinja.py")
+
+# Runs the main script under tracemalloc and prints the memory it holds once every row is done
+MAIN_RUNNER = """
+import runpy, sys, tracemalloc
+sys.path.insert(0, sys.argv[1])
+script = sys.argv[2]
+sys.argv = [script] + sys.argv[3:]
+tracemalloc.start()
+try:
+    runpy.run_path(script, run_name="__main__")
+except SystemExit:
+    pass
+# Memory still held at the end of the run, after import time allocations have peaked
+print("HELD", tracemalloc.get_traced_memory()[0])
+"""
+
+
+def write_inventory(filename, rows):
+    with gzip.open(filename, "wt", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["hostname", "serial_number", "site", "templateGroups", "businessIntentOverlays"])
+        for i in range(rows):
+            writer.writerow(["site-{0:07d}".format(i), "SN{0}".format(i), "site-{0}".format(i), "Default,Lab", "Voice,Data"])
+
+
+def peak_memory(filename, streaming, workers, output_directory):
+    template = load_environment(TEMPLATE_DIRECTORY, cache_directory=None).get_template(
+        "ec_preconfig_template.jinja2"
+    )
+
+    def render(result, row):
+        row["templateGroups"] = row["templateGroups"].split(",")
+        row["businessIntentOverlays"] = row["businessIntentOverlays"].split(",")
+        return template.render(data=row)
+
+    def validate(result, row, preconfig):
+        # Stand-in for the Orchestrator validation, output is written as it is produced
+        with open(os.path.join(output_directory, "current_preconfig.yml"), "w") as preconfig_file:
+            preconfig_file.write(preconfig)
+        return True
+
+    tracemalloc.start()
+    pipeline = PreconfigPipeline(render, validate, workers=workers, streaming=streaming)
+    for row_number, row in enumerate(read_csv_rows(filename), 1):
+        pipeline.submit(row_number, row)
+    pipeline.close()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main_held_memory(filename, workers, directory, local_validation):
+    # Each run starts with an empty outputs directory, as the first run for an inventory would
+    run_directory = tempfile.mkdtemp(dir=directory)
+    os.symlink(TEMPLATE_DIRECTORY, os.path.join(run_directory, "templates"))
+    command = [
+        sys.executable, "-c", MAIN_RUNNER, PACKAGE_DIRECTORY, MAIN_SCRIPT,
+        "--csv", filename, "--offline", "--stream", "--workers", str(workers), "--template-cache", "",
+    ]
+    if not local_validation:
+        command.append("--no-local-validation")
+    output = subprocess.run(command, cwd=run_directory, stdout=subprocess.PIPE, check=True).stdout
+    shutil.rmtree(run_directory)
+    return int(output.decode("utf-8").rsplit("HELD", 1)[1])
+
+
+def check_growth(label, rows, sizes, tolerance):
+    # Only the compact per-row log may grow: one hostname (string and list slot, roughly 70 bytes
+    # for these hostnames) and one status byte per row
+    growth = sizes[-1] - sizes[0]
+    row_growth = rows[-1] - rows[0]
+    allowed = tolerance + row_growth * 100
+    print("{0} growth: {1:.1f}KB (allowed {2:.1f}KB)".format(label, growth / 1024.0, allowed / 1024.0))
+    return growth <= allowed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--main-rows", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--tolerance", help="allowed streaming peak growth in bytes", type=int, default=2 * 1024 * 1024)
+    parser.add_argument("--local-validation", help="check rendered preconfigs locally in main script runs (slow)", action="store_true")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="streaming_bench_")
+    try:
+        streaming_peaks = []
+        print("{0:>10} {1:>16} {2:>16}".format("rows", "streaming peak", "buffered peak"))
+        for rows in args.rows:
+            filename = os.path.join(directory, "inventory_{0}.csv.gz".format(rows))
+            write_inventory(filename, rows)
+            streaming = peak_memory(filename, True, args.workers, directory)
+            buffered = peak_memory(filename, False, args.workers, directory)
+            streaming_peaks.append(streaming)
+            print("{0:>10} {1:>14.1f}KB {2:>14.1f}KB".format(rows, streaming / 1024.0, buffered / 1024.0))
+
+        main_held = []
+        print("{0:>10} {1:>16}".format("rows", "main script held"))
+        for rows in args.main_rows:
+            filename = os.path.join(directory, "synthetic_{0}.csv".format(rows))
+            write_synthetic_inventory(filename, rows)
+            main_held.append(main_held_memory(filename, args.workers, directory, args.local_validation))
+            print("{0:>10} {1:>14.1f}KB".format(rows, main_held[-1] / 1024.0))
+    finally:
+        shutil.rmtree(directory)
+
+    flat = check_growth("pipeline streaming peak", args.rows, streaming_peaks, args.tolerance)
+    flat = check_growth("main script held memory", args.main_rows, main_held, args.tolerance) and flat
+    if not flat:
+        print("FAIL: streaming peak memory grows with row count")
+        sys.exit(1)
@@ -0,0 +1,66 @@
+#
+# bench_template_cache.py - cold versus warm startup-to-first-render time
+# Each sample runs in a fresh interpreter: it builds the jinja environment, loads the preconfig
+# template and renders one row. Cold samples start from an empty bytecode cache, warm samples
+# reuse the cache written by the previous run. An uncached baseline is also reported.
+#
+# Usage: python benchmarks/bench_template_cache.py [--samples N] [--template NAME]
+#
+
+# Standard library imports
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+REPO_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Child process: time from before jinja import to the first rendered preconfig
+CHILD = """
+import sys, time
+start = time.perf_counter()
+from preconfig_templates import load_environment
+env = load_environment(cache_directory=sys.argv[2])
+template = env.get_template(sys.argv[1])
+template.render(data={"hostname": "bench-site", "templateGroups": ["a"], "businessIntentOverlays": ["b"]})
+print(time.perf_counter() - start)
+"""
+
+
+def first_render_time(template, cache_directory):
+    output = subprocess.check_output(
+        [sys.executable, "-c", CHILD, template, cache_directory], cwd=REPO_DIRECTORY
+    )
+    return float(output)
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--template", type=str, default="ec_preconfig_template.jinja2")
+    args = parser.parse_args()
+
+    uncached = []
+    cold = []
+    warm = []
+    for sample in range(args.samples):
+        uncached.append(first_render_time(args.template, ""))
+
+        cache_directory = tempfile.mkdtemp(prefix="template_cache_")
+        try:
+            cold.append(first_render_time(args.template, cache_directory))
+            warm.append(first_render_time(args.template, cache_directory))
+        finally:
+            shutil.rmtree(cache_directory)
+
+    print("startup-to-first-render, median of {0} samples".format(args.samples))
+    print("no cache:   {0:8.1f} ms".format(median(uncached) * 1000))
+    print("cold cache: {0:8.1f} ms".format(median(cold) * 1000))
+    print("warm cache: {0:8.1f} ms".format(median(warm) * 1000))
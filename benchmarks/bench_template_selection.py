@@ -0,0 +1,88 @@
+#
+# bench_template_selection.py - per-row versus grouped template lookup with several templates
+# Copies the preconfig template N times into a temporary template directory and renders a
+# synthetic inventory whose rows cycle through the copies, with fewer templates kept loaded than
+# the inventory uses. Rows are rendered in CSV order, looking up each row's template (evicted
+# templates are reloaded and recompiled when they come round again), then grouped per template a
+# window of rows at a time as the main script does. Reports total seconds and template loads
+#
+# Usage: python benchmarks/bench_template_selection.py [--rows N] [--templates N] [--max-templates N] [--window N]
+#
+
+# Standard library imports
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Local application imports
+from generate_csv import get_preconfig_vars
+from preconfig_inputs import split_list_columns
+from preconfig_templates import TemplateCache, TemplateSelector, group_rows, load_environment
+from synthetic_inventory import DEFAULT_TEMPLATE, column_value
+
+
+def inventory(rows, templates):
+    columns = get_preconfig_vars(DEFAULT_TEMPLATE) + ["serial_number"]
+    for row_number in range(1, rows + 1):
+        row = dict((column, column_value(column, row_number)) for column in columns)
+        row["template"] = "site_{0}.jinja2".format(row_number % templates)
+        yield row_number, row
+
+
+def render(entry, row):
+    return entry["template"].render(data=split_list_columns(dict(row), entry["list_columns"]))
+
+
+def per_row(directory, rows, max_templates):
+    templates = TemplateCache(load_environment(directory, None), max_templates, directory)
+    start = time.perf_counter()
+    for row_number, row in rows:
+        render(templates.get(row["template"]), row)
+    return time.perf_counter() - start, templates.summary()
+
+
+def grouped(directory, rows, max_templates, window):
+    templates = TemplateCache(load_environment(directory, None), max_templates, directory)
+    selector = TemplateSelector("site_0.jinja2", "template")
+    start = time.perf_counter()
+    for template_name, group in group_rows(rows, selector, window):
+        entry = templates.get(template_name)
+        for row_number, row in group:
+            render(entry, row)
+    return time.perf_counter() - start, templates.summary()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--templates", type=int, default=8)
+    parser.add_argument("--max-templates", type=int, default=4)
+    parser.add_argument("--window", type=int, default=1000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        with open(DEFAULT_TEMPLATE) as template_file:
+            source = template_file.read()
+        for i in range(args.templates):
+            with open(os.path.join(directory, "site_{0}.jinja2".format(i)), "w") as template_file:
+                template_file.write("# site template {0}\n{1}".format(i, source))
+
+        # Rows built up front so only lookup and rendering are timed
+        rows = list(inventory(args.rows, args.templates))
+        print("{0:>10} {1:>10} {2:>10} {3:>10} {4:>10}".format("mode", "rows", "total s", "loaded", "evicted"))
+        for mode, run in (
+            ("per-row", lambda: per_row(directory, rows, args.max_templates)),
+            ("grouped", lambda: grouped(directory, iter(rows), args.max_templates, args.window)),
+        ):
+            elapsed, summary = run()
+            print("{0:>10} {1:>10} {2:>10.2f} {3:>10} {4:>10}".format(
+                mode, args.rows, elapsed, summary["loaded"], summary["evictions"]
+            ))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,86 @@
+#
+# bench_watch_poll.py - per-poll cost of watch mode versus rerunning auto-denied approval
+# Seeds the mock Orchestrator with N preconfigs and a large denied list of appliances that match
+# no CSV host, then adds a few new appliances for CSV hosts before every poll. Each poll is run
+# as a full auto-denied pass (list denied appliances and preconfigs, index both, match every host)
+# and as a preconfig_watch.ApprovalWatcher poll (list denied appliances, match the delta against
+# a preconfig index fetched once). Reports milliseconds per poll, requests per poll and approvals
+#
+# Usage: python benchmarks/bench_watch_poll.py [--preconfigs N] [--denied N] [--hosts N] [--polls N] [--new N]
+#
+
+# Standard library imports
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Local application imports
+from mock_orchestrator import MockOrchestrator
+from preconfig_approval import index_denied_appliances, index_preconfigs, match_denied_appliances
+from preconfig_watch import ApprovalWatcher
+from sp_orchhelper import OrchHelper
+
+
+def appliance(i, site):
+    return {"id": "{0}.NE".format(i), "applianceInfo": {"site": site, "reachabilityStatus": 1}}
+
+
+def full_poll(orch, hostnames):
+    # One auto-denied pass as at the end of a run
+    denied_index = index_denied_appliances(orch.iter_all_denied_appliances())
+    preconfig_index = index_preconfigs(orch.iter_all_preconfig())
+    match = match_denied_appliances(hostnames, preconfig_index, denied_index)
+    for host, approval in match["approve"].items():
+        orch.approve_and_apply_preconfig(approval["preconfig_id"], approval["discovered_id"])
+    return len(match["approve"])
+
+
+def run(mode, args):
+    preconfigs = [{"id": str(i), "name": "site-{0}".format(i)} for i in range(args.preconfigs)]
+    # Appliances at sites outside the CSV, never approved
+    denied = [appliance("old-{0}".format(i), "other-{0}".format(i)) for i in range(args.denied)]
+    hostnames = ["site-{0}".format(i) for i in range(args.hosts)]
+    with MockOrchestrator(preconfigs=preconfigs, denied_appliances=denied) as mock:
+        orch = OrchHelper(mock.url, "admin", "admin")
+        orch.login()
+        watcher = ApprovalWatcher(
+            hostnames, [orch.iter_all_denied_appliances], orch.iter_all_preconfig, orch.approve_and_apply_preconfig
+        )
+        if mode == "watch":
+            # First poll takes the snapshot
+            watcher.poll()
+        requests = sum(mock.request_counts.values())
+        approved = 0
+        elapsed = 0.0
+        for poll in range(args.polls):
+            with mock.lock:
+                for i in range(args.new):
+                    host = (poll * args.new + i) % args.hosts
+                    mock.denied_appliances.append(appliance("new-{0}-{1}".format(poll, i), "site-{0}".format(host)))
+            start = time.perf_counter()
+            if mode == "watch":
+                approved = approved + len(watcher.poll())
+            else:
+                approved = approved + full_poll(orch, hostnames)
+            elapsed = elapsed + time.perf_counter() - start
+        requests = sum(mock.request_counts.values()) - requests
+        orch.logout()
+    return elapsed / args.polls, float(requests) / args.polls, approved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--preconfigs", type=int, default=20000)
+    parser.add_argument("--denied", type=int, default=5000)
+    parser.add_argument("--hosts", type=int, default=20000)
+    parser.add_argument("--polls", type=int, default=10)
+    parser.add_argument("--new", type=int, default=5)
+    args = parser.parse_args()
+
+    print("{0:>8} {1:>12} {2:>14} {3:>10}".format("mode", "ms/poll", "requests/poll", "approved"))
+    for mode in ("full", "watch"):
+        per_poll, requests, approved = run(mode, args)
+        print("{0:>8} {1:>12.1f} {2:>14.1f} {3:>10}".format(mode, per_poll * 1000, requests, approved))
@@ -0,0 +1,299 @@
+#
+# mock_orchestrator.py - local stand-in for the Orchestrator REST API
+# Serves the endpoints used by sp_orchhelper and the preconfig scripts over plain http on
+# localhost so they can be exercised and benchmarked without a live Orchestrator:
+#   login/logout, appliance, denied and discovered appliance listings, template groups, overlays,
+#   broadcast cli, preconfiguration validate/create/modify/list/get/delete and apply to discovered
+#   appliances, which takes them off the denied and discovered lists
+# Login sets a session cookie and a CSRF token cookie, later requests need the session cookie and
+# state changing requests the X-XSRF-TOKEN header, as on Orchestrator
+# Latency (with optional jitter) and an error rate can be configured to mimic a loaded Orchestrator
+#
+
+# Standard library imports
+import base64
+import json
+import random
+import threading
+import time
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Third party imports
+import yaml
+
+# libyaml loader when available, the pure Python loader would dominate mock response times
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+REST_PREFIX = "/gms/rest"
+PRECONFIG_PATH = "/gms/appliance/preconfiguration"
+
+
+class MockOrchestratorHandler(BaseHTTPRequestHandler):
+    # Keep-alive so clients can reuse pooled connections
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, avoid Nagle/delayed-ACK stalls between them
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        # Silence per-request logging to stderr
+        pass
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def handle_request(self, method):
+        orch = self.server.orch
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        parsed = urlparse(self.path)
+        path = parsed.path
+        if path.startswith(REST_PREFIX):
+            path = path[len(REST_PREFIX):]
+        query = parse_qs(parsed.query)
+
+        orch.count_request(method, path)
+        with orch.lock:
+            orch.active_requests = orch.active_requests + 1
+            orch.peak_active_requests = max(orch.peak_active_requests, orch.active_requests)
+        try:
+            orch.delay()
+        finally:
+            with orch.lock:
+                orch.active_requests = orch.active_requests - 1
+
+        if orch.inject_error(path):
+            status, payload, cookies = orch.error_status, {"error": "injected failure"}, {}
+        else:
+            status, payload, cookies = orch.route(method, path, query, body, self.headers)
+        data = json.dumps(payload).encode() if payload is not None else b""
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in cookies.items():
+            self.send_header("Set-Cookie", "{0}={1}; Path=/".format(name, value))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MockOrchestrator:
+    # latency is added to every request in seconds, plus up to latency_jitter at random and
+    # latency_per_request for every other request being handled (an Orchestrator slowing under load)
+    # error_rate is the fraction of non-authentication requests answered with error_status
+    # preconfigs, denied_appliances, discovered_appliances, template_groups and overlays seed the
+    # in-memory inventory, appliances can be added to the denied and discovered lists while running
+    def __init__(
+        self,
+        latency=0.0,
+        latency_jitter=0.0,
+        latency_per_request=0.0,
+        error_rate=0.0,
+        error_status=500,
+        preconfigs=None,
+        denied_appliances=None,
+        discovered_appliances=None,
+        template_groups=None,
+        overlays=None,
+        seed=None,
+    ):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.latency_per_request = latency_per_request
+        self.active_requests = 0
+        self.peak_active_requests = 0
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.preconfigs = {}
+        for preconfig in preconfigs or []:
+            self.preconfigs[str(preconfig["id"])] = dict(preconfig)
+        self.next_preconfig_id = len(self.preconfigs) + 1
+        self.denied_appliances = list(denied_appliances or [])
+        self.discovered_appliances = list(discovered_appliances or [])
+        self.template_groups = list(template_groups or [])
+        self.overlays = list(overlays or [])
+        self.csrf_token = "mock-csrf-token"
+        self.session_id = "mock-session"
+        self.request_counts = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        # Address to pass as the Orchestrator url to OrchHelper / AsyncOrchHelper
+        host, port = self.server.server_address[:2]
+        return "http://{0}:{1}".format(host, port)
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), MockOrchestratorHandler)
+        self.server.daemon_threads = True
+        self.server.request_queue_size = 1024
+        self.server.orch = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def count_request(self, method, path):
+        with self.lock:
+            key = "{0} {1}".format(method, path)
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+    def delay(self):
+        with self.lock:
+            delay = (
+                self.latency
+                + self.random.random() * self.latency_jitter
+                + (self.active_requests - 1) * self.latency_per_request
+            )
+        if delay:
+            time.sleep(delay)
+
+    def inject_error(self, path):
+        if not self.error_rate or path.startswith("/authentication/"):
+            return False
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def route(self, method, path, query, body, headers):
+        # Returns (status, json payload, cookies to set)
+        if path == "/authentication/login" and method == "POST":
+            return 200, None, {"JSESSIONID": self.session_id, "orchCsrfToken": self.csrf_token}
+        if path == "/authentication/logout":
+            return 200, None, {}
+
+        # Everything past login requires the session cookie set by login
+        session = SimpleCookie(headers.get("Cookie", "")).get("JSESSIONID")
+        if session is None or session.value != self.session_id:
+            return 401, {"error": "not logged in"}, {}
+
+        # Everything past login requires the CSRF token on state changing requests
+        if method != "GET" and headers.get("X-XSRF-TOKEN") != self.csrf_token:
+            return 403, {"error": "missing csrf token"}, {}
+
+        if path == "/appliance" and method == "GET":
+            return 200, [], {}
+        if path == "/appliance/denied" and method == "GET":
+            with self.lock:
+                return 200, list(self.denied_appliances), {}
+        if path == "/appliance/discovered" and method == "GET":
+            with self.lock:
+                return 200, list(self.discovered_appliances), {}
+        if path == "/template/templateGroups" and method == "GET":
+            return 200, self.template_groups, {}
+        if path.startswith("/template/templateGroups/") and method == "GET":
+            name = path[len("/template/templateGroups/"):]
+            for group in self.template_groups:
+                if group.get("name") == name:
+                    return 200, group, {}
+            return 404, None, {}
+        if path == "/gms/overlays/config" and method == "GET":
+            return 200, self.overlays, {}
+        if path.startswith("/template/") and method == "POST":
+            return 200, None, {}
+        if path == "/broadcastCli" and method == "POST":
+            return 200, None, {}
+        if path.startswith(PRECONFIG_PATH):
+            return self.route_preconfig(method, path[len(PRECONFIG_PATH):], query, body)
+        return 404, {"error": "not found"}, {}
+
+    def route_preconfig(self, method, path, query, body):
+        if path == "" and method == "GET":
+            with self.lock:
+                preconfigs = list(self.preconfigs.values())
+            if query.get("filter") == ["metadata"]:
+                preconfigs = [
+                    dict((key, value) for key, value in preconfig.items() if key != "configData")
+                    for preconfig in preconfigs
+                ]
+            return 200, preconfigs, {}
+        if path == "/validate" and method == "POST":
+            return self.validate(body)
+        if path.count("/") == 1 and method == "GET":
+            with self.lock:
+                preconfig = self.preconfigs.get(path[1:])
+            if preconfig is None:
+                return 404, {"error": "no such preconfig"}, {}
+            return 200, preconfig, {}
+        if path == "" and method == "POST":
+            status, payload, cookies = self.validate(body)
+            if status != 200:
+                return status, payload, cookies
+            with self.lock:
+                preconfig_id = str(self.next_preconfig_id)
+                self.next_preconfig_id = self.next_preconfig_id + 1
+                self.preconfigs[preconfig_id] = dict(json.loads(body), id=preconfig_id)
+            return 200, {"id": preconfig_id}, {}
+        if "/apply/discovered/" in path and method == "POST":
+            # The approved appliance leaves the denied and discovered lists
+            discovered_id = path.rsplit("/", 1)[1]
+            with self.lock:
+                self.denied_appliances = [a for a in self.denied_appliances if a["id"] != discovered_id]
+                self.discovered_appliances = [
+                    a for a in self.discovered_appliances if a["id"] != discovered_id
+                ]
+            return 200, None, {}
+        if "/apply/" in path and method == "POST":
+            return 200, None, {}
+
+        preconfig_id = path.strip("/")
+        with self.lock:
+            exists = preconfig_id in self.preconfigs
+        if not exists:
+            return 404, None, {}
+        if method == "POST":
+            with self.lock:
+                self.preconfigs[preconfig_id] = dict(json.loads(body), id=preconfig_id)
+            return 200, None, {}
+        if method == "DELETE":
+            with self.lock:
+                del self.preconfigs[preconfig_id]
+            return 200, None, {}
+        if method == "GET":
+            with self.lock:
+                return 200, self.preconfigs[preconfig_id], {}
+        return 404, None, {}
+
+    def validate(self, body):
+        # Accepts any preconfig whose configData decodes to a YAML mapping
+        try:
+            preconfig = json.loads(body)
+            config = yaml.load(base64.b64decode(preconfig["configData"]), Loader=SafeLoader)
+        except Exception as e:
+            return 400, {"error": str(e)}, {}
+        if not isinstance(config, dict):
+            return 400, {"error": "preconfig is not a YAML mapping"}, {}
+        return 200, None, {}
+
+
+if __name__ == "__main__":
+    # Run standalone for manual testing against the helpers
+    with MockOrchestrator() as orch:
+        print("Mock Orchestrator listening on {0}".format(orch.url))
+        try:
+            orch.thread.join()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,134 @@
+#
+# synthetic_inventory.py - synthetic site inventory CSV for benchmarks
+# Fills every column generate_csv.py extracts from the preconfig template (plus serial_number)
+# with plausible, unique-per-site values: addressing is derived from the row number so each
+# site renders a distinct, valid-looking preconfig with LAN/WAN interfaces, DHCP, static
+# routes, BGP and OSPF sections enabled.
+#
+# Usage: python benchmarks/synthetic_inventory.py ROWS OUTPUT.csv[.gz] [--template FILE]
+#
+
+# Standard library imports
+import argparse
+import csv
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Local application imports
+from generate_csv import get_preconfig_vars
+
+DEFAULT_TEMPLATE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "templates", "ec_preconfig_template.jinja2"
+)
+
+# Fixed values for columns that select template branches or take enumerated values
+FIXED_VALUES = {
+    "networkRole": "non-hub",
+    "deploymentMode": "inline-router",
+    "configure_dhcp": "TRUE",
+    "enable_ospf": "TRUE",
+    "templateGroups": "Default Template Group,Branch",
+    "businessIntentOverlays": "RealTime,CriticalApps,DefaultOverlay",
+    "shapeInboundTraffic": "true",
+    "useSharedSubnetInfo": "true",
+    "advertiseLocalLanSubnets": "true",
+    "advertiseLocalWanSubnets": "false",
+    "redistOspfToSubnetShare": "false",
+    "filterRoutesWithLocalASN": "true",
+    "useDefaultAccount": "true",
+    "ospf_area": "0",
+    "dhcp_max_lease": "86400",
+    "dhcp_default_lease": "43200",
+}
+
+
+def site_octets(row_number):
+    # Second and third octets unique per site for up to 65536 sites, then wrapping
+    return (row_number >> 8) & 0xFF, row_number & 0xFF
+
+
+def column_value(column, row_number):
+    if column in FIXED_VALUES:
+        return FIXED_VALUES[column]
+    b, c = site_octets(row_number)
+    lower = column.lower()
+
+    if column in ("hostname", "site"):
+        return "site-{0:07d}".format(row_number)
+    if column == "serial_number":
+        return "001BBC{0:06X}".format(row_number & 0xFFFFFF)
+    if column.startswith("lan_interface_") and column.endswith("_name"):
+        return "lan{0}".format(int(column.split("_")[2]) - 1)
+    if column.startswith("wan_interface_") and column.endswith("_name"):
+        return "wan{0}".format(int(column.split("_")[2]) - 1)
+    if column.startswith("ospf_interface_") and column.endswith("_name"):
+        return "lan{0}".format(int(column.split("_")[2]) - 1)
+    if column.startswith("dhcp_interface_") and column.count("_") == 2:
+        return "lan{0}".format(int(column.split("_")[2]) - 1)
+    if column.endswith("_type"):
+        return "server"
+    if column.endswith("_interface"):
+        return "lan0"
+    if "ipmask" in lower:
+        return "10.{0}.{1}.1/24".format(b, c)
+    if column.endswith("_network") or column.endswith("_subnet"):
+        return "10.{0}.{1}.0/24".format(b, c)
+    if "start_address" in lower:
+        return "10.{0}.{1}.100".format(b, c)
+    if "end_address" in lower:
+        return "10.{0}.{1}.200".format(b, c)
+    if "nexthop" in lower:
+        return "10.{0}.{1}.254".format(b, c)
+    if "gateway" in lower:
+        return "10.{0}.{1}.1".format(b, c)
+    if "routerid" in lower:
+        return "10.255.{0}.{1}".format(b, c)
+    if column.endswith("_ip") or "server" in lower or "dns" in lower or "ntp" in lower:
+        return "192.0.2.{0}".format(row_number % 250 + 1)
+    if "asn" in lower:
+        return str(64512 + row_number % 1000)
+    if "bandwidth" in lower or column.endswith("_bw"):
+        return "100000"
+    if "metric" in lower or "cost" in lower or "priority" in lower or lower.endswith("tag"):
+        return "10"
+    if column.endswith("_advertise") or "advertiseTo" in column:
+        return "true"
+    if "routemap" in lower or "rtmap" in lower:
+        return "default_rtmap_to_subsh"
+    if "opt" in lower and lower.endswith("value"):
+        return "value{0}".format(row_number)
+    if "_opt" in lower:
+        return "42"
+    if column == "email":
+        return "site{0}@example.com".format(row_number)
+    if column == "phoneNumber":
+        return "+1-555-{0:07d}".format(row_number % 10000000)
+    return "{0}-{1}".format(column, row_number)
+
+
+def write_inventory(filename, rows, template_file=DEFAULT_TEMPLATE):
+    columns = get_preconfig_vars(template_file)
+    if "serial_number" not in columns:
+        columns.insert(1, "serial_number")
+
+    opener = gzip.open if filename.endswith(".gz") else open
+    with opener(filename, "wt", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(columns)
+        for row_number in range(1, rows + 1):
+            writer.writerow([column_value(column, row_number) for column in columns])
+    return columns
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rows", type=int)
+    parser.add_argument("output", type=str)
+    parser.add_argument("--template", type=str, default=DEFAULT_TEMPLATE)
+    args = parser.parse_args()
+
+    columns = write_inventory(args.output, args.rows, args.template)
+    print("Wrote {0} rows x {1} columns to {2}".format(args.rows, len(columns), args.output))
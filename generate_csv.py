@@ -1,13 +1,16 @@
 # Standard library imports
 import csv
+import json
 import os
-import re
 
 # Third party imports
 import colored
 from colored import stylize
 from jinja2 import Environment, FileSystemLoader, PackageLoader, meta
 
+# Local application imports
+from preconfig_columns import compile_column_schema
+
 # Console text highlight color parameters
 red_text = colored.fg("red") + colored.attr("bold")
 green_text = colored.fg("green") + colored.attr("bold")
@@ -17,33 +20,39 @@ orange_text = colored.fg("dark_orange") + colored.attr("bold")
 # Retrieve Jinja2 template for generating EdgeConnect Preconfig YAML file
 ec_template_file = "./templates/ec_preconfig_template.jinja2"
 
-# List to populate with variables from Jinja Template
-preconfig_vars = []
 
-# Read Jinja Template
-with open(ec_template_file, 'r') as jinja:
-    data=jinja.readlines()
+def get_preconfig_vars(template_file):
+    # List of variables read from data in the Jinja Template, in template order
+    return list(get_preconfig_schema(template_file).columns)
+
+
+def get_preconfig_schema(template_file):
+    # Column schema compiled from the parsed Jinja Template, see preconfig_columns
+    env = Environment(loader=FileSystemLoader(os.path.dirname(template_file)))
+    return compile_column_schema(env, os.path.basename(template_file))
+
 
-# Search each line for variable
-for line in data:
-    result = re.search(r"\['(.*?)'\]", line)
-    # Add to preconfig_vars if variable exists and has not yet been added
-    if result != None and result.group(1) not in preconfig_vars:
-        preconfig_vars.append(result.group(1))
+if __name__ == "__main__":
+    preconfig_schema = get_preconfig_schema(ec_template_file)
+    preconfig_vars = list(preconfig_schema.columns)
 
+    # Write list as headers to csv file
 
+    # Local directory for configuration outputs
+    local_config_directory = "preconfig_outputs/"
 
-# Write list as headers to csv file
+    if not os.path.exists(local_config_directory):
+        os.makedirs(local_config_directory)
 
-# Local directory for configuration outputs
-local_config_directory = "preconfig_outputs/"
+    # CSV Template generated by Jinja Template
+    csv_filename = 'preconfig-template.csv'
 
-if not os.path.exists(local_config_directory):
-    os.makedirs(local_config_directory)
+    with open(local_config_directory + csv_filename, 'w') as csvfile:
+        writer = csv.writer(csvfile, delimiter=',')
+        writer.writerow(preconfig_vars)
 
-# CSV Template generated by Jinja Template
-csv_filename = 'preconfig-template.csv'
+    # Column schema (required and list columns) for checking CSV files against the template
+    schema_filename = 'preconfig-template.schema.json'
 
-with open(local_config_directory + csv_filename, 'w') as csvfile:
-    writer = csv.writer(csvfile, delimiter=',')
-    writer.writerow(preconfig_vars)
+    with open(local_config_directory + schema_filename, 'w') as schema_file:
+        json.dump(preconfig_schema.to_dict(), schema_file, indent=2)
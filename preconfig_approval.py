@@ -0,0 +1,65 @@
+# Matching of CSV hosts to Orchestrator preconfigs and denied appliances
+#
+# Preconfigs are indexed by name and reachable denied appliances by applianceInfo.site once,
+# so the join against the host list is linear in the number of hosts, preconfigs and appliances
+# rather than their product.
+
+
+def index_preconfigs(preconfigs):
+    # Preconfig name -> list of preconfigs with that name, in Orchestrator order
+    preconfig_index = {}
+    for preconfig in preconfigs:
+        preconfig_index.setdefault(preconfig["name"], []).append(preconfig)
+    return preconfig_index
+
+
+def index_denied_appliances(denied_appliances):
+    # Site -> list of reachable denied appliances at that site, in Orchestrator order
+    appliance_index = {}
+    for appliance in denied_appliances:
+        appliance_info = appliance["applianceInfo"]
+        if appliance_info["reachabilityStatus"] == 1:
+            appliance_index.setdefault(appliance_info["site"], []).append(appliance)
+    return appliance_index
+
+
+def match_denied_appliances(hostnames, preconfig_index, appliance_index):
+    # Join hosts against the preconfig and denied appliance indexes
+    #
+    # Returns dict with:
+    #   approve    - host -> {"discovered_id", "preconfig_id"} for each host to approve
+    #   unmatched  - hosts without both a preconfig and a reachable denied appliance
+    #   duplicates - host -> {"preconfigs": n, "appliances": n} for hosts with more than one candidate
+    #
+    # With duplicates the last preconfig and last appliance win, as in the original nested loop
+    approve_dict = {}
+    unmatched = []
+    duplicates = {}
+    seen = set()
+
+    for host in hostnames:
+        if host in seen:
+            continue
+        seen.add(host)
+        host_preconfigs = preconfig_index.get(host)
+        host_appliances = appliance_index.get(host)
+        if not host_preconfigs or not host_appliances:
+            unmatched.append(host)
+            continue
+
+        if len(host_preconfigs) > 1 or len(host_appliances) > 1:
+            duplicates[host] = {
+                "preconfigs": len(host_preconfigs),
+                "appliances": len(host_appliances),
+            }
+
+        approve_dict[host] = {
+            "discovered_id": host_appliances[-1]["id"],
+            "preconfig_id": host_preconfigs[-1]["id"],
+        }
+
+    return {
+        "approve": approve_dict,
+        "unmatched": unmatched,
+        "duplicates": duplicates,
+    }
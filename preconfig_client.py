@@ -0,0 +1,87 @@
+# Orchestrator client for the preconfig script built on sp_orchhelper.OrchHelper
+#
+# HelperOrchestrator exposes the silverpeak_python_sdk.Orchestrator calls used by
+# silverpeak-preconfig-from-jinja.py, so the script can send its traffic through OrchHelper's
+# pluggable transport, e.g. to record a run or replay a recording without network access.
+
+# Local application imports
+from sp_orchhelper import OrchHelper
+from sp_transport import RecordingTransport, ReplayTransport
+
+
+class HelperOrchestrator:
+    # record is a file to write request/response pairs to, appended to if record_append is set
+    # replay is a recording to serve responses from instead of the network,
+    # replay_speed divides the recorded response times (None replays without delays)
+    # tracer is an sp_trace.RequestTracer receiving a span for every request sent, cache hits
+    #   are not traced
+    # helper_options are passed to OrchHelper (pool size, timeouts, retries, limiter and cache)
+    def __init__(
+        self, url, record=None, replay=None, replay_speed=None, tracer=None, record_append=False, **helper_options
+    ):
+        if replay:
+            # Recordings hold the responses after retries and caching, replay them as they are
+            helper_options["retries"] = 0
+            helper_options["cache"] = None
+            self.helper = OrchHelper(
+                url,
+                None,
+                None,
+                transport=ReplayTransport(replay, speed=replay_speed),
+                tracer=tracer,
+                **helper_options
+            )
+        else:
+            self.helper = OrchHelper(url, None, None, tracer=tracer, **helper_options)
+            if record:
+                self.helper.transport = RecordingTransport(
+                    self.helper.transport, record, append=record_append
+                )
+
+    def login(self, user, password):
+        self.helper.user = user
+        self.helper.password = password
+        return self.helper.login()
+
+    def logout(self):
+        self.helper.logout()
+        # Recording is complete once logged out
+        self.helper.transport.close()
+
+    def validate_preconfig(self, hostname, serial_number, preconfig, auto_apply):
+        return self.helper.validate_preconfig(hostname, serial_number, preconfig, auto_apply)
+
+    def create_preconfig(self, hostname, serial_number, preconfig, auto_apply):
+        return self.helper.create_preconfig(hostname, serial_number, preconfig, auto_apply)
+
+    def get_all_preconfig(self):
+        # JSON list as returned by the SDK, empty if the request failed
+        response = self.helper.get_all_preconfig()
+        return response.json() if response is not False else []
+
+    def get_all_denied_appliances(self):
+        response = self.helper.get_all_denied_appliances()
+        return response.json() if response is not False else []
+
+    def get_all_template_groups(self):
+        # JSON list, None if the request failed
+        response = self.helper.get_all_template_groups()
+        return response.json() if response is not False else None
+
+    def get_all_overlays(self):
+        response = self.helper.get_all_overlays()
+        return response.json() if response is not False else None
+
+    # Streaming variants, iterators over entries parsed as the listing arrives
+
+    def iter_all_preconfig(self):
+        return self.helper.iter_all_preconfig() or []
+
+    def iter_all_denied_appliances(self):
+        return self.helper.iter_all_denied_appliances() or []
+
+    def iter_all_discovered_appliances(self):
+        return self.helper.iter_all_discovered_appliances() or []
+
+    def approve_and_apply_preconfig(self, preconfig_id, discovered_id):
+        return self.helper.approve_and_apply_preconfig(preconfig_id, discovered_id)
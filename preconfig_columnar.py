@@ -0,0 +1,175 @@
+# Columnar site inventory readers (Parquet, Arrow IPC and CSV through pyarrow)
+#
+# Rows are read in record batches and normalised a whole column at a time before being turned
+# into the row dicts the renderer takes: values are cast to strings (booleans as TRUE/FALSE, as
+# spreadsheets export them) and nulls default to "". Values are otherwise left as read, as CSV
+# rows are, and list columns are split on commas with each item stripped, as comma_separate does.
+# Rows without a hostname are filtered out of the conversion and handed on as {"hostname": ""}
+# in their place, so they are reported against their row number as before. Only the columns
+# asked for are read and converted, warehouse exports often carry many more than a template uses.
+#
+# pyarrow is only needed, and only imported, when a columnar input is read.
+
+# Standard library imports
+import csv
+import io
+
+# Local application imports
+from preconfig_inputs import LIST_COLUMNS
+
+FORMAT_PARQUET = "parquet"
+FORMAT_ARROW = "arrow"
+FORMAT_COLUMNAR_CSV = "columnar-csv"
+COLUMNAR_FORMATS = (FORMAT_PARQUET, FORMAT_ARROW, FORMAT_COLUMNAR_CSV)
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+    except ImportError:
+        raise ImportError("Parquet, Arrow and columnar CSV input need pyarrow: pip install pyarrow")
+    return pyarrow, pyarrow.compute
+
+
+def string_column(pa, pc, column):
+    # Column cast to strings, nulls as ""
+    if pa.types.is_boolean(column.type):
+        column = pc.if_else(column, "TRUE", "FALSE")
+    elif pa.types.is_list(column.type) or pa.types.is_large_list(column.type):
+        # Native list columns are joined so they split like CSV list columns
+        column = pc.binary_join(pc.cast(column, pa.list_(pa.string())), ",")
+    elif pa.types.is_null(column.type):
+        column = pa.array([""] * len(column), pa.string())
+    elif not pa.types.is_string(column.type):
+        column = pc.cast(column, pa.string())
+    return pc.fill_null(column, "")
+
+
+def list_column(pa, pc, column):
+    # Comma separated strings split into lists of stripped items
+    items = pc.split_pattern(column, pattern=",")
+    return pa.ListArray.from_arrays(items.offsets, pc.utf8_trim_whitespace(pc.list_flatten(items)))
+
+
+class ColumnarRows:
+    # Iterates (row_number, row) over a columnar input, row numbers counted from 1
+    # fieldnames holds all of the input's column names once opened, columns limits the columns
+    # read into rows (None reads all)
+
+    def __init__(self, filename, input_format, list_columns=LIST_COLUMNS, batch_size=65536, columns=None):
+        self.pa, self.pc = import_pyarrow()
+        self.filename = filename
+        self.input_format = input_format
+        self.list_columns = list_columns
+        self.batch_size = batch_size
+        self.columns = columns
+        self.source = None
+        self.batches, self.fieldnames = self.open()
+
+    def selected(self, fieldnames):
+        # Columns to read, in input order
+        if self.columns is None:
+            return list(fieldnames)
+        return [name for name in fieldnames if name in self.columns]
+
+    def open(self):
+        pa = self.pa
+        if self.input_format == FORMAT_PARQUET:
+            import pyarrow.parquet
+
+            parquet_file = pyarrow.parquet.ParquetFile(self.filename)
+            self.source = parquet_file
+            fieldnames = parquet_file.schema_arrow.names
+            return (
+                parquet_file.iter_batches(batch_size=self.batch_size, columns=self.selected(fieldnames)),
+                fieldnames,
+            )
+        if self.input_format == FORMAT_ARROW:
+            self.source = pa.memory_map(self.filename)
+            try:
+                reader = pa.ipc.open_file(self.source)
+                batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            except pa.ArrowInvalid:
+                # Arrow IPC stream rather than file (random access) format
+                self.source.seek(0)
+                reader = pa.ipc.open_stream(self.source)
+                batches = iter(reader)
+            fieldnames = reader.schema.names
+            # Memory mapped, unread columns are never paged in
+            selected = self.selected(fieldnames)
+            return (batch.select(selected) for batch in batches), fieldnames
+        import pyarrow.csv
+
+        # Every column is read as text, so serial numbers and zip codes keep leading zeros
+        self.source = pa.input_stream(self.filename, compression="detect")
+        with io.TextIOWrapper(
+            pa.input_stream(self.filename, compression="detect"), encoding="utf-8-sig", newline=""
+        ) as header_file:
+            header = next(csv.reader(header_file), [])
+        reader = pyarrow.csv.open_csv(
+            self.source,
+            read_options=pyarrow.csv.ReadOptions(block_size=max(1048576, self.batch_size * 1024)),
+            convert_options=pyarrow.csv.ConvertOptions(
+                column_types=dict((name, pa.string()) for name in header),
+                strings_can_be_null=False,
+                include_columns=self.selected(header),
+            ),
+        )
+        return iter(reader), header
+
+    def normalise(self, batch):
+        # Batch as {column: normalised array}, and which of its rows have no hostname
+        pa, pc = self.pa, self.pc
+        columns = {}
+        for name, column in zip(batch.schema.names, batch.columns):
+            column = string_column(pa, pc, column)
+            if name in self.list_columns:
+                column = list_column(pa, pc, column)
+            columns[name] = column
+        if "hostname" in columns:
+            blank = pc.equal(columns["hostname"], "")
+        else:
+            blank = pa.array([True] * batch.num_rows)
+        return columns, blank
+
+    def column_values(self, column):
+        # Python values of a column, low cardinality columns are decoded from their distinct
+        # values so each is converted once and shared by the rows holding it
+        pa, pc = self.pa, self.pc
+        if not pa.types.is_string(column.type):
+            return column.to_pylist()
+        encoded = pc.dictionary_encode(column)
+        if len(encoded.dictionary) * 4 > len(column):
+            return column.to_pylist()
+        distinct = encoded.dictionary.to_pylist()
+        return [distinct[index] for index in encoded.indices.to_pylist()]
+
+    def __iter__(self):
+        pa, pc = self.pa, self.pc
+        row_number = 1
+        try:
+            for batch in self.batches:
+                columns, blank = self.normalise(batch)
+                blank_rows = set(pc.indices_nonzero(blank).to_pylist())
+                if blank_rows:
+                    keep = pc.invert(blank)
+                    columns = dict((name, column.filter(keep)) for name, column in columns.items())
+                # Converted a column at a time, far cheaper than converting row by row
+                names = list(columns)
+                rows = (
+                    dict(zip(names, values))
+                    for values in zip(*[self.column_values(column) for column in columns.values()])
+                )
+                for index in range(batch.num_rows):
+                    if index in blank_rows:
+                        yield row_number, {"hostname": ""}
+                    else:
+                        yield row_number, next(rows)
+                    row_number = row_number + 1
+        finally:
+            self.close()
+
+    def close(self):
+        if self.source is not None and hasattr(self.source, "close"):
+            self.source.close()
@@ -0,0 +1,369 @@
+# CSV column schema compiled from a preconfig template
+#
+# The parsed jinja template is walked for every data['column'] (or data.column) it references.
+# A column is optional where it is filtered through default(), read with data.get() or guarded
+# by an {% if %} testing it (is defined, != "", == 'TRUE', ...). Columns iterated over with
+# {% for %} are list columns, split on commas before rendering.
+#
+# Every other reference makes its column required whenever the {% if %} tests around it hold,
+# e.g. lan_interface_1_ipmask is required for rows with a lan_interface_1_name. Rows are checked
+# against the compiled requirements in one pass over their columns before rendering, so a row
+# missing a value is rejected without a render or an Orchestrator call. Requirements under tests
+# that cannot be evaluated on the CSV values alone are not enforced.
+#
+# The schema is plain data (to_dict / from_dict) so generate_csv.py can write it alongside the
+# CSV header it generates.
+
+# Third party imports
+from jinja2 import nodes
+
+# Local application imports
+from preconfig_inputs import comma_separate
+
+# Opposite of each test operator, for the tests an {% elif %} or {% else %} branch excludes
+NEGATED_OPERATORS = {
+    "defined": "undefined",
+    "undefined": "defined",
+    "eq": "ne",
+    "ne": "eq",
+    "truthy": "falsy",
+    "falsy": "truthy",
+}
+
+REQUIRED_ALWAYS = "always"
+REQUIRED_CONDITIONAL = "conditional"
+REQUIRED_NEVER = "optional"
+
+
+def column_reference(node, variable):
+    # Column name for data['column'] or data.column, None for any other node
+    if not isinstance(node, (nodes.Getitem, nodes.Getattr)):
+        return None
+    if not isinstance(node.node, nodes.Name) or node.node.name != variable:
+        return None
+    if isinstance(node, nodes.Getattr):
+        return node.attr
+    if isinstance(node.arg, nodes.Const) and isinstance(node.arg.value, str):
+        return node.arg.value
+    return None
+
+
+def get_reference(node, variable):
+    # Column name for data.get('column'), None for any other node
+    if (
+        isinstance(node, nodes.Call)
+        and isinstance(node.node, nodes.Getattr)
+        and node.node.attr == "get"
+        and isinstance(node.node.node, nodes.Name)
+        and node.node.node.name == variable
+        and node.args
+        and isinstance(node.args[0], nodes.Const)
+    ):
+        return node.args[0].value
+    return None
+
+
+def test_atoms(test, variable):
+    # An {% if %} test as a list of (column, operator, value) that must all hold,
+    # None if the test is not a conjunction of column tests
+    if isinstance(test, nodes.And):
+        left = test_atoms(test.left, variable)
+        right = test_atoms(test.right, variable)
+        if left is None or right is None:
+            return None
+        return left + right
+    if isinstance(test, nodes.Not):
+        inner = test_atoms(test.node, variable)
+        if inner is None or len(inner) != 1:
+            return None
+        column, operator, value = inner[0]
+        return [(column, NEGATED_OPERATORS[operator], value)]
+    if isinstance(test, nodes.Test) and test.name in ("defined", "undefined"):
+        column = column_reference(test.node, variable)
+        if column is None:
+            return None
+        return [(column, test.name, None)]
+    if isinstance(test, nodes.Compare) and len(test.ops) == 1 and test.ops[0].op in ("eq", "ne"):
+        left, right = test.expr, test.ops[0].expr
+        if isinstance(left, nodes.Const):
+            left, right = right, left
+        column = column_reference(left, variable)
+        if column is None or not isinstance(right, nodes.Const):
+            return None
+        return [(column, test.ops[0].op, right.value)]
+    column = column_reference(test, variable)
+    if column is not None:
+        return [(column, "truthy", None)]
+    return None
+
+
+def is_empty(value):
+    # True for an undefined or blank column value, or a list of blank items
+    if value is None:
+        return True
+    if isinstance(value, list):
+        return all(item.strip() == "" for item in value)
+    return value.strip() == ""
+
+
+def atom_holds(atom, value):
+    # Evaluate a test atom as jinja would for a column value, None when the column is undefined
+    column, operator, expected = atom
+    if operator == "defined":
+        return value is not None
+    if operator == "undefined":
+        return value is None
+    if operator == "eq":
+        return value is not None and value == expected
+    if operator == "ne":
+        return value is None or value != expected
+    if operator == "truthy":
+        return bool(value)
+    return not value
+
+
+class ColumnSchema:
+    # columns maps each referenced column, in template order, to
+    #   {"list": bool, "requirements": [{"when": [atoms], "unless": [[atoms], ...]}, ...]}
+    # A column is required in rows where every atom of a requirement's "when" holds and no
+    # "unless" conjunction does
+
+    def __init__(self, template, columns):
+        self.template = template
+        self.columns = columns
+        self.list_columns = tuple(name for name, column in columns.items() if column["list"])
+        # Compiled checks, (column, when, unless) per requirement, unconditional ones first
+        self.checks = sorted(
+            (
+                (name, tuple(requirement["when"]), tuple(requirement["unless"]))
+                for name, column in columns.items()
+                for requirement in column["requirements"]
+            ),
+            key=lambda check: bool(check[1] or check[2]),
+        )
+
+    def required(self, name):
+        requirements = self.columns[name]["requirements"]
+        if any(not requirement["when"] and not requirement["unless"] for requirement in requirements):
+            return REQUIRED_ALWAYS
+        return REQUIRED_CONDITIONAL if requirements else REQUIRED_NEVER
+
+    def missing_columns(self, fieldnames):
+        # Columns every row requires that are absent from a CSV header
+        return [
+            name for name in self.columns if name not in fieldnames and self.required(name) == REQUIRED_ALWAYS
+        ]
+
+    def unused_columns(self, fieldnames):
+        # CSV header columns the template never references
+        return [name for name in fieldnames if name not in self.columns]
+
+    def value(self, row, name):
+        # Column value as the template sees it, list columns are split before rendering
+        value = row.get(name)
+        if isinstance(value, str) and name in self.columns and self.columns[name]["list"]:
+            return comma_separate(value)
+        return value
+
+    def check(self, row):
+        # Messages for each required column a CSV row leaves empty
+        values = {}
+        errors = []
+        failed = set()
+
+        def holds(atoms):
+            for atom in atoms:
+                if atom[0] not in values:
+                    values[atom[0]] = self.value(row, atom[0])
+                if not atom_holds(atom, values[atom[0]]):
+                    return False
+            return True
+
+        for name, when, unless in self.checks:
+            if name in failed:
+                continue
+            value = row.get(name)
+            if not is_empty(value):
+                continue
+            if holds(when) and not any(holds(atoms) for atoms in unless):
+                failed.add(name)
+                errors.append(
+                    "{0} is {1}{2}".format(
+                        name,
+                        "missing" if value is None else "empty",
+                        "" if not when else ", required when " + describe_atoms(when),
+                    )
+                )
+        return errors
+
+    def to_dict(self):
+        return {
+            "template": self.template,
+            "columns": [
+                {
+                    "name": name,
+                    "list": column["list"],
+                    "required": self.required(name),
+                    "requirements": [
+                        {
+                            "when": [list(atom) for atom in requirement["when"]],
+                            "unless": [[list(atom) for atom in atoms] for atoms in requirement["unless"]],
+                        }
+                        for requirement in column["requirements"]
+                    ],
+                }
+                for name, column in self.columns.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, schema):
+        return cls(
+            schema["template"],
+            dict(
+                (
+                    column["name"],
+                    {
+                        "list": column["list"],
+                        "requirements": [
+                            {
+                                "when": [tuple(atom) for atom in requirement["when"]],
+                                "unless": [[tuple(atom) for atom in atoms] for atoms in requirement["unless"]],
+                            }
+                            for requirement in column["requirements"]
+                        ],
+                    },
+                )
+                for column in schema["columns"]
+            ),
+        )
+
+
+def describe_atoms(atoms):
+    # "lan_interface_1_name is set" for both is defined and != ""
+    descriptions = []
+    for column, operator, value in atoms:
+        if operator in ("defined", "truthy") or (operator == "ne" and value == ""):
+            description = "{0} is set".format(column)
+        elif operator in ("undefined", "falsy") or (operator == "eq" and value == ""):
+            description = "{0} is not set".format(column)
+        elif operator == "eq":
+            description = "{0} is {1!r}".format(column, value)
+        else:
+            description = "{0} is not {1!r}".format(column, value)
+        if description not in descriptions:
+            descriptions.append(description)
+    return " and ".join(descriptions)
+
+
+class TemplateWalker:
+    # Collects column references from a parsed template, following {% include %} of constant names
+
+    def __init__(self, environment, variable):
+        self.environment = environment
+        self.variable = variable
+        self.columns = {}
+        self.included = set()
+
+    def column(self, name):
+        if name not in self.columns:
+            self.columns[name] = {"list": False, "requirements": []}
+        return self.columns[name]
+
+    def require(self, name, when, unless):
+        # when is None below a test that cannot be evaluated, nothing is required there
+        column = self.column(name)
+        # A column guarded by a test of its own (is defined, != "") is optional
+        if when is None or any(atom[0] == name for atom in when):
+            return
+        requirement = {"when": list(when), "unless": [list(atoms) for atoms in unless]}
+        # Duplicates of an existing requirement add nothing
+        if requirement not in column["requirements"]:
+            column["requirements"].append(requirement)
+
+    def walk_template(self, template_name, when=(), unless=()):
+        if template_name in self.included:
+            return
+        self.included.add(template_name)
+        source = self.environment.loader.get_source(self.environment, template_name)[0]
+        self.walk(self.environment.parse(source), when, unless)
+
+    def walk_test(self, test):
+        # Column references in an {% if %} test are never required
+        for node in test.find_all((nodes.Getitem, nodes.Getattr, nodes.Call)):
+            name = column_reference(node, self.variable) or get_reference(node, self.variable)
+            if name is not None:
+                self.column(name)
+
+    def walk_branches(self, branches, else_body, when, unless):
+        # branches is a list of (test, body) for an if/elif chain, tests before a branch must fail
+        previous = []
+        for test, body in branches:
+            self.walk_test(test)
+            atoms = test_atoms(test, self.variable)
+            if when is None or atoms is None or None in previous:
+                branch_when = None
+            else:
+                branch_when = tuple(when) + tuple(atom for atom in atoms if atom not in when)
+            self.walk_nodes(body, branch_when, tuple(unless) + tuple(previous) if branch_when is not None else ())
+            previous.append(tuple(atoms) if atoms is not None else None)
+        if else_body:
+            if when is None or None in previous:
+                self.walk_nodes(else_body, None, ())
+            else:
+                self.walk_nodes(else_body, when, tuple(unless) + tuple(previous))
+
+    def walk_nodes(self, body, when, unless):
+        for node in body:
+            self.walk(node, when, unless)
+
+    def walk(self, node, when, unless):
+        if isinstance(node, nodes.If):
+            branches = [(node.test, node.body)] + [(elif_.test, elif_.body) for elif_ in node.elif_]
+            self.walk_branches(branches, node.else_, when, unless)
+            return
+        if isinstance(node, nodes.CondExpr):
+            self.walk_branches([(node.test, [node.expr1])], [node.expr2] if node.expr2 else [], when, unless)
+            return
+        if isinstance(node, nodes.Filter) and node.name in ("default", "d"):
+            # Reading through default() is optional, its arguments are walked as usual
+            name = column_reference(node.node, self.variable)
+            if name is not None:
+                self.column(name)
+            else:
+                self.walk(node.node, when, unless)
+            self.walk_nodes(list(node.args) + [kwarg.value for kwarg in node.kwargs], when, unless)
+            return
+        if isinstance(node, nodes.For):
+            name = column_reference(node.iter, self.variable)
+            if name is not None:
+                self.column(name)["list"] = True
+            self.walk_nodes([node.iter] + list(node.body), when, unless)
+            if node.test is not None:
+                self.walk_test(node.test)
+            self.walk_nodes(node.else_, None, ())
+            return
+        if isinstance(node, nodes.Assign):
+            # Values set aside in a variable are not required where they are set
+            self.walk_test(node.node)
+            return
+        if isinstance(node, nodes.Include) and isinstance(node.template, nodes.Const):
+            self.walk_template(node.template.value, when, unless)
+            return
+        name = get_reference(node, self.variable)
+        if name is not None:
+            self.column(name)
+            return
+        name = column_reference(node, self.variable)
+        if name is not None:
+            self.require(name, when, unless)
+            return
+        for child in node.iter_child_nodes():
+            self.walk(child, when, unless)
+
+
+def compile_column_schema(environment, template_name, variable="data"):
+    # ColumnSchema of the columns template_name reads from variable, the row passed to render()
+    walker = TemplateWalker(environment, variable)
+    walker.walk_template(template_name)
+    return ColumnSchema(template_name, walker.columns)
@@ -0,0 +1,87 @@
+# Fan-out of CSV rows to several Orchestrators
+#
+# Rows are routed by a CSV column holding an Orchestrator URL or a region name looked up in a
+# region -> Orchestrator map file. Each Orchestrator gets its own worker thread, fed through a
+# bounded queue so reading the CSV never runs far ahead of the slowest Orchestrator; the thread
+# opens the partition (login, per-Orchestrator setup) and then processes its rows in CSV order.
+
+# Standard library imports
+import queue
+import threading
+
+# Third party imports
+import yaml
+
+# Queue entry telling a partition thread that no more rows follow
+END_OF_ROWS = None
+
+
+def load_orchestrator_map(filename):
+    # YAML or JSON mapping of region -> Orchestrator URL, or region -> {"url", "user", "password"}
+    # where a missing user/password falls back to the default credentials
+    with open(filename) as map_file:
+        entries = yaml.safe_load(map_file) or {}
+    orchestrator_map = {}
+    for region, entry in entries.items():
+        if isinstance(entry, str):
+            entry = {"url": entry}
+        orchestrator_map[str(region)] = entry
+    return orchestrator_map
+
+
+class FanOut:
+    # open_partition(key) is called on the partition's thread before its first row and returns
+    # the partition object, process_row(partition, row_number, row, *args) is then called per row
+    # with any further arguments given to submit()
+    # queue_size bounds the rows waiting per partition
+
+    def __init__(self, open_partition, process_row, queue_size=100):
+        self.open_partition = open_partition
+        self.process_row = process_row
+        self.queue_size = queue_size
+        self.queues = {}
+        self.threads = {}
+        self.partitions = {}
+        self.errors = {}
+        # Rows handed to each partition, and rows a failed partition did not process
+        self.submitted = {}
+        self.dropped = {}
+
+    def submit(self, key, row_number, row, *args):
+        if key not in self.queues:
+            self.queues[key] = queue.Queue(self.queue_size)
+            self.threads[key] = threading.Thread(
+                target=self._run, args=(key,), name="orchestrator-{0}".format(key), daemon=True
+            )
+            self.threads[key].start()
+            self.submitted[key] = 0
+        self.submitted[key] = self.submitted[key] + 1
+        self.queues[key].put((row_number, row) + args)
+
+    def close(self):
+        # Wait for every partition, returns key -> partition in order of first appearance
+        # Errors raised by open_partition / process_row are collected in self.errors and the
+        # number of rows the failed partition did not process in self.dropped
+        for key in self.queues:
+            self.queues[key].put(END_OF_ROWS)
+        for key in self.threads:
+            self.threads[key].join()
+        return dict((key, self.partitions[key]) for key in self.queues if key in self.partitions)
+
+    def _run(self, key):
+        rows = self.queues[key]
+        processed = 0
+        try:
+            partition = self.partitions[key] = self.open_partition(key)
+            while True:
+                item = rows.get()
+                if item is END_OF_ROWS:
+                    break
+                self.process_row(partition, *item)
+                processed = processed + 1
+        except Exception as e:
+            self.errors[key] = e
+            # Keep draining so the reader is never blocked on a failed partition
+            while rows.get() is not END_OF_ROWS:
+                pass
+            self.dropped[key] = self.submitted[key] - processed
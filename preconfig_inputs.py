@@ -0,0 +1,101 @@
+# Input sources for preconfig site data
+#
+# Rows are read lazily so arbitrarily large inventories can be processed without loading the
+# whole file. A filename of "-" reads CSV from stdin and a ".gz" suffix is decompressed on the fly.
+
+# Standard library imports
+import csv
+import gzip
+import io
+import sys
+
+# Columns holding comma separated lists in the CSV
+LIST_COLUMNS = ("templateGroups", "businessIntentOverlays")
+
+# Input formats, columnar ones are read through pyarrow by preconfig_columnar
+FORMAT_CSV = "csv"
+INPUT_FORMATS = ("auto", FORMAT_CSV, "columnar-csv", "parquet", "arrow")
+# Format for input file name suffixes, anything else is CSV
+INPUT_SUFFIXES = (
+    (".parquet", "parquet"),
+    (".pq", "parquet"),
+    (".arrow", "arrow"),
+    (".feather", "arrow"),
+    (".ipc", "arrow"),
+)
+
+
+def comma_separate(cs_string_list):
+    # Blank List
+    cs_list = []
+    # Convert string to comma separated list
+    cs_string_list = cs_string_list.split(",")
+    # Strip leading/trailing whitespace from items
+    for item in cs_string_list:
+        cs_list.append(item.strip())
+    return cs_list
+
+
+def split_list_columns(row, columns=LIST_COLUMNS):
+    # Convert list strings to comma separated list, strips leading/trailing whitespace
+    # Columns absent from the row are left undefined
+    for column in columns:
+        if isinstance(row.get(column), str):
+            row[column] = comma_separate(row[column])
+    return row
+
+
+def open_csv_source(filename):
+    # Text stream for the CSV source, utf-8-sig strips a leading BOM as with Excel exports
+    if filename == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "rt", encoding="utf-8-sig", newline="")
+    return open(filename, encoding="utf-8-sig", newline="")
+
+
+def read_csv_rows(filename):
+    # Yield one dict per CSV row, closing the source once exhausted
+    with open_csv_source(filename) as csvfile:
+        for row in csv.DictReader(csvfile):
+            yield row
+
+
+def detect_input_format(filename, input_format="auto"):
+    if input_format != "auto":
+        return input_format
+    for suffix, suffix_format in INPUT_SUFFIXES:
+        if filename.lower().endswith(suffix):
+            return suffix_format
+    return FORMAT_CSV
+
+
+class CsvRows:
+    # Iterates (row_number, row) over a CSV source, row numbers counted from 1
+    # fieldnames holds the CSV header once opened
+
+    def __init__(self, filename):
+        self.source = open_csv_source(filename)
+        self.reader = csv.DictReader(self.source)
+        self.fieldnames = self.reader.fieldnames or []
+
+    def __iter__(self):
+        try:
+            for row_number, row in enumerate(self.reader, 1):
+                yield row_number, row
+        finally:
+            self.close()
+
+    def close(self):
+        self.source.close()
+
+
+def open_input_rows(filename, input_format="auto", list_columns=LIST_COLUMNS, columns=None):
+    # CsvRows, or ColumnarRows for Parquet, Arrow and columnar CSV inputs
+    # columnar inputs only read the given columns, None reads all, CSV rows always hold all
+    input_format = detect_input_format(filename, input_format)
+    if input_format == FORMAT_CSV:
+        return CsvRows(filename)
+    from preconfig_columnar import ColumnarRows
+
+    return ColumnarRows(filename, input_format, list_columns, columns=columns)
@@ -0,0 +1,139 @@
+# Append-only progress journal of preconfig runs
+#
+# Every finished row and every approval is appended to a JSON lines file as it completes, in
+# batches so a large run does not pay a write per row. An interrupted run can be resumed from
+# its journal: rows that already reached their final outcome with the same preconfig are
+# skipped and appliances already approved are not approved again.
+#
+# Records carry a "type":
+#   run      - one per run or resumed run: start time, csv, template, upload settings
+#   row      - row number, hostname, orchestrator, status, phase reached, preconfig id and hash
+#   approval - hostname, orchestrator, preconfig and discovered appliance ids, outcome, and
+#              watch: true for approvals made in --watch mode
+#   summary  - row counts per status and approvals at the end of a run
+# so the journal doubles as the machine-readable report of the run. A journal without a
+# summary at its end belongs to an interrupted run: a new run moves it aside rather than
+# overwriting it, so it can still be resumed.
+
+# Standard library imports
+import json
+import os
+import threading
+import time
+
+RECORD_RUN = "run"
+RECORD_ROW = "row"
+RECORD_APPROVAL = "approval"
+RECORD_SUMMARY = "summary"
+
+APPROVAL_APPROVED = "approved"
+APPROVAL_FAILED = "failed"
+
+# Bytes read from the end of a journal to find its last record
+TAIL_SIZE = 65536
+
+
+def is_unfinished(filename):
+    # True if the journal's last complete record is not a run summary, False if it has no records
+    with open(filename, "rb") as journal_file:
+        journal_file.seek(0, os.SEEK_END)
+        size = journal_file.tell()
+        journal_file.seek(max(0, size - TAIL_SIZE))
+        lines = journal_file.read().splitlines()
+    for line in reversed(lines):
+        try:
+            record = json.loads(line.decode("utf-8"))
+        except ValueError:
+            # Cut off mid-write, or the start of a line before the tail
+            continue
+        return record.get("type") != RECORD_SUMMARY
+    return False
+
+
+class RunJournal:
+    # resume=True appends to an existing journal and loads its progress, otherwise the journal
+    # is started afresh, an unfinished journal is first renamed to rotated
+    # Records are written once batch_size are pending or flush_interval seconds have passed
+
+    def __init__(self, filename, resume=False, batch_size=100, flush_interval=1.0):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.pending = []
+        self.last_flush = time.monotonic()
+        # (orchestrator, hostname) -> last row record, and approved (orchestrator, hostname)
+        self.rows = {}
+        self.approved = set()
+        cut_off = False
+        # Name an interrupted run's journal was moved to, None if none was
+        self.rotated = None
+        if resume and os.path.exists(filename):
+            cut_off = self.load()
+        elif os.path.exists(filename) and is_unfinished(filename):
+            self.rotated = "{0}.{1}".format(filename, time.strftime("%Y%m%d-%H%M%S"))
+            os.replace(filename, self.rotated)
+        self.file = open(filename, "a" if resume else "w")
+        if cut_off:
+            # Start past a line cut off mid-write
+            self.file.write("\n")
+
+    def load(self):
+        # Returns True if the journal ends in a line cut off mid-write
+        line = "\n"
+        with open(self.filename) as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Last line of a journal cut off mid-write
+                    continue
+                key = (record.get("orchestrator", ""), record.get("hostname", ""))
+                if record.get("type") == RECORD_ROW:
+                    self.rows[key] = record
+                elif record.get("type") == RECORD_APPROVAL and record.get("outcome") == APPROVAL_APPROVED:
+                    self.approved.add(key)
+        return not line.endswith("\n")
+
+    def completed(self, orchestrator, hostname, preconfig_hash, statuses):
+        # Previous row record if the row finished with one of statuses for the same preconfig
+        # Resumed rows carry the outcome of the run that completed them
+        record = self.rows.get((orchestrator, hostname))
+        if (
+            record is not None
+            and record.get("outcome", record["status"]) in statuses
+            and record.get("preconfig_hash") == preconfig_hash
+        ):
+            return record
+        return None
+
+    def is_approved(self, orchestrator, hostname):
+        return (orchestrator, hostname) in self.approved
+
+    def write(self, record_type, **fields):
+        record = dict(type=record_type, time=round(time.time(), 3), **fields)
+        line = json.dumps(record, sort_keys=True) + "\n"
+        with self.lock:
+            self.pending.append(line)
+            if len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush_pending()
+
+    def flush(self):
+        with self.lock:
+            self.flush_pending()
+
+    def flush_pending(self):
+        if self.pending and not self.file.closed:
+            self.file.write("".join(self.pending))
+            self.file.flush()
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.flush_pending()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
@@ -0,0 +1,180 @@
+# Per-phase timing of preconfig runs
+#
+# Each observation lands in a fixed set of exponential histogram buckets, so recording is
+# constant time and memory stays bounded however many rows a run has. Percentiles are
+# estimated from the buckets. At the end of a run the metrics are written as JSON and in the
+# Prometheus text format for the node exporter textfile collector.
+
+# Standard library imports
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Bucket upper bounds in seconds, 100us doubling up to ~105s
+BUCKET_BOUNDS = tuple(round(0.0001 * 2 ** i, 4) for i in range(21))
+
+PROMETHEUS_PREFIX = "preconfig"
+
+
+def escape_label(value):
+    # Label value as the Prometheus text format quotes it
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PhaseHistogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        # One count per bucket plus the overflow bucket
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def observe(self, seconds):
+        self.count = self.count + 1
+        self.total = self.total + seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+
+    def percentile(self, fraction):
+        # Linear interpolation within the bucket holding the requested rank,
+        # clamped to the observed min/max
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = BUCKET_BOUNDS[index - 1] if index > 0 else 0.0
+                upper = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / bucket_count
+                return min(max(estimate, self.min), self.max)
+            seen = seen + bucket_count
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_seconds": round(self.total, 6),
+            "mean_seconds": round(self.total / self.count, 6) if self.count else 0.0,
+            "min_seconds": round(self.min or 0.0, 6),
+            "max_seconds": round(self.max or 0.0, 6),
+            "p50_seconds": round(self.percentile(0.50), 6),
+            "p90_seconds": round(self.percentile(0.90), 6),
+            "p99_seconds": round(self.percentile(0.99), 6),
+        }
+
+
+class RunMetrics:
+    # Thread safe collection of phase timings and run level counters
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.counters = {}
+        self.started = time.time()
+        self.start = time.perf_counter()
+
+    def observe(self, phase, seconds):
+        with self.lock:
+            histogram = self.phases.get(phase)
+            if histogram is None:
+                histogram = self.phases[phase] = PhaseHistogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start)
+
+    def timed_iter(self, phase, iterable):
+        # Times producing each item of iterable, e.g. parsing CSV rows
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(phase, time.perf_counter() - start)
+            yield item
+
+    def set_counter(self, name, value, labels=None):
+        with self.lock:
+            self.counters[(name, tuple(sorted((labels or {}).items())))] = value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "started": self.started,
+                "duration_seconds": round(time.perf_counter() - self.start, 6),
+                "phases": dict(
+                    (phase, histogram.summary()) for phase, histogram in self.phases.items()
+                ),
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.counters.items()
+                ],
+            }
+
+    def prometheus_text(self):
+        lines = []
+        metric = PROMETHEUS_PREFIX + "_phase_duration_seconds"
+        lines.append("# HELP {0} Time spent per preconfig run phase".format(metric))
+        lines.append("# TYPE {0} histogram".format(metric))
+        with self.lock:
+            for phase, histogram in sorted(self.phases.items()):
+                phase = escape_label(phase)
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKET_BOUNDS, histogram.buckets):
+                    cumulative = cumulative + bucket_count
+                    lines.append(
+                        '{0}_bucket{{phase="{1}",le="{2}"}} {3}'.format(metric, phase, bound, cumulative)
+                    )
+                lines.append('{0}_bucket{{phase="{1}",le="+Inf"}} {2}'.format(metric, phase, histogram.count))
+                lines.append('{0}_sum{{phase="{1}"}} {2:.6f}'.format(metric, phase, histogram.total))
+                lines.append('{0}_count{{phase="{1}"}} {2}'.format(metric, phase, histogram.count))
+
+            names = sorted(set(name for name, labels in self.counters))
+            for name in names:
+                lines.append("# TYPE {0}_{1} gauge".format(PROMETHEUS_PREFIX, name))
+                for (counter, labels), value in sorted(self.counters.items()):
+                    if counter != name:
+                        continue
+                    label_text = ",".join('{0}="{1}"'.format(key, escape_label(label)) for key, label in labels)
+                    lines.append(
+                        "{0}_{1}{2} {3}".format(
+                            PROMETHEUS_PREFIX, name, "{" + label_text + "}" if label_text else "", value
+                        )
+                    )
+
+        for name, value in (
+            ("run_duration_seconds", "{0:.6f}".format(time.perf_counter() - self.start)),
+            ("run_start_timestamp_seconds", "{0:.3f}".format(self.started)),
+        ):
+            lines.append("# TYPE {0}_{1} gauge".format(PROMETHEUS_PREFIX, name))
+            lines.append("{0}_{1} {2}".format(PROMETHEUS_PREFIX, name, value))
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, filename):
+        write_atomic(filename, json.dumps(self.snapshot(), indent=2))
+
+    def write_prometheus(self, filename):
+        # Written atomically so the textfile collector never reads a partial file
+        write_atomic(filename, self.prometheus_text())
+
+
+def write_atomic(filename, text):
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "w") as output_file:
+        output_file.write(text)
+    os.replace(temp_filename, filename)
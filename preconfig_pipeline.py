@@ -0,0 +1,268 @@
+# Standard library imports
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+# Row result status values, in the order a row progresses through the pipeline
+STATUS_PENDING = "pending"
+STATUS_SKIPPED = "skipped"
+STATUS_UNCHANGED = "unchanged"
+STATUS_INVALID = "invalid"
+STATUS_VALID = "valid"
+STATUS_UPLOADED = "uploaded"
+STATUS_ERROR = "error"
+STATUS_RESUMED = "resumed"
+
+# One byte status codes for RowStatusLog
+STATUS_CODES = (
+    STATUS_PENDING,
+    STATUS_SKIPPED,
+    STATUS_UNCHANGED,
+    STATUS_INVALID,
+    STATUS_VALID,
+    STATUS_UPLOADED,
+    STATUS_ERROR,
+    STATUS_RESUMED,
+)
+
+
+def new_row_result(row_number, hostname):
+    # Per-row record collected by the pipeline and reported in CSV order
+    return {
+        "row_number": row_number,
+        "hostname": hostname,
+        "status": STATUS_PENDING,
+        # Last stage the row entered: render, validate or upload
+        "phase": None,
+        "messages": [],
+    }
+
+
+class RowStatusLog:
+    # Compact record of finished rows for streaming runs:
+    # the hostname and a one byte status code per row instead of the full result dict
+    # Hostnames are not interned: each is unique to its row, so interning shares nothing and
+    # adds an intern table entry per row, whose resizes also copy every string interned before
+
+    def __init__(self):
+        self.hostnames = []
+        self.codes = array("B")
+
+    def append(self, hostname, status):
+        self.hostnames.append(hostname)
+        self.codes.append(STATUS_CODES.index(status))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        for hostname, code in zip(self.hostnames, self.codes):
+            yield hostname, STATUS_CODES[code]
+
+
+class PreconfigPipeline:
+    # Runs render -> validate -> upload for each CSV row
+    #
+    # render_stage(result, row) returns the rendered preconfig text
+    # validate_stage(result, row, preconfig) returns True if the row may continue to upload,
+    #   it may set result["status"] itself (e.g. STATUS_UNCHANGED) to stop the row with that status
+    # upload_stage(result, row, preconfig) posts the preconfig, None to skip the upload stage
+    # report(result) is called once per finished row, always in submission order (CSV order, or
+    #   CSV order within each template group when rows are grouped per template)
+    # finished(result) is called once per row as soon as it finishes, from the thread finishing it
+    # An error raised by report or finished is added to the row's messages and printed, the row
+    #   still returns its in-flight slot
+    # A template passed to submit() is kept as result["template"] for the stages to render with
+    #
+    # With workers == 1 every stage runs inline and each row is reported as soon as it finishes,
+    # matching the original one-row-at-a-time behaviour.
+    # With workers > 1 rendering runs on the calling thread while validation and upload run on
+    # separate bounded thread pools; rows are reported in CSV order once close() is called.
+    #
+    # With streaming=True finished rows are reported as soon as all earlier rows have finished and
+    # are then reduced to a RowStatusLog entry, so memory stays flat however many rows are read.
+    # The in-flight limit also bounds the rows waiting to be reported behind a slow row.
+
+    def __init__(
+        self, render_stage, validate_stage, upload_stage=None, workers=1, report=None, streaming=False, finished=None
+    ):
+        self.render_stage = render_stage
+        self.validate_stage = validate_stage
+        self.upload_stage = upload_stage
+        self.workers = max(1, int(workers))
+        self.report = report
+        self.finished = finished
+        self.streaming = streaming
+        self.results = RowStatusLog() if streaming else []
+        self.submitted = 0
+        if self.workers > 1:
+            # Limit rows in flight so rendering cannot run far ahead of the Orchestrator
+            self.in_flight_limit = self.workers * 2
+            self.in_flight = threading.BoundedSemaphore(self.in_flight_limit)
+            self.validate_pool = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="validate"
+            )
+            self.upload_pool = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="upload"
+            )
+            # Streaming: finished or in-flight rows not yet reported, by submission index
+            self.window = {}
+            self.next_report = 0
+            self.lock = threading.Lock()
+        else:
+            self.in_flight = None
+
+    def skip(self, row_number, hostname, message, status=STATUS_SKIPPED, details=()):
+        # Record a row that will not enter the pipeline (e.g. no hostname), details are further
+        # message lines
+        result = self._new_result(row_number, hostname)
+        result["status"] = status
+        result["messages"].append(message)
+        result["messages"].extend(details)
+        if self.in_flight is not None:
+            self.in_flight.acquire()
+        self._finish(result)
+        return result
+
+    def submit(self, row_number, row, template=None):
+        result = self._new_result(row_number, row["hostname"])
+        result["template"] = template
+
+        if self.in_flight is None:
+            self._run_row(result, row)
+            self._finish(result)
+            return result
+
+        self.in_flight.acquire()
+        try:
+            result["phase"] = "render"
+            preconfig = self.render_stage(result, row)
+        except Exception as e:
+            self._fail(result, "render", e)
+            self._finish(result)
+            return result
+
+        self.validate_pool.submit(self._validate_then_upload, result, row, preconfig)
+        return result
+
+    def close(self):
+        # Wait for all in-flight rows and return the per-row results in CSV order,
+        # a list of result dicts or a RowStatusLog when streaming
+        if self.in_flight is not None:
+            # Every finished (and, when streaming, reported) row returns its slot
+            for slot in range(self.in_flight_limit):
+                self.in_flight.acquire()
+            # Uploads are chained from validation, so only shut the upload pool down afterwards
+            self.validate_pool.shutdown(wait=True)
+            self.upload_pool.shutdown(wait=True)
+            if not self.streaming and self.report is not None:
+                for result in self.results:
+                    self._callback(self.report, result, "report")
+        return self.results
+
+    def summary(self):
+        # Count of rows per status, for the end-of-run console summary
+        summary = {}
+        if self.streaming:
+            for code in self.results.codes:
+                status = STATUS_CODES[code]
+                summary[status] = summary.get(status, 0) + 1
+        else:
+            for result in self.results:
+                summary[result["status"]] = summary.get(result["status"], 0) + 1
+        return summary
+
+    def _new_result(self, row_number, hostname):
+        result = new_row_result(row_number, hostname)
+        result["index"] = self.submitted
+        self.submitted = self.submitted + 1
+        if not self.streaming:
+            self.results.append(result)
+        elif self.in_flight is not None:
+            with self.lock:
+                self.window[result["index"]] = result
+        return result
+
+    def _finish(self, result):
+        # Called once per row, from whichever thread completed it
+        if self.finished is not None:
+            self._callback(self.finished, result, "finished")
+        result["finished"] = True
+        if self.in_flight is None:
+            if self.report is not None:
+                self._callback(self.report, result, "report")
+            if self.streaming:
+                self.results.append(result["hostname"], result["status"])
+            return
+
+        if not self.streaming:
+            self.in_flight.release()
+            return
+
+        # Report the run of finished rows at the head of the window, in CSV order
+        with self.lock:
+            while self.window.get(self.next_report, {}).get("finished"):
+                ready = self.window.pop(self.next_report)
+                self.next_report = self.next_report + 1
+                try:
+                    if self.report is not None:
+                        self._callback(self.report, ready, "report")
+                    self.results.append(ready["hostname"], ready["status"])
+                finally:
+                    self.in_flight.release()
+
+    def _callback(self, callback, result, name):
+        # Runs a report or finished callback, e.g. a journal or report file write, recording its
+        # error on the row rather than raising it in a pool thread
+        try:
+            callback(result)
+        except Exception as e:
+            message = "{0} callback failed: {1}".format(name, e)
+            result["messages"].append(message)
+            print("Row {0} ({1}): {2}".format(result["row_number"], result["hostname"], message))
+
+    def _run_row(self, result, row):
+        try:
+            result["phase"] = "render"
+            preconfig = self.render_stage(result, row)
+        except Exception as e:
+            self._fail(result, "render", e)
+            return
+        if self._validate(result, row, preconfig):
+            self._upload(result, row, preconfig)
+
+    def _validate_then_upload(self, result, row, preconfig):
+        if not (self._validate(result, row, preconfig) and self.upload_stage is not None):
+            self._finish(result)
+            return
+        # Chain the upload rather than wait for it, so this validate worker moves on to the next
+        # row; the row keeps its in-flight slot until the upload has finished
+        upload = self.upload_pool.submit(self._upload, result, row, preconfig)
+        upload.add_done_callback(lambda upload: self._finish(result))
+
+    def _validate(self, result, row, preconfig):
+        result["phase"] = "validate"
+        try:
+            valid = self.validate_stage(result, row, preconfig)
+        except Exception as e:
+            self._fail(result, "validate", e)
+            return False
+        if result["status"] == STATUS_PENDING:
+            result["status"] = STATUS_VALID if valid else STATUS_INVALID
+        return valid
+
+    def _upload(self, result, row, preconfig):
+        if self.upload_stage is None:
+            return
+        result["phase"] = "upload"
+        try:
+            self.upload_stage(result, row, preconfig)
+        except Exception as e:
+            self._fail(result, "upload", e)
+            return
+        if result["status"] == STATUS_VALID:
+            result["status"] = STATUS_UPLOADED
+
+    def _fail(self, result, stage, error):
+        result["status"] = STATUS_ERROR
+        result["messages"].append("{0} failed: {1}".format(stage, error))
@@ -0,0 +1,169 @@
+# Checking of template group and overlay references against the Orchestrator
+#
+# When the inventory can be read twice (a file rather than stdin), a pre-pass over the whole
+# input collects the distinct template group and overlay names each Orchestrator's rows
+# reference, before any per-row request. The names of all template groups and business intent
+# overlays are fetched once per Orchestrator and every unknown name is reported up front with the
+# number of rows using it. Every row's templateGroups and businessIntentOverlays are then checked
+# against the fetched names locally, so a misspelled name fails its rows without a validation
+# round-trip each. Unknown names are counted across the run for one summary line per name.
+#
+# A listing that cannot be retrieved leaves its column unchecked rather than failing the rows.
+
+# Standard library imports
+import difflib
+import threading
+
+# Third party imports
+import requests
+
+# Local application imports
+from preconfig_inputs import comma_separate
+
+REFERENCE_COLUMNS = (
+    ("templateGroups", "template group"),
+    ("businessIntentOverlays", "overlay"),
+)
+
+# Row numbers listed per unknown name in the up-front report
+EXAMPLE_ROWS = 5
+
+
+def entry_names(entries):
+    # Names from an Orchestrator listing, None unless it is a list of entries, e.g. False or an
+    # error body from a failed request
+    if not isinstance(entries, list):
+        return None
+    names = set()
+    for entry in entries:
+        if not isinstance(entry, dict):
+            return None
+        if entry.get("name"):
+            names.add(entry["name"])
+    return names
+
+
+def fetch_names(client, method):
+    # Names from calling a client's listing method, None if the client lacks the call or the
+    # listing could not be retrieved
+    listing = getattr(client, method, None)
+    if listing is None:
+        return None
+    try:
+        return entry_names(listing())
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+
+def split_names(value):
+    # Names of a reference column, split by the input reader already or still comma separated
+    if isinstance(value, list):
+        return value
+    if isinstance(value, str):
+        return comma_separate(value)
+    return []
+
+
+def collect_references(rows, route=None):
+    # Pre-pass over (row_number, row) pairs: the names each routing key's rows reference
+    # route(row) is the row's routing key, all rows share the key "" without it
+    # Returns {key: {(column, name): [rows, [first EXAMPLE_ROWS row numbers]]}}, only distinct
+    # names are kept however many rows are read
+    references = {}
+    for row_number, row in rows:
+        if not row.get("hostname"):
+            continue
+        key = route(row) if route is not None else ""
+        referenced = references.setdefault(key, {})
+        for column, kind in REFERENCE_COLUMNS:
+            for name in set(split_names(row.get(column))):
+                if not name:
+                    continue
+                entry = referenced.get((column, name))
+                if entry is None:
+                    entry = referenced[(column, name)] = [0, []]
+                entry[0] = entry[0] + 1
+                if len(entry[1]) < EXAMPLE_ROWS:
+                    entry[1].append(row_number)
+    return references
+
+
+class ReferenceIndex:
+    # template_groups / overlays are the names known to Orchestrator, None skips checking that
+    # column (listing not retrieved)
+    # referenced is this Orchestrator's part of collect_references, None without a pre-pass
+
+    def __init__(self, template_groups, overlays, referenced=None):
+        self.names = {
+            "templateGroups": template_groups,
+            "businessIntentOverlays": overlays,
+        }
+        self.referenced = referenced
+        self.lock = threading.Lock()
+        # (column, name) -> number of rows referencing the unknown name
+        self.unknown = {}
+        if referenced is not None:
+            # Counted by the pre-pass, rows are not counted again as they are checked
+            for (column, name), (rows, row_numbers) in referenced.items():
+                if self.names[column] is not None and name not in self.names[column]:
+                    self.unknown[(column, name)] = rows
+
+    def unchecked(self):
+        # Kinds of names not checked as their listing could not be retrieved
+        return [kind for column, kind in REFERENCE_COLUMNS if self.names[column] is None]
+
+    def unknown_references(self):
+        # Pre-pass report: (kind, name, rows, first row numbers) for every unknown name,
+        # most rows first, empty without a pre-pass
+        if self.referenced is None:
+            return []
+        kinds = dict(REFERENCE_COLUMNS)
+        return [
+            (kinds[column], name, rows, self.referenced[(column, name)][1])
+            for (column, name), rows in sorted(self.unknown.items(), key=lambda item: (-item[1], item[0]))
+        ]
+
+    def check(self, row):
+        # Messages for each unknown reference of a row whose list columns are split already
+        messages = []
+        for column, kind in REFERENCE_COLUMNS:
+            known = self.names[column]
+            if known is None or not isinstance(row.get(column), list):
+                continue
+            for name in row[column]:
+                # Empty names are left to local validation
+                if not name or name in known:
+                    continue
+                if self.referenced is None:
+                    with self.lock:
+                        self.unknown[(column, name)] = self.unknown.get((column, name), 0) + 1
+                close = difflib.get_close_matches(name, known, n=1)
+                messages.append(
+                    "Unknown {0} {1}{2}".format(
+                        kind, name, ", did you mean {0}?".format(close[0]) if close else ""
+                    )
+                )
+        return messages
+
+    def summary(self):
+        # List of (kind, name, rows) for every unknown name referenced, most rows first
+        with self.lock:
+            unknown = list(self.unknown.items())
+        kinds = dict(REFERENCE_COLUMNS)
+        return [
+            (kinds[column], name, rows)
+            for (column, name), rows in sorted(unknown, key=lambda item: (-item[1], item[0]))
+        ]
+
+
+def merge_summaries(summaries):
+    # Unknown names across Orchestrators: (kind, name, rows) summed over the summaries given,
+    # most rows first
+    merged = {}
+    for summary in summaries:
+        for kind, name, rows in summary:
+            merged[(kind, name)] = merged.get((kind, name), 0) + rows
+    return [
+        (kind, name, rows)
+        for (kind, name), rows in sorted(merged.items(), key=lambda item: (-item[1], item[0]))
+    ]
@@ -0,0 +1,124 @@
+# Render-only batch mode across a process pool
+#
+# CSV rows are grouped per template and split into chunks of a single template, rendered by
+# worker processes that each load a template once and write their *_preconfig.yml files directly,
+# leaving unchanged files untouched.
+# No Orchestrator calls are made.
+# Output is deterministic: the first row for a hostname is rendered and later duplicates are
+# reported as errors, regardless of how chunks are scheduled.
+
+# Standard library imports
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Local application imports
+from preconfig_inputs import split_list_columns
+from preconfig_templates import TemplateCache, group_rows, load_environment
+from preconfig_writer import write_if_changed
+
+# Per-process templates, set by init_render_worker
+worker_templates = None
+worker_output_directory = None
+
+
+def init_render_worker(template_directory, max_templates, cache_directory, output_directory):
+    global worker_templates, worker_output_directory
+    worker_templates = TemplateCache(
+        load_environment(template_directory, cache_directory), max_templates, template_directory
+    )
+    worker_output_directory = output_directory
+
+
+def render_chunk(chunk):
+    # Render and write (template name, [(row_number, row)]), returns
+    # (rows written, [(row_number, hostname, error)])
+    template_name, rows = chunk
+    written = 0
+    errors = []
+    try:
+        entry = worker_templates.get(template_name)
+    except Exception as e:
+        return 0, [
+            (row_number, row["hostname"], "template {0}: {1}".format(template_name, e)) for row_number, row in rows
+        ]
+    for row_number, row in rows:
+        try:
+            preconfig = entry["template"].render(data=split_list_columns(row, entry["list_columns"]))
+            output_filename = "{}_preconfig.yml".format(row["hostname"])
+            # Files already holding the same preconfig are left untouched
+            write_if_changed(os.path.join(worker_output_directory, output_filename), preconfig.encode("utf-8"))
+            written = written + 1
+        except Exception as e:
+            errors.append((row_number, row["hostname"], str(e)))
+    return written, errors
+
+
+def render_only(
+    rows,
+    template_directory,
+    selector,
+    output_directory,
+    cache_directory=None,
+    processes=None,
+    chunk_size=500,
+    max_templates=32,
+):
+    # rows yields CSV row dicts, rendered with the template selector picks for each
+    # Returns dict with rows written and the merged error list sorted by row number
+    processes = processes or os.cpu_count() or 1
+    initargs = (template_directory, max_templates, cache_directory, output_directory)
+
+    seen = {}
+    errors = []
+    written = 0
+
+    def renderable():
+        for row_number, row in enumerate(rows, 1):
+            hostname = row["hostname"]
+            if hostname == "":
+                errors.append((row_number, hostname, "no hostname: no preconfig created"))
+                continue
+            if hostname in seen:
+                errors.append(
+                    (row_number, hostname, "duplicate hostname, already rendered from row {0}".format(seen[hostname]))
+                )
+                continue
+            seen[hostname] = row_number
+            yield row_number, row
+
+    def chunks():
+        # Each chunk holds rows of one template, so a worker looks it up once per chunk
+        for template_name, group in group_rows(renderable(), selector, chunk_size * processes):
+            for start in range(0, len(group), chunk_size):
+                yield template_name, group[start : start + chunk_size]
+
+    # Worker processes are forked so the calling script is not re-imported in each child
+    if processes == 1 or "fork" not in multiprocessing.get_all_start_methods():
+        init_render_worker(*initargs)
+        for chunk in chunks():
+            chunk_written, chunk_errors = render_chunk(chunk)
+            written = written + chunk_written
+            errors.extend(chunk_errors)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=init_render_worker,
+            initargs=initargs,
+        ) as executor:
+            # Keep a bounded number of chunks queued so large inputs are not read up front
+            pending = []
+            for chunk in chunks():
+                pending.append(executor.submit(render_chunk, chunk))
+                if len(pending) >= processes * 2:
+                    chunk_written, chunk_errors = pending.pop(0).result()
+                    written = written + chunk_written
+                    errors.extend(chunk_errors)
+            for future in pending:
+                chunk_written, chunk_errors = future.result()
+                written = written + chunk_written
+                errors.extend(chunk_errors)
+
+    errors.sort()
+    return {"written": written, "errors": errors}
@@ -0,0 +1,330 @@
+# Local pre-flight validation of rendered preconfigs
+#
+# The rendered YAML is parsed and checked against a schema of the preconfig sections the
+# template produces (appliance info, deployment interfaces, DHCP, BGP, OSPF, template groups,
+# overlays and static routes), so obviously broken preconfigs are rejected before any
+# Orchestrator round-trip. Orchestrator's validate call remains the authority: passing these
+# checks does not make a preconfig valid, failing them means Orchestrator would reject it.
+
+# Standard library imports
+import ipaddress
+
+# Third party imports
+import yaml
+
+# libyaml loader when available, several times faster than the pure Python loader
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Largest 4 byte BGP AS number
+MAX_ASN = 4294967295
+
+
+def is_empty(value):
+    return value is None or (isinstance(value, str) and value.strip() == "")
+
+
+# Value checks return an error message or None
+
+
+def ip_address(value):
+    try:
+        ipaddress.ip_address(str(value))
+    except ValueError:
+        return "{0} is not an IP address".format(value)
+
+
+def interface_cidr(value):
+    # Interface address with prefix length, e.g. 10.1.1.1/24
+    text = str(value)
+    if "/" not in text:
+        return "{0} is not an address/prefix length".format(value)
+    try:
+        ipaddress.ip_interface(text)
+    except ValueError:
+        return "{0} is not an address/prefix length".format(value)
+
+
+def network_cidr(value):
+    # Network with no host bits set, e.g. 10.1.1.0/24
+    try:
+        ipaddress.ip_network(str(value))
+    except ValueError:
+        return "{0} is not a network/prefix length".format(value)
+
+
+def integer(value):
+    if isinstance(value, bool):
+        return "{0} is not a number".format(value)
+    try:
+        int(str(value))
+    except ValueError:
+        return "{0} is not a number".format(value)
+
+
+def asn(value):
+    if integer(value) is not None or not 1 <= int(str(value)) <= MAX_ASN:
+        return "{0} is not an AS number (1-{1})".format(value, MAX_ASN)
+
+
+def area_id(value):
+    # OSPF area as a number or dotted quad
+    if integer(value) is not None and ip_address(value) is not None:
+        return "{0} is not an OSPF area".format(value)
+
+
+def one_of(*choices):
+    def check(value):
+        if value not in choices:
+            return "{0} is not one of {1}".format(value, ", ".join(choices))
+
+    return check
+
+
+def field(check=None, required=False, fields=None, items=None, rules=()):
+    # Schema node: check is applied to scalar values, fields describes a mapping, items the
+    # entries of a list, rules(value) are cross-field checks returning (key, message) pairs
+    return {
+        "check": check,
+        "required": required,
+        "fields": fields,
+        "items": items,
+        "rules": rules,
+    }
+
+
+# Cross-field rules
+
+
+def deployment_interface_rules(interface):
+    errors = []
+    address = interface.get("ipAddressMask")
+    if interface.get("interfaceType") == "lan" and is_empty(address):
+        errors.append(("ipAddressMask", "missing on LAN interface"))
+    if is_empty(address) or interface_cidr(address) is not None:
+        return errors
+    next_hop = interface.get("nextHop")
+    if interface.get("interfaceType") == "wan" and is_empty(next_hop):
+        errors.append(("nextHop", "missing on WAN interface with a static address"))
+    elif not is_empty(next_hop) and ip_address(next_hop) is None:
+        network = ipaddress.ip_interface(str(address)).network
+        if ipaddress.ip_address(str(next_hop)) not in network:
+            errors.append(("nextHop", "{0} is not in {1}".format(next_hop, network)))
+    return errors
+
+
+def dhcp_rules(dhcp):
+    errors = []
+    if dhcp.get("dhcpType") == "relay":
+        if not dhcp.get("dhcpProxyServers"):
+            errors.append(("dhcpProxyServers", "missing on DHCP relay"))
+        return errors
+    if dhcp.get("dhcpType") != "server":
+        return errors
+
+    for key in ("dhcpAddressMask", "startIpAddress", "endIpAddress"):
+        if is_empty(dhcp.get(key)):
+            errors.append((key, "missing on DHCP server"))
+    if errors or network_cidr(dhcp["dhcpAddressMask"]) is not None:
+        return errors
+    network = ipaddress.ip_network(str(dhcp["dhcpAddressMask"]))
+    for key in ("startIpAddress", "endIpAddress", "gatewayIpAddress"):
+        value = dhcp.get(key)
+        if not is_empty(value) and ip_address(value) is None:
+            if ipaddress.ip_address(str(value)) not in network:
+                errors.append((key, "{0} is not in {1}".format(value, network)))
+    start = dhcp["startIpAddress"]
+    end = dhcp["endIpAddress"]
+    if ip_address(start) is None and ip_address(end) is None:
+        first = ipaddress.ip_address(str(start))
+        last = ipaddress.ip_address(str(end))
+        # Addresses of different versions do not compare
+        if first.version != last.version:
+            errors.append(
+                ("endIpAddress", "{0} is not the same IP version as startIpAddress {1}".format(end, start))
+            )
+        elif first > last:
+            errors.append(("startIpAddress", "{0} is after endIpAddress {1}".format(start, end)))
+    maximum = dhcp.get("maximumLease")
+    default = dhcp.get("defaultLease")
+    if not is_empty(maximum) and not is_empty(default):
+        if integer(maximum) is None and integer(default) is None and int(default) > int(maximum):
+            errors.append(("defaultLease", "{0} is above maximumLease {1}".format(default, maximum)))
+    return errors
+
+
+def preconfig_rules(preconfig):
+    # DHCP and OSPF interfaces must be deployment interfaces
+    errors = []
+    deployment = preconfig.get("deploymentInfo") or {}
+    names = set(
+        str(interface.get("interfaceName"))
+        for interface in deployment.get("deploymentInterfaces") or []
+        if isinstance(interface, dict)
+    )
+    for index, dhcp in enumerate(deployment.get("dhcpInfo") or []):
+        if isinstance(dhcp, dict) and not is_empty(dhcp.get("dhcpInterfaceName")):
+            if str(dhcp["dhcpInterfaceName"]) not in names:
+                errors.append(
+                    (
+                        "deploymentInfo.dhcpInfo[{0}].dhcpInterfaceName".format(index),
+                        "{0} is not a deployment interface".format(dhcp["dhcpInterfaceName"]),
+                    )
+                )
+    ospf = preconfig.get("ospfSystemConfig") or {}
+    for index, interface in enumerate(ospf.get("interfaces") or []):
+        if isinstance(interface, dict) and not is_empty(interface.get("interfaceName")):
+            if str(interface["interfaceName"]) not in names:
+                errors.append(
+                    (
+                        "ospfSystemConfig.interfaces[{0}].interfaceName".format(index),
+                        "{0} is not a deployment interface".format(interface["interfaceName"]),
+                    )
+                )
+    return errors
+
+
+PRECONFIG_SCHEMA = field(
+    required=True,
+    rules=(preconfig_rules,),
+    fields={
+        "applianceInfo": field(
+            required=True,
+            fields={
+                "hostname": field(required=True),
+                "networkRole": field(check=one_of("hub", "non-hub")),
+            },
+        ),
+        # A blank list column renders an empty entry, left for Orchestrator to accept or reject
+        "templateGroups": field(
+            fields={"groups": field(items=field())},
+        ),
+        "businessIntentOverlays": field(
+            fields={"overlays": field(items=field())},
+        ),
+        "deploymentInfo": field(
+            required=True,
+            fields={
+                "deploymentMode": field(
+                    required=True, check=one_of("inline-router", "router", "bridge", "server")
+                ),
+                "totalOutboundBandwidth": field(check=integer),
+                "totalInboundBandwidth": field(check=integer),
+                "deploymentInterfaces": field(
+                    required=True,
+                    items=field(
+                        rules=(deployment_interface_rules,),
+                        fields={
+                            "interfaceName": field(required=True),
+                            "interfaceType": field(required=True, check=one_of("lan", "wan")),
+                            "ipAddressMask": field(check=interface_cidr),
+                            "nextHop": field(check=ip_address),
+                            "outboundMaxBandwidth": field(check=integer),
+                            "inboundMaxBandwidth": field(check=integer),
+                        },
+                    ),
+                ),
+                "dhcpInfo": field(
+                    items=field(
+                        rules=(dhcp_rules,),
+                        fields={
+                            "dhcpInterfaceName": field(required=True),
+                            "dhcpType": field(required=True, check=one_of("server", "relay", "none")),
+                            "dhcpAddressMask": field(check=network_cidr),
+                            "startIpAddress": field(check=ip_address),
+                            "endIpAddress": field(check=ip_address),
+                            "gatewayIpAddress": field(check=ip_address),
+                            "dhcpProxyServers": field(items=field(required=True, check=ip_address)),
+                            "dnsServers": field(items=field(check=ip_address)),
+                            "ntpServers": field(items=field(check=ip_address)),
+                            "maximumLease": field(check=integer),
+                            "defaultLease": field(check=integer),
+                        },
+                    ),
+                ),
+            },
+        ),
+        "localRoutes": field(
+            fields={
+                "routes": field(
+                    items=field(
+                        fields={
+                            "routeIpSubnet": field(required=True, check=network_cidr),
+                            "nextHop": field(required=True, check=ip_address),
+                            "metric": field(check=integer),
+                        },
+                    ),
+                ),
+            },
+        ),
+        "bgpSystemConfig": field(
+            fields={
+                "asn": field(required=True, check=asn),
+                "routerId": field(required=True, check=ip_address),
+                "neighbors": field(
+                    items=field(
+                        fields={
+                            "peerIpAddress": field(required=True, check=ip_address),
+                            "peerAsn": field(required=True, check=asn),
+                        },
+                    ),
+                ),
+            },
+        ),
+        "ospfSystemConfig": field(
+            fields={
+                "routerId": field(check=ip_address),
+                "interfaces": field(
+                    items=field(
+                        fields={
+                            "interfaceName": field(required=True),
+                            "areaId": field(required=True, check=area_id),
+                            "cost": field(check=integer),
+                            "priority": field(check=integer),
+                        },
+                    ),
+                ),
+            },
+        ),
+    },
+)
+
+
+def check_node(value, schema, path, errors):
+    if is_empty(value):
+        if schema["required"]:
+            errors.append("{0}: missing".format(path or "preconfig"))
+        return
+
+    if schema["fields"] is not None:
+        if not isinstance(value, dict):
+            errors.append("{0}: expected a mapping".format(path or "preconfig"))
+            return
+        for key, child in schema["fields"].items():
+            check_node(value.get(key), child, join_path(path, key), errors)
+        for key, message in (error for rule in schema["rules"] for error in rule(value)):
+            errors.append("{0}: {1}".format(join_path(path, key), message))
+    elif schema["items"] is not None:
+        if not isinstance(value, list):
+            errors.append("{0}: expected a list".format(path))
+            return
+        for index, item in enumerate(value):
+            check_node(item, schema["items"], "{0}[{1}]".format(path, index), errors)
+    elif schema["check"] is not None:
+        message = schema["check"](value)
+        if message is not None:
+            errors.append("{0}: {1}".format(path, message))
+
+
+def join_path(path, key):
+    return "{0}.{1}".format(path, key) if path else key
+
+
+def validate_preconfig_yaml(preconfig):
+    # List of "path: problem" strings for the rendered preconfig text, empty if it passes
+    try:
+        document = yaml.load(preconfig, Loader=SafeLoader)
+    except yaml.YAMLError as e:
+        return ["YAML does not parse: {0}".format(str(e).replace("\n", " "))]
+    errors = []
+    check_node(document, PRECONFIG_SCHEMA, "", errors)
+    return errors
@@ -0,0 +1,91 @@
+# Persistent per-hostname state for incremental runs
+#
+# Records a hash of each rendered preconfig, the hash of the template it was rendered from and
+# the outcome of the last validation/upload, so later runs can skip rows that have not changed.
+# State is kept per Orchestrator URL, so a host routed to a different Orchestrator is processed
+# there rather than skipped.
+
+# Standard library imports
+import datetime
+import hashlib
+import json
+import os
+import threading
+
+# Outcomes that allow a row to be skipped, depending on whether the run uploads
+SKIP_OUTCOMES_UPLOAD = ("uploaded",)
+SKIP_OUTCOMES_VALIDATE = ("valid", "uploaded")
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_file(filename):
+    sha = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def preconfig_hash(preconfig, serial_number, auto_apply):
+    # Serial number and auto-apply flag are posted alongside the YAML, so changes to them count too
+    return hash_text("{0}\n{1}\n{2}".format(serial_number, auto_apply, preconfig))
+
+
+class PreconfigStateStore:
+    # JSON file of Orchestrator URL -> hostname -> {"preconfig_hash", "template_hash", "outcome",
+    # "updated"}
+    # State files from before it was kept per Orchestrator are ignored, their rows are processed
+    # once more
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.orchestrators = {}
+        if os.path.exists(filename):
+            with open(filename) as state_file:
+                self.orchestrators = json.load(state_file).get("orchestrators", {})
+
+    def is_unchanged(self, orchestrator, hostname, preconfig_hash, template_hash, upload):
+        # True if the last run for hostname on orchestrator used the same preconfig and template
+        # and succeeded far enough for this run (uploaded when uploading, otherwise at least
+        # validated)
+        with self.lock:
+            entry = self.orchestrators.get(orchestrator, {}).get(hostname)
+        if entry is None:
+            return False
+        outcomes = SKIP_OUTCOMES_UPLOAD if upload else SKIP_OUTCOMES_VALIDATE
+        return (
+            entry["preconfig_hash"] == preconfig_hash
+            and entry["template_hash"] == template_hash
+            and entry["outcome"] in outcomes
+        )
+
+    def moved_from(self, orchestrator, hostname):
+        # Orchestrators with state for hostname when orchestrator has none, i.e. the host has
+        # been routed to orchestrator since it was last processed
+        with self.lock:
+            if hostname in self.orchestrators.get(orchestrator, {}):
+                return []
+            return sorted(
+                other for other, hosts in self.orchestrators.items() if hostname in hosts
+            )
+
+    def record(self, orchestrator, hostname, preconfig_hash, template_hash, outcome):
+        with self.lock:
+            self.orchestrators.setdefault(orchestrator, {})[hostname] = {
+                "preconfig_hash": preconfig_hash,
+                "template_hash": template_hash,
+                "outcome": outcome,
+                "updated": datetime.datetime.now().isoformat(timespec="seconds"),
+            }
+
+    def save(self):
+        # Write to a temporary file and rename so an interrupted save keeps the previous state
+        temp_filename = self.filename + ".tmp"
+        with self.lock:
+            with open(temp_filename, "w") as state_file:
+                json.dump({"orchestrators": self.orchestrators}, state_file, indent=1, sort_keys=True)
+        os.replace(temp_filename, self.filename)
@@ -0,0 +1,90 @@
+# Diff-aware sync of rendered preconfigs against those already on the Orchestrator
+#
+# Existing preconfigs are listed once (with configData) and only a hash of each one's YAML is
+# kept, with the fields needed to update it. A rendered preconfig with the same YAML text is
+# unchanged. Otherwise the existing YAML is fetched again and compared after parsing both, so
+# whitespace, comments and key order do not count as changes.
+
+# Standard library imports
+import base64
+import hashlib
+import threading
+
+# Third party imports
+import yaml
+
+# libyaml loader when available, several times faster than the pure Python loader
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+SYNC_CREATE = "created"
+SYNC_UPDATE = "updated"
+SYNC_UNCHANGED = "unchanged"
+
+
+def normalize_preconfig(yaml_text):
+    # Parsed YAML for comparison, None if the text does not parse
+    try:
+        return yaml.load(yaml_text, Loader=SafeLoader)
+    except yaml.YAMLError:
+        return None
+
+
+def hash_yaml(yaml_text):
+    return hashlib.sha256(yaml_text.encode("utf-8")).hexdigest()
+
+
+def decode_config_data(config_data):
+    if not config_data:
+        return ""
+    return base64.b64decode(config_data).decode("utf-8", errors="replace")
+
+
+class PreconfigSync:
+    # existing_preconfigs is the JSON list from get_all_preconfig(filter=None), or the iterator
+    # from iter_all_preconfig(filter=None)
+    # get_config_data(preconfig_id) returns the base64 configData of an existing preconfig, or
+    # None if it could not be fetched; without it a differing YAML text counts as a change
+
+    def __init__(self, existing_preconfigs, get_config_data=None):
+        self.lock = threading.Lock()
+        self.get_config_data = get_config_data
+        self.counts = {SYNC_CREATE: 0, SYNC_UPDATE: 0, SYNC_UNCHANGED: 0}
+        # Preconfig name -> existing preconfig without its configData, the last one wins as in
+        # the approval matcher
+        self.existing = {}
+        for preconfig in existing_preconfigs:
+            config_data = preconfig.get("configData")
+            preconfig = dict((key, value) for key, value in preconfig.items() if key != "configData")
+            preconfig["config_hash"] = hash_yaml(decode_config_data(config_data))
+            self.existing[preconfig["name"]] = preconfig
+
+    def compare(self, hostname, serial_number, preconfig, auto_apply):
+        # Returns (action, existing preconfig or None) for the rendered preconfig
+        existing = self.existing.get(hostname)
+        if existing is None:
+            return SYNC_CREATE, None
+        if existing.get("serialNum", "") != serial_number or existing.get("autoApply") != auto_apply:
+            return SYNC_UPDATE, existing
+        if hash_yaml(preconfig) == existing["config_hash"]:
+            return SYNC_UNCHANGED, existing
+        if self.get_config_data is None:
+            return SYNC_UPDATE, existing
+
+        config_data = self.get_config_data(existing["id"])
+        if config_data is None:
+            return SYNC_UPDATE, existing
+        rendered = normalize_preconfig(preconfig)
+        if rendered is not None and rendered == normalize_preconfig(decode_config_data(config_data)):
+            return SYNC_UNCHANGED, existing
+        return SYNC_UPDATE, existing
+
+    def record(self, action):
+        with self.lock:
+            self.counts[action] = self.counts[action] + 1
+
+    def summary(self):
+        return "{0} created, {1} updated, {2} unchanged".format(
+            self.counts[SYNC_CREATE],
+            self.counts[SYNC_UPDATE],
+            self.counts[SYNC_UNCHANGED],
+        )
@@ -0,0 +1,180 @@
+# Jinja2 environment for preconfig templates
+#
+# Compiled templates are kept in a persistent bytecode cache directory so later runs skip
+# recompiling the template source. Jinja2 keys each cache entry on a checksum of the template
+# source, so an edited template is recompiled automatically.
+#
+# A run can render with several templates, e.g. one for hubs, one for branches and one for lab
+# sites. TemplateSelector picks the template for a row by rule or by a column, and TemplateCache
+# keeps a bounded LRU of loaded templates with what the run needs alongside each: the column
+# schema, the list columns and the template hash for incremental runs. Rows are grouped per
+# template (see group_rows) so each template is looked up once per group rather than per row.
+
+# Standard library imports
+import os
+import threading
+from collections import OrderedDict
+
+# Third party imports
+import yaml
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+# Local application imports
+from preconfig_columns import compile_column_schema
+from preconfig_inputs import LIST_COLUMNS
+from preconfig_state import hash_file
+
+TEMPLATE_DIRECTORY = "templates"
+TEMPLATE_CACHE_DIRECTORY = ".template_cache"
+DEFAULT_TEMPLATE = "ec_preconfig_template.jinja2"
+
+
+def load_environment(template_directory=TEMPLATE_DIRECTORY, cache_directory=TEMPLATE_CACHE_DIRECTORY):
+    # cache_directory None or "" disables the bytecode cache
+    bytecode_cache = None
+    if cache_directory:
+        if not os.path.exists(cache_directory):
+            os.makedirs(cache_directory)
+        bytecode_cache = FileSystemBytecodeCache(cache_directory)
+    return Environment(
+        loader=FileSystemLoader(template_directory), bytecode_cache=bytecode_cache
+    )
+
+
+def load_template_rules(filename):
+    # YAML or JSON template selection rules:
+    #   column: networkRole            column whose value selects the template
+    #   templates: {hub: hub.jinja2}   column value -> template, without it the value is the template
+    #   rules:                         checked first, the first rule whose columns all match wins
+    #     - match: {site_type: [lab, test]}
+    #       template: lab.jinja2
+    #   default: branch.jinja2         template for rows nothing selects, --jinja otherwise
+    with open(filename) as rules_file:
+        return yaml.safe_load(rules_file) or {}
+
+
+class TemplateSelector:
+    # Picks the template name for a row, the default when no rule or column value selects one
+
+    def __init__(self, default, column=None, templates=None, rules=()):
+        self.default = default
+        self.column = column
+        self.templates = dict((str(value), template) for value, template in (templates or {}).items())
+        # Rules as (((column, allowed values), ...), template)
+        self.rules = tuple(
+            (
+                tuple(
+                    (name, frozenset(str(value) for value in (values if isinstance(values, list) else [values])))
+                    for name, values in rule["match"].items()
+                ),
+                rule["template"],
+            )
+            for rule in rules
+        )
+
+    @classmethod
+    def from_rules(cls, default, rules, column=None):
+        # rules as loaded by load_template_rules, column overrides the rules' column
+        return cls(
+            rules.get("default") or default,
+            column or rules.get("column"),
+            rules.get("templates"),
+            rules.get("rules") or (),
+        )
+
+    def open_ended(self):
+        # True when column values name templates directly, so not every template is known up front
+        return self.column is not None and not self.templates
+
+    def known_templates(self):
+        # Templates the selector can pick, in a stable order, default first
+        names = [self.default]
+        for template in [rule[1] for rule in self.rules] + list(self.templates.values()):
+            if template not in names:
+                names.append(template)
+        return names
+
+    def columns(self):
+        # Row columns the selector reads
+        names = set(name for match, template in self.rules for name, values in match)
+        if self.column is not None:
+            names.add(self.column)
+        return names
+
+    def select(self, row):
+        for match, template in self.rules:
+            if all((row.get(name) or "").strip() in values for name, values in match):
+                return template
+        if self.column is not None:
+            value = (row.get(self.column) or "").strip()
+            if value:
+                if not self.templates:
+                    return value
+                return self.templates.get(value, self.default)
+        return self.default
+
+
+class TemplateCache:
+    # Bounded LRU of loaded templates, name -> {"name", "template", "schema", "list_columns", "hash"}
+    # An evicted template is loaded again from the bytecode cache when the environment has one,
+    # its column schema is compiled again from the template source
+
+    def __init__(self, environment, max_templates=32, template_directory=TEMPLATE_DIRECTORY):
+        self.environment = environment
+        self.max_templates = max(1, int(max_templates))
+        self.template_directory = template_directory
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, name):
+        # Raises jinja2.TemplateError (e.g. TemplateNotFound) for a template that cannot be loaded
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None:
+                self.entries.move_to_end(name)
+                return entry
+        entry = self.load(name)
+        with self.lock:
+            self.entries[name] = entry
+            self.entries.move_to_end(name)
+            while len(self.entries) > self.max_templates:
+                self.entries.popitem(last=False)
+                self.evictions = self.evictions + 1
+        return entry
+
+    def load(self, name):
+        template = self.environment.get_template(name)
+        schema = compile_column_schema(self.environment, name)
+        self.loads = self.loads + 1
+        return {
+            "name": name,
+            "template": template,
+            "schema": schema,
+            "list_columns": LIST_COLUMNS
+            + tuple(column for column in schema.list_columns if column not in LIST_COLUMNS),
+            "hash": hash_file(os.path.join(self.template_directory, name)),
+        }
+
+    def summary(self):
+        return {"loaded": self.loads, "evictions": self.evictions, "cached": len(self.entries)}
+
+
+def group_rows(rows, selector, window=1):
+    # Yields (template name, [(row_number, row), ...]) for rows read as (row_number, row)
+    # Up to window rows are read at a time and handed on a template at a time, in the order each
+    # template first appears, so only a window of rows is ever held
+    # Rows are reordered within a window, window=1 hands each row on by itself in input order
+    groups = OrderedDict()
+    buffered = 0
+    for row_number, row in rows:
+        groups.setdefault(selector.select(row), []).append((row_number, row))
+        buffered = buffered + 1
+        if buffered >= window:
+            for item in groups.items():
+                yield item
+            groups = OrderedDict()
+            buffered = 0
+    for item in groups.items():
+        yield item
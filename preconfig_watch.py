@@ -0,0 +1,183 @@
+# Watch mode: approve appliances for CSV hosts as they appear on Orchestrator
+#
+# Orchestrator has no change feed for discovered appliances, so the denied and discovered lists
+# are polled. Each poll streams the listings and keeps only the ids of reachable appliances; the
+# delta against the previous poll is all that gets matched. New appliances at a site named by a
+# CSV host are joined against a preconfig name index built once and approved straight away. The
+# preconfig index is fetched again only when a new appliance's host has no preconfig in it, at
+# most once per refresh interval, so matching and approval work follow what changed rather than
+# the size of the inventory.
+
+# Standard library imports
+import time
+
+# Third party imports
+import requests
+
+# Local application imports
+from preconfig_approval import index_denied_appliances, index_preconfigs, match_denied_appliances
+
+EVENT_APPROVED = "approved"
+EVENT_FAILED = "failed"
+# New appliance for a CSV host without a preconfig on Orchestrator yet, retried on later polls
+EVENT_WAITING = "waiting"
+# Several new appliances or preconfigs for one host, the last of each is used
+EVENT_DUPLICATE = "duplicate"
+
+# Orchestrator unreachable or a listing cut off mid-response, retried on the next poll
+REQUEST_ERRORS = (requests.RequestException, ValueError)
+
+
+class ApprovalWatcher:
+    # hostnames are the CSV hosts to approve appliances for
+    # listings are callables returning an iterable of discovered appliances (e.g. the denied and
+    #   discovered lists), or False when the listing failed
+    # list_preconfigs returns an iterable of preconfigs, or False when the listing failed
+    # approve(preconfig_id, discovered_id) returns False when the approval failed
+    # Listings and approvals raising REQUEST_ERRORS count as a failed poll or approval
+    # seen are discovered ids already dealt with, e.g. approved before watching started
+    # A failed approval is retried on later polls, up to max_attempts times
+
+    def __init__(
+        self,
+        hostnames,
+        listings,
+        list_preconfigs,
+        approve,
+        seen=(),
+        max_attempts=3,
+        preconfig_refresh=60.0,
+        clock=time.monotonic,
+    ):
+        self.hostnames = set(hostnames)
+        self.listings = listings
+        self.list_preconfigs = list_preconfigs
+        self.approve = approve
+        self.seen = set(seen)
+        self.max_attempts = max_attempts
+        self.preconfig_refresh = preconfig_refresh
+        self.clock = clock
+        # Ids of the reachable appliances listed by the last poll, None before the first poll
+        self.snapshot = None
+        self.preconfig_index = None
+        self.preconfig_fetched = None
+        # Discovered id -> appliance to match again on the next poll, and hosts reported waiting
+        self.pending = {}
+        self.waiting = set()
+        self.attempts = {}
+        self.counters = {
+            "polls": 0,
+            "failed_polls": 0,
+            "new": 0,
+            "gone": 0,
+            "approved": 0,
+            "failed": 0,
+            "preconfig_fetches": 0,
+        }
+
+    def fetch(self):
+        # (ids of reachable appliances, [new reachable appliances]), None if a listing failed
+        ids = set()
+        new = []
+        try:
+            for listing in self.listings:
+                appliances = listing()
+                if appliances is False:
+                    return None
+                # Streamed listings are read, and may fail, while iterating
+                for appliance in appliances:
+                    if appliance["applianceInfo"]["reachabilityStatus"] != 1:
+                        continue
+                    ids.add(appliance["id"])
+                    if self.snapshot is None or appliance["id"] not in self.snapshot:
+                        new.append(appliance)
+        except REQUEST_ERRORS:
+            return None
+        return ids, new
+
+    def refresh_preconfigs(self):
+        self.preconfig_fetched = self.clock()
+        self.counters["preconfig_fetches"] = self.counters["preconfig_fetches"] + 1
+        # A failed listing keeps the previous index
+        try:
+            preconfigs = self.list_preconfigs()
+            if preconfigs is not False:
+                self.preconfig_index = index_preconfigs(preconfigs)
+        except REQUEST_ERRORS:
+            pass
+
+    def try_approve(self, preconfig_id, discovered_id):
+        try:
+            return self.approve(preconfig_id, discovered_id) is not False
+        except REQUEST_ERRORS:
+            return False
+
+    def poll(self):
+        # Returns [(event, host, detail)] for this poll, None if a listing failed
+        self.counters["polls"] = self.counters["polls"] + 1
+        fetched = self.fetch()
+        if fetched is None:
+            self.counters["failed_polls"] = self.counters["failed_polls"] + 1
+            return None
+        ids, new = fetched
+        if self.snapshot is not None:
+            gone = self.snapshot - ids
+            self.counters["gone"] = self.counters["gone"] + len(gone)
+            for discovered_id in gone:
+                self.pending.pop(discovered_id, None)
+                self.attempts.pop(discovered_id, None)
+        self.snapshot = ids
+        self.counters["new"] = self.counters["new"] + len(new)
+
+        candidates = dict(self.pending)
+        for appliance in new:
+            if appliance["id"] not in self.seen and appliance["applianceInfo"]["site"] in self.hostnames:
+                candidates[appliance["id"]] = appliance
+        self.pending = {}
+        if not candidates:
+            return []
+        return self.match(list(candidates.values()))
+
+    def match(self, candidates):
+        appliance_index = index_denied_appliances(candidates)
+        hosts = list(appliance_index)
+        # Hosts missing from the index may have had their preconfig created since it was fetched
+        if self.preconfig_index is None or (
+            any(host not in self.preconfig_index for host in hosts)
+            and self.clock() - self.preconfig_fetched >= self.preconfig_refresh
+        ):
+            self.refresh_preconfigs()
+        match = match_denied_appliances(hosts, self.preconfig_index or {}, appliance_index)
+
+        events = []
+        for host in match["unmatched"]:
+            for appliance in appliance_index[host]:
+                self.pending[appliance["id"]] = appliance
+            if host not in self.waiting:
+                self.waiting.add(host)
+                events.append((EVENT_WAITING, host, None))
+        for host, duplicate in match["duplicates"].items():
+            events.append((EVENT_DUPLICATE, host, duplicate))
+            # Only the last appliance is approved, the others are not matched again
+            for appliance in appliance_index[host][:-1]:
+                self.seen.add(appliance["id"])
+
+        for host, approval in match["approve"].items():
+            self.waiting.discard(host)
+            discovered_id = approval["discovered_id"]
+            if not self.try_approve(approval["preconfig_id"], discovered_id):
+                self.counters["failed"] = self.counters["failed"] + 1
+                self.attempts[discovered_id] = self.attempts.get(discovered_id, 0) + 1
+                if self.attempts[discovered_id] < self.max_attempts:
+                    self.pending[discovered_id] = appliance_index[host][-1]
+                else:
+                    self.seen.add(discovered_id)
+                events.append((EVENT_FAILED, host, approval))
+            else:
+                self.counters["approved"] = self.counters["approved"] + 1
+                self.seen.add(discovered_id)
+                events.append((EVENT_APPROVED, host, approval))
+        return events
+
+    def summary(self):
+        return dict(self.counters, waiting=len(self.waiting), watched=len(self.snapshot or ()))
@@ -0,0 +1,295 @@
+# Output sinks for rendered preconfig YAML
+#
+# Rows hand their preconfig to a writer, which writes it on a background thread in batches so
+# validate/upload workers do not wait on the filesystem.
+#
+# DirectoryWriter writes one <hostname>_preconfig.yml per row as before, atomically (temp file
+# then rename). A file whose content is unchanged is not rewritten, so its mtime is kept. The
+# content hash, size and mtime of each file are kept in an index in the directory. An indexed
+# file that is unchanged on disk is compared by hash without being read, other existing files
+# are read back and compared. The index holds an entry per file, so streaming runs turn it off
+# and compare every existing file by size and content instead, keeping memory flat.
+#
+# ArchiveWriter writes every preconfig of the run to a single .tar, .tar.gz or .zip file with a
+# manifest.json listing each file, its hostname, size and sha256.
+
+# Standard library imports
+import hashlib
+import io
+import json
+import os
+import queue
+import tarfile
+import threading
+import time
+import zipfile
+
+INDEX_NAME = ".preconfig_outputs.json"
+MANIFEST_NAME = "manifest.json"
+
+# Archive formats by file name suffix: (module, open mode)
+ARCHIVE_FORMATS = (
+    (".tar.gz", "tar", "w:gz"),
+    (".tgz", "tar", "w:gz"),
+    (".tar", "tar", "w"),
+    (".zip", "zip", "w"),
+)
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def archive_format(filename):
+    # (module, open mode) for an archive file name, None if not a supported archive
+    for suffix, module, mode in ARCHIVE_FORMATS:
+        if filename.lower().endswith(suffix):
+            return module, mode
+    return None
+
+
+def write_if_changed(filename, data, existing_size=None):
+    # Atomically write data to filename unless it already holds exactly data
+    # existing_size is the size of the current file if already known, -1 if there is none
+    # Returns True if the file was written
+    if existing_size is None:
+        try:
+            existing_size = os.stat(filename).st_size
+        except OSError:
+            existing_size = -1
+    if existing_size == len(data):
+        try:
+            with open(filename, "rb") as existing_file:
+                if existing_file.read() == data:
+                    return False
+        except OSError:
+            pass
+    temp_filename = "{0}.{1}.tmp".format(filename, os.getpid())
+    with open(temp_filename, "wb") as temp_file:
+        temp_file.write(data)
+    os.replace(temp_filename, filename)
+    return True
+
+
+class OutputWriter:
+    # Base for background writers: write() queues a file, close() waits for every queued file
+    # Up to batch_size queued files are written per batch, at most max_pending wait in the queue
+    # metrics is a preconfig_metrics.RunMetrics timing each file written as the "write" phase
+
+    def __init__(self, batch_size=100, max_pending=1000, metrics=None):
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.lock = threading.Lock()
+        self.counters = {"written": 0, "unchanged": 0, "failed": 0, "batches": 0}
+        # (filename, error) for each file that could not be written
+        self.errors = []
+        self.closed = False
+        self.fallback_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name="preconfig-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, filename, text):
+        data = text.encode("utf-8")
+        if not self.put((filename, data)):
+            # The writer thread has stopped, write in the caller rather than wait on a full queue
+            with self.fallback_lock:
+                self.write_batch([(filename, data)])
+
+    def put(self, item):
+        # Queue item, False if the writer thread is no longer running to take it
+        while self.thread.is_alive():
+            try:
+                self.queue.put(item, timeout=1.0)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run(self):
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                # Files queued after close are not expected, the sentinel is last
+                batch = [item for item in batch if item is not None]
+                stop = True
+            if batch:
+                self.write_batch(batch)
+                with self.lock:
+                    self.counters["batches"] = self.counters["batches"] + 1
+
+    def write_batch(self, batch):
+        for filename, data in batch:
+            # Any error fails only this file, the writer thread carries on with the next
+            started = time.perf_counter()
+            try:
+                written = self.write_file(filename, data)
+            except Exception as e:
+                self.count("failed")
+                with self.lock:
+                    self.errors.append((filename, str(e)))
+                continue
+            finally:
+                if self.metrics is not None:
+                    self.metrics.observe("write", time.perf_counter() - started)
+            self.count("written" if written else "unchanged")
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] = self.counters[counter] + 1
+
+    def close(self):
+        # Wait for queued files, then finish the output
+        if self.closed:
+            return
+        self.closed = True
+        self.put(None)
+        self.thread.join()
+        self.finish()
+
+    def finish(self):
+        pass
+
+    def summary(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+class DirectoryWriter(OutputWriter):
+    # use_index False keeps nothing per file in memory: the index is neither read nor updated
+    # and each file is checked with a stat when written
+
+    def __init__(self, directory, use_index=True, **kwargs):
+        self.directory = directory
+        self.use_index = use_index
+        self.index_filename = os.path.join(directory, INDEX_NAME)
+        # filename -> {"sha256", "size", "mtime_ns"} as last written or checked
+        self.index = {}
+        # Size and mtime of the files already in the directory, from a single directory scan
+        self.existing = {}
+        if use_index:
+            try:
+                with open(self.index_filename) as index_file:
+                    self.index = json.load(index_file).get("files", {})
+            except (OSError, ValueError):
+                pass
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".yml") and entry.is_file():
+                        stat = entry.stat()
+                        self.existing[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        super().__init__(**kwargs)
+
+    def exists(self, filename):
+        # True if the file is in the directory, as of the run start or written since
+        if not self.use_index:
+            return os.path.isfile(os.path.join(self.directory, filename))
+        return filename in self.existing
+
+    def write_file(self, filename, data):
+        path = os.path.join(self.directory, filename)
+        if not self.use_index:
+            # Entries left in the index no longer match the file's mtime once it is rewritten,
+            # so the next indexed run reads such files back instead of trusting them
+            return write_if_changed(path, data)
+        sha256 = hash_bytes(data)
+        existing = self.existing.get(filename)
+        indexed = self.index.get(filename)
+        if (
+            existing is not None
+            and indexed is not None
+            and (indexed["size"], indexed["mtime_ns"]) == existing
+        ):
+            # Untouched since indexed, compare hashes without reading the file
+            if indexed["sha256"] == sha256:
+                return False
+            written = write_if_changed(path, data, existing_size=-1)
+        else:
+            written = write_if_changed(
+                path, data, existing_size=existing[0] if existing is not None else -1
+            )
+        stat = os.stat(path)
+        self.existing[filename] = (stat.st_size, stat.st_mtime_ns)
+        self.index[filename] = {
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        return written
+
+    def finish(self):
+        # Best effort, without an index the next run compares file contents instead
+        if not self.use_index:
+            return
+        try:
+            write_if_changed(
+                self.index_filename,
+                json.dumps({"files": self.index}, sort_keys=True).encode("utf-8"),
+            )
+        except OSError:
+            pass
+
+
+class ArchiveWriter(OutputWriter):
+    # The archive is written under a temporary name and renamed into place by close()
+
+    def __init__(self, filename, **kwargs):
+        self.filename = filename
+        self.temp_filename = "{0}.{1}.tmp".format(filename, os.getpid())
+        if archive_format(filename) is None:
+            raise ValueError("{0} is not a .tar, .tar.gz, .tgz or .zip file".format(filename))
+        self.module, mode = archive_format(filename)
+        if self.module == "zip":
+            self.archive = zipfile.ZipFile(self.temp_filename, mode, compression=zipfile.ZIP_DEFLATED)
+        else:
+            self.archive = tarfile.open(self.temp_filename, mode)
+        self.started = time.time()
+        # filename -> manifest entry, in the order written
+        self.manifest = {}
+        super().__init__(**kwargs)
+
+    def exists(self, filename):
+        # Each archive holds the complete output of its run, rows are never left out
+        return False
+
+    def write_file(self, filename, data):
+        sha256 = hash_bytes(data)
+        previous = self.manifest.get(filename)
+        if previous is not None:
+            # An archive member cannot be replaced, a repeated hostname keeps its first preconfig
+            if previous["sha256"] == sha256:
+                return False
+            raise OSError("already in archive with different content")
+        self.add_member(filename, data)
+        self.manifest[filename] = {
+            "name": filename,
+            "hostname": filename.rsplit("_preconfig.yml", 1)[0],
+            "size": len(data),
+            "sha256": sha256,
+        }
+        return True
+
+    def add_member(self, filename, data):
+        if self.module == "zip":
+            self.archive.writestr(filename, data)
+        else:
+            member = tarfile.TarInfo(filename)
+            member.size = len(data)
+            member.mtime = int(self.started)
+            member.mode = 0o644
+            self.archive.addfile(member, io.BytesIO(data))
+
+    def finish(self):
+        manifest = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started)),
+            "files": list(self.manifest.values()),
+        }
+        self.add_member(MANIFEST_NAME, json.dumps(manifest, indent=2).encode("utf-8"))
+        self.archive.close()
+        os.replace(self.temp_filename, self.filename)
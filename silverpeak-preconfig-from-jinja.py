@@ -1,13 +1,19 @@
 # Standard library imports
 import argparse
-import csv
+import atexit
 import datetime
 import json
 import os
+import re
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from functools import partial
 
 # Third party imports
 import colored
+import requests
 import urllib3
 import yaml
 from colored import stylize
@@ -17,28 +23,74 @@ from jinja2 import (
     FileSystemLoader,
     PackageLoader,
     Template,
+    TemplateError,
     select_autoescape,
 )
 
 # Local application imports
-from silverpeak_python_sdk import Orchestrator
+from preconfig_approval import (
+    index_denied_appliances,
+    index_preconfigs,
+    match_denied_appliances,
+)
+from preconfig_client import HelperOrchestrator
+from preconfig_fanout import FanOut, load_orchestrator_map
+from preconfig_inputs import (
+    INPUT_FORMATS,
+    open_input_rows,
+    split_list_columns,
+)
+from preconfig_journal import (
+    APPROVAL_APPROVED,
+    APPROVAL_FAILED,
+    RECORD_APPROVAL,
+    RECORD_ROW,
+    RECORD_RUN,
+    RECORD_SUMMARY,
+    RunJournal,
+)
+from preconfig_metrics import RunMetrics
+from preconfig_pipeline import (
+    STATUS_ERROR,
+    STATUS_INVALID,
+    STATUS_RESUMED,
+    STATUS_UNCHANGED,
+    STATUS_UPLOADED,
+    STATUS_VALID,
+    PreconfigPipeline,
+)
+from preconfig_references import ReferenceIndex, collect_references, fetch_names, merge_summaries
+from preconfig_render import render_only
+from preconfig_schema import validate_preconfig_yaml
+from preconfig_state import PreconfigStateStore, preconfig_hash
+from preconfig_sync import SYNC_CREATE, SYNC_UNCHANGED, SYNC_UPDATE, PreconfigSync
+from preconfig_templates import (
+    DEFAULT_TEMPLATE,
+    TEMPLATE_CACHE_DIRECTORY,
+    TemplateCache,
+    TemplateSelector,
+    group_rows,
+    load_environment,
+    load_template_rules,
+)
+from preconfig_watch import (
+    EVENT_APPROVED,
+    EVENT_DUPLICATE,
+    EVENT_FAILED,
+    EVENT_WAITING,
+    ApprovalWatcher,
+)
+from preconfig_writer import ArchiveWriter, DirectoryWriter, archive_format
+from sp_cache import DEFAULT_TTLS, ResponseCache
+from sp_limiter import AdaptiveLimiter
+from sp_orchhelper import OrchHelper
+from sp_trace import TRACE_FORMATS, RequestTracer
 from urllib3.exceptions import InsecureRequestWarning
 
 # Disable Certificate Warnings
 urllib3.disable_warnings(category=InsecureRequestWarning)
 
 
-def comma_separate(cs_string_list):
-    # Blank List
-    cs_list = []
-    # Convert string to comma separated list
-    cs_string_list = cs_string_list.split(",")
-    # Strip leading/trailing whitespace from items
-    for item in cs_string_list:
-        cs_list.append(item.strip())
-    return cs_list
-
-
 def get_csv_file():
     # Enter source CSV file for config generation data
     correct_file = "n"
@@ -108,12 +160,359 @@ parser.add_argument(
     help="Approve and apply preconfig to matching denied appliances",
     type=bool,
 )
-parser.add_argument("--csv", help="specify source csv file for preconfigs", type=str)
+parser.add_argument(
+    "--watch",
+    help="keep polling denied and discovered appliances, approving those matching a preconfig as they appear",
+    action="store_true",
+)
+parser.add_argument(
+    "--watch-interval",
+    help="seconds between --watch polls (default 30)",
+    type=float,
+    default=30.0,
+)
+parser.add_argument(
+    "--watch-duration",
+    help="stop watching after this many seconds (default until interrupted)",
+    type=float,
+)
+parser.add_argument(
+    "--csv",
+    help="specify source csv file for preconfigs, .gz is decompressed, - reads stdin",
+    type=str,
+)
+parser.add_argument(
+    "--input-format",
+    help="read --csv as csv, columnar-csv, parquet or arrow (default auto, by file extension; columnar formats need pyarrow)",
+    choices=INPUT_FORMATS,
+    default="auto",
+)
 parser.add_argument("--jinja", help="specify source jinja2 template", type=str)
+parser.add_argument(
+    "--template-column",
+    help="CSV column selecting each row's jinja2 template, by --template-rules or as the template name",
+    type=str,
+)
+parser.add_argument(
+    "--template-rules",
+    help="YAML/JSON file of rules and column values selecting each row's jinja2 template",
+    type=str,
+)
+parser.add_argument(
+    "--max-templates",
+    help="loaded jinja2 templates kept for the run (default 32)",
+    type=int,
+    default=32,
+)
+parser.add_argument(
+    "--template-window",
+    help="read ahead this many rows and render them grouped per template, reordering rows within the window (default 1, CSV order)",
+    type=int,
+    default=1,
+)
 parser.add_argument("--vault", help="specify source vault URL", type=str)
 parser.add_argument("--orch", help="specify Orchestrator URL", type=str)
+parser.add_argument(
+    "--workers",
+    help="number of rows to validate/upload concurrently (default 1)",
+    type=int,
+    default=1,
+)
+parser.add_argument(
+    "--state",
+    help="state file for skipping rows unchanged since the last run, empty string to disable",
+    type=str,
+    default="preconfig_outputs/.preconfig_state.json",
+)
+parser.add_argument(
+    "--force",
+    help="validate and upload every row even if unchanged since the last run",
+    action="store_true",
+)
+parser.add_argument(
+    "--journal",
+    help="append each finished row and approval to this JSON lines journal, empty string to disable",
+    type=str,
+    default="preconfig_outputs/preconfig_journal.jsonl",
+)
+parser.add_argument(
+    "--resume",
+    help="resume an interrupted run, skipping rows and approvals its journal shows completed",
+    action="store_true",
+)
+parser.add_argument(
+    "--sync",
+    help="only create or update preconfigs that differ from those on Orchestrator",
+    action="store_true",
+)
+parser.add_argument(
+    "--stream",
+    help="report rows as they finish and keep only a compact status per row (for very large inventories)",
+    action="store_true",
+)
+parser.add_argument(
+    "--archive",
+    help="write preconfigs to a single .tar, .tar.gz or .zip file with a manifest instead of one file each",
+    type=str,
+)
+parser.add_argument(
+    "--render-only",
+    help="only write local preconfig files, rendering across a process pool without Orchestrator",
+    action="store_true",
+)
+parser.add_argument(
+    "--processes",
+    help="render-only worker processes (default one per CPU)",
+    type=int,
+)
+parser.add_argument(
+    "--offline",
+    help="check rendered preconfigs locally and write them without contacting Orchestrator",
+    action="store_true",
+)
+parser.add_argument(
+    "--no-local-validation",
+    help="skip local checks of rendered preconfigs before Orchestrator validation",
+    action="store_true",
+)
+parser.add_argument(
+    "--no-column-check",
+    help="skip checking CSV rows for values the jinja template requires before rendering",
+    action="store_true",
+)
+parser.add_argument(
+    "--no-reference-check",
+    help="skip checking templateGroups and businessIntentOverlays names against Orchestrator",
+    action="store_true",
+)
+parser.add_argument(
+    "--template-cache",
+    help="directory for compiled jinja templates, empty string to disable (default .template_cache)",
+    type=str,
+    default=TEMPLATE_CACHE_DIRECTORY,
+)
+parser.add_argument(
+    "--record",
+    help="record Orchestrator requests and responses to this file, cookie values are redacted",
+    type=str,
+)
+parser.add_argument(
+    "--record-append",
+    help="append to the --record file instead of replacing it",
+    action="store_true",
+)
+parser.add_argument(
+    "--replay",
+    help="replay Orchestrator responses from a recording instead of contacting Orchestrator",
+    type=str,
+)
+parser.add_argument(
+    "--replay-speed",
+    help="replay at recorded response times divided by this factor (default no delays)",
+    type=float,
+)
+parser.add_argument(
+    "--metrics-json",
+    help="write per-phase timing metrics as JSON, empty string to disable",
+    type=str,
+    default="preconfig_outputs/preconfig_metrics.json",
+)
+parser.add_argument(
+    "--metrics-prom",
+    help="write per-phase timing metrics in Prometheus text format, empty string to disable",
+    type=str,
+    default="preconfig_outputs/preconfig_metrics.prom",
+)
+parser.add_argument(
+    "--trace",
+    help="write a span for every Orchestrator request to this trace file",
+    type=str,
+)
+parser.add_argument(
+    "--trace-format",
+    help="trace file format, chrome (chrome://tracing, Perfetto) or otel (OpenTelemetry JSON)",
+    choices=TRACE_FORMATS,
+    default="chrome",
+)
+parser.add_argument(
+    "--slow-request",
+    help="log Orchestrator requests taking at least this many seconds",
+    type=float,
+)
+parser.add_argument(
+    "--slow-log",
+    help="append slow requests to this file instead of the console",
+    type=str,
+)
+parser.add_argument(
+    "--pool-size",
+    help="kept-alive Orchestrator connections (default twice --workers, at least 10)",
+    type=int,
+)
+parser.add_argument(
+    "--connect-timeout",
+    help="Orchestrator connect timeout in seconds (default 10)",
+    type=float,
+)
+parser.add_argument(
+    "--read-timeout",
+    help="Orchestrator read timeout in seconds (default 120)",
+    type=float,
+)
+parser.add_argument(
+    "--retries",
+    help="retries of idempotent Orchestrator requests on connection errors and 429/502/503/504 (default 3)",
+    type=int,
+)
+parser.add_argument(
+    "--backoff",
+    help="base of the exponential backoff between retries in seconds (default 0.5)",
+    type=float,
+)
+parser.add_argument(
+    "--backoff-max",
+    help="maximum backoff between retries in seconds (default 30)",
+    type=float,
+)
+parser.add_argument(
+    "--adaptive",
+    help="adapt Orchestrator requests in flight to its latency and 429/5xx responses, up to the pool size",
+    action="store_true",
+)
+parser.add_argument(
+    "--min-concurrency",
+    help="lowest adaptive Orchestrator requests in flight (default 1)",
+    type=int,
+    default=1,
+)
+parser.add_argument(
+    "--latency-target",
+    help="adaptive limit backs off above this response time in seconds (default twice the fastest recent response)",
+    type=float,
+)
+parser.add_argument(
+    "--max-rps",
+    help="hard cap on Orchestrator requests per second",
+    type=float,
+)
+parser.add_argument(
+    "--cache",
+    help="answer repeated read-only Orchestrator lookups from a cache while fresh",
+    action="store_true",
+)
+parser.add_argument(
+    "--cache-dir",
+    help="keep the Orchestrator lookup cache in this directory, shared with later runs (implies --cache)",
+    type=str,
+)
+parser.add_argument(
+    "--cache-ttl",
+    help="seconds cached lookups stay fresh (default per endpoint, 30 to 300)",
+    type=float,
+)
+parser.add_argument(
+    "--orch-column",
+    help="csv column routing each row to an Orchestrator URL or --orch-map region, empty rows use --orch",
+    type=str,
+)
+parser.add_argument(
+    "--orch-map",
+    help="YAML/JSON file mapping --orch-column regions to Orchestrator URLs (or url/user/password)",
+    type=str,
+)
 args = parser.parse_args()
 
+# Per-phase timings of this run
+metrics = RunMetrics()
+
+
+# Trace Orchestrator requests if a trace file or slow request threshold was given
+if vars(args)["trace"] or vars(args)["slow_request"] is not None:
+    tracer = RequestTracer(
+        slow_threshold=vars(args)["slow_request"], slow_log=vars(args)["slow_log"]
+    )
+else:
+    tracer = None
+
+
+# OrchHelper connection pooling, timeout and retry settings given on the command line
+helper_options = dict(
+    (option, vars(args)[option])
+    for option in (
+        "connect_timeout",
+        "read_timeout",
+        "retries",
+        "backoff",
+        "backoff_max",
+    )
+    if vars(args)[option] is not None
+)
+# Validate and upload threads each issue requests, size the pool for both
+pool_size = vars(args)["pool_size"] or max(10, vars(args)["workers"] * 2)
+
+# Cache of read-only Orchestrator lookups, shared by every Orchestrator of the run
+if vars(args)["cache"] or vars(args)["cache_dir"]:
+    if vars(args)["cache_ttl"] is not None:
+        cache_ttls = dict((endpoint, vars(args)["cache_ttl"]) for endpoint in DEFAULT_TTLS)
+    else:
+        cache_ttls = None
+    response_cache = ResponseCache(ttls=cache_ttls, directory=vars(args)["cache_dir"])
+else:
+    response_cache = None
+
+# Adaptive concurrency moves requests in flight between --min-concurrency and the pool size,
+# a requests per second cap alone keeps it fixed at the pool size
+# Each Orchestrator gets its own limiter
+def new_limiter():
+    if not vars(args)["adaptive"] and not vars(args)["max_rps"]:
+        return None
+    return AdaptiveLimiter(
+        min_limit=vars(args)["min_concurrency"],
+        max_limit=pool_size,
+        adaptive=vars(args)["adaptive"],
+        max_rps=vars(args)["max_rps"],
+        latency_target=vars(args)["latency_target"],
+    )
+
+
+# Recording or replay file for an Orchestrator, one per routing value when rows are routed
+def transport_file(filename, suffix):
+    if not filename or not suffix:
+        return filename
+    return "{}.{}".format(
+        filename, "".join(c if c.isalnum() or c in "-_" else "_" for c in suffix)
+    )
+
+
+# Orchestrator client, recording, replay, tracing, pooling, retry, limiter and cache settings go
+# through OrchHelper's transport
+def connect_orchestrator(url, limiter=None, suffix=""):
+    if (
+        vars(args)["record"]
+        or vars(args)["replay"]
+        or tracer is not None
+        or helper_options
+        or vars(args)["pool_size"]
+        or limiter is not None
+        or response_cache is not None
+    ):
+        return HelperOrchestrator(
+            url,
+            record=transport_file(vars(args)["record"], suffix),
+            record_append=vars(args)["record_append"],
+            replay=transport_file(vars(args)["replay"], suffix),
+            replay_speed=vars(args)["replay_speed"],
+            tracer=tracer,
+            pool_size=pool_size,
+            limiter=limiter,
+            cache=response_cache,
+            **helper_options
+        )
+    from silverpeak_python_sdk import Orchestrator
+
+    return Orchestrator(url)
+
+
 # Load environment variables
 load_dotenv()
 
@@ -124,49 +523,150 @@ if vars(args)["vault"] is not None:
 elif os.getenv("VAULT_URL") is not None:
     vault_url = os.getenv("VAULT_URL")
 elif vars(args)["orch"] is not None:
-    orch = Orchestrator(vars(args)["orch"])
+    orch_url = vars(args)["orch"]
     orch_user = os.getenv("ORCH_USER")
     orch_pw = os.getenv("ORCH_PASSWORD")
 else:
-    orch = Orchestrator(str(os.getenv("ORCH_URL")))
+    orch_url = str(os.getenv("ORCH_URL"))
     orch_user = os.getenv("ORCH_USER")
     orch_pw = os.getenv("ORCH_PASSWORD")
 
 
 # Obtain Jinja2 template file for generating preconfig
 if vars(args)["jinja"] is not None:
-    ec_template_file = vars(args)["csv"]
+    ec_template_file = vars(args)["jinja"]
 else:
-    ec_template_file = "ec_preconfig_template.jinja2"
+    ec_template_file = DEFAULT_TEMPLATE
 
-# Retrieve Jinja2 template for generating EdgeConnect Preconfig YAML file
-env = Environment(loader=FileSystemLoader("templates"))
-ec_template = env.get_template(ec_template_file)
-print(
-    "Using {} for EdgeConnect jinja template".format(
-        stylize(ec_template_file, blue_text)
+# Rows select their template by rule or column, falling back to the --jinja template
+if vars(args)["template_rules"]:
+    template_selector = TemplateSelector.from_rules(
+        ec_template_file,
+        load_template_rules(vars(args)["template_rules"]),
+        vars(args)["template_column"],
     )
-)
+else:
+    template_selector = TemplateSelector(
+        ec_template_file, vars(args)["template_column"]
+    )
+
+# Retrieve Jinja2 templates for generating EdgeConnect Preconfig YAML files
+# Compiled templates are cached between runs unless the cache is disabled, and a bounded number
+# are kept loaded with the columns each reads from rows, iterates as lists and requires
+env = load_environment(cache_directory=vars(args)["template_cache"])
+templates = TemplateCache(env, vars(args)["max_templates"])
+known_templates = []
+for template_name in template_selector.known_templates():
+    try:
+        known_templates.append(templates.get(template_name))
+    except TemplateError as e:
+        print(
+            "Unable to load jinja template {}: {}".format(
+                stylize(template_name, red_text), e
+            )
+        )
+        exit()
+    print(
+        "Using {} for EdgeConnect jinja template".format(
+            stylize(template_name, blue_text)
+        )
+    )
+if template_selector.open_ended():
+    print(
+        "Rows without a {} value use {}".format(
+            stylize(template_selector.column, blue_text), ec_template_file
+        )
+    )
+default_template = known_templates[0]
+selecting_templates = len(known_templates) > 1 or template_selector.open_ended()
+column_check = not vars(args)["no_column_check"]
+list_columns = default_template["list_columns"]
 
 # Local directory for configuration outputs
 local_config_directory = "preconfig_outputs/"
 if not os.path.exists(local_config_directory):
     os.makedirs(local_config_directory)
 
+# Offline runs only check preconfigs locally and write them, without Orchestrator
+offline = vars(args)["offline"]
+local_validation = not vars(args)["no_local_validation"]
+reference_check = not vars(args)["no_reference_check"]
+
+# Load state of previous runs to skip unchanged rows, unless forced or disabled
+# Offline runs are not recorded, locally checked rows still need Orchestrator validation
+if vars(args)["state"] and not offline:
+    state_store = PreconfigStateStore(vars(args)["state"])
+else:
+    state_store = None
+force = vars(args)["force"]
+
 # Obtain CSV file for generating preconfigs
 if vars(args)["csv"] is not None:
     csv_filename = vars(args)["csv"]
 else:
     csv_filename = get_csv_file()
 
+# Open the site inventory, Parquet, Arrow and columnar CSV inputs are normalised a batch at a time
+# and only read the columns the templates and routing use, all of them if templates are named by
+# a column
+if template_selector.open_ended():
+    input_columns = None
+else:
+    input_columns = set(("hostname", "serial_number", vars(args)["orch_column"]))
+    input_columns.update(template_selector.columns())
+    for entry in known_templates:
+        input_columns.update(entry["schema"].columns)
+        list_columns = list_columns + tuple(
+            column for column in entry["list_columns"] if column not in list_columns
+        )
+try:
+    input_rows = open_input_rows(
+        csv_filename,
+        vars(args)["input_format"],
+        list_columns,
+        columns=input_columns,
+    )
+except ImportError as e:
+    print(stylize(e, red_text))
+    exit()
+
+# Render-only mode writes local preconfig files across a process pool without contacting Orchestrator
+if vars(args)["render_only"]:
+    render_report = render_only(
+        (row for row_number, row in input_rows),
+        "templates",
+        template_selector,
+        local_config_directory,
+        cache_directory=vars(args)["template_cache"],
+        processes=vars(args)["processes"],
+        max_templates=vars(args)["max_templates"],
+    )
+    for row_number, hostname, error in render_report["errors"]:
+        print(
+            "Row {} {}: {}".format(
+                stylize(row_number, red_text), stylize(hostname, blue_text), error
+            )
+        )
+    print(
+        "Rendered {} preconfigs, {} rows with errors".format(
+            stylize(render_report["written"], green_text),
+            len(render_report["errors"]),
+        )
+    )
+    exit()
+
 # Check if configs should be uploaded to Orchestrator
-if vars(args)["upload"] is not None:
+if offline:
+    upload_to_orch = False
+elif vars(args)["upload"] is not None:
     upload_to_orch = vars(args)["upload"]
 else:
     upload_to_orch = prompt_for_orch_upload()
 
 # If uploading to Orchestrator check if preconfigs should be marked for auto-approve
-if vars(args)["autoapply"] is not None:
+if offline:
+    auto_apply = False
+elif vars(args)["autoapply"] is not None:
     auto_apply = vars(args)["autoapply"]
 elif upload_to_orch == True:
     auto_apply = prompt_for_auto_apply("DISCOVERED")
@@ -174,134 +674,1029 @@ else:
     auto_apply = False
 
 # If auto-apply, check if should also approve matching appliances that are currently denied
-if vars(args)["autodenied"] is not None:
+if offline:
+    auto_apply_denied = False
+elif vars(args)["autodenied"] is not None:
     auto_apply_denied = vars(args)["autodenied"]
 elif auto_apply == True:
     auto_apply_denied = prompt_for_auto_apply("DENIED")
 else:
     auto_apply_denied = False
 
+# Journal of finished rows and approvals, resumed runs skip what it shows completed
+if vars(args)["journal"]:
+    journal = RunJournal(vars(args)["journal"], resume=vars(args)["resume"])
+    if journal.rotated:
+        print(
+            "Journal of an interrupted run moved to {}, resume it with --journal {} --resume".format(
+                stylize(journal.rotated, orange_text), journal.rotated
+            )
+        )
+    # Write out pending records if the run is interrupted
+    atexit.register(journal.close)
+    journal.write(
+        RECORD_RUN,
+        csv=csv_filename,
+        template=ec_template_file,
+        template_hash=default_template["hash"],
+        templates=[entry["name"] for entry in known_templates],
+        template_column=template_selector.column,
+        upload=upload_to_orch == True,
+        auto_apply=auto_apply == True,
+        offline=offline,
+        resume=vars(args)["resume"],
+    )
+    if vars(args)["resume"]:
+        print(
+            "Resuming from {}: {} rows and {} approvals completed".format(
+                vars(args)["journal"],
+                stylize(len(journal.rows), green_text),
+                len(journal.approved),
+            )
+        )
+elif vars(args)["resume"]:
+    print(stylize("--resume needs a --journal file", red_text))
+    exit()
+else:
+    journal = None
+resume = vars(args)["resume"]
+
+# Preconfig files are written on a background thread, to the outputs directory or an archive
+if vars(args)["archive"]:
+    if archive_format(vars(args)["archive"]) is None:
+        print(stylize("--archive must be a .tar, .tar.gz, .tgz or .zip file", red_text))
+        exit()
+    output_writer = ArchiveWriter(vars(args)["archive"], metrics=metrics)
+else:
+    # Streaming runs keep no per-file index in memory
+    output_writer = DirectoryWriter(
+        local_config_directory, use_index=not vars(args)["stream"], metrics=metrics
+    )
+# Write out queued files if the run is interrupted
+atexit.register(output_writer.close)
+# Outcomes a resumed row is not processed again for
+if upload_to_orch == True:
+    resume_statuses = (STATUS_UPLOADED, STATUS_UNCHANGED)
+else:
+    resume_statuses = (STATUS_VALID, STATUS_UPLOADED, STATUS_UNCHANGED)
 
-# Connect to Orchestrator
-orch.login(orch_user, orch_pw)
 
-# Open CSV file
-with open(csv_filename, encoding="utf-8-sig") as csvfile:
-    csv_dict = csv.DictReader(csvfile)
+# Number of concurrent validate/upload workers
+workers = vars(args)["workers"]
 
-    # Set initial row number for row identification
-    row_number = 1
+# Rows are routed by --orch-column, holding an Orchestrator URL or a region from --orch-map,
+# rows without a value go to the default Orchestrator
+orch_column = vars(args)["orch_column"]
+if vars(args)["orch_map"]:
+    orchestrator_map = load_orchestrator_map(vars(args)["orch_map"])
+else:
+    orchestrator_map = {}
 
-    # Track hosts added for Orchestrator approval
-    silverpeak_hostname_list = []
 
-    # For each row/site in configuration file, generate Silver Peak and Aruba configurations
-    for row in csv_dict:
+# Orchestrator name shown before console output when rows are routed to several Orchestrators
+def target_prefix(target):
+    if orch_column is None:
+        return ""
+    return "[{}] ".format(stylize(target["name"], orange_text))
 
-        # Render EdgeConnect YAML Preconfig File from Jinja template
-        if row["hostname"] != "":
-            print(
-                "Rendering EdgeConnect template for {} from row {}".format(
-                    stylize(row["hostname"], blue_text), str(row_number)
+
+# Queue local YAML file for the output writer, files with unchanged content are not rewritten
+def write_preconfig_file(hostname, preconfig):
+    output_filename = "{}_preconfig.yml".format(hostname)
+
+    # Time spent waiting for room in the writer's queue, the writer times the writes
+    with metrics.time("write_queue"):
+        output_writer.write(output_filename, preconfig)
+
+
+# Render EdgeConnect YAML Preconfig File from the Jinja template selected for the row
+def render_row(target, result, row):
+    template = result["template"]
+    print(
+        "{}Rendering EdgeConnect template {}for {} from row {}".format(
+            target_prefix(target),
+            template["name"] + " " if selecting_templates else "",
+            stylize(row["hostname"], blue_text),
+            str(result["row_number"]),
+        )
+    )
+
+    # Convert list strings to comma separated list, strips leading/trailing whitespace
+    split_list_columns(row, template["list_columns"])
+
+    # Render Jinja template
+    with metrics.time("render"):
+        return template["template"].render(data=row)
+
+
+# Validate preconfig via Orchestrator and write local YAML file if valid
+def validate_row(target, result, row, preconfig):
+    output_filename = "{}_preconfig.yml".format(row["hostname"])
+    preconfig_sync = target["preconfig_sync"]
+
+    # Skip rows whose preconfig and template are unchanged since the last successful run
+    result["preconfig_hash"] = preconfig_hash(
+        preconfig, row["serial_number"], auto_apply
+    )
+
+    # Skip rows the interrupted run being resumed completed with the same preconfig
+    if resume:
+        previous = journal.completed(
+            target["name"], row["hostname"], result["preconfig_hash"], resume_statuses
+        )
+        if previous is not None:
+            result["status"] = STATUS_RESUMED
+            result["outcome"] = previous.get("outcome", previous["status"])
+            result["preconfig_id"] = previous.get("preconfig_id")
+            result["messages"].append(
+                "Preconfig {} {} before the run was interrupted, skipping".format(
+                    stylize(row["hostname"], blue_text), result["outcome"]
                 )
             )
+            return False
 
-            silverpeak_hostname_list.append(row["hostname"])
+    if (
+        not force
+        and state_store is not None
+        and state_store.is_unchanged(
+            target["url"],
+            row["hostname"],
+            result["preconfig_hash"],
+            result["template"]["hash"],
+            upload_to_orch,
+        )
+        and output_writer.exists(output_filename)
+    ):
+        result["status"] = STATUS_UNCHANGED
+        result["messages"].append(
+            "Preconfig {} unchanged since last run, skipping".format(
+                stylize(row["hostname"], blue_text)
+            )
+        )
+        return False
 
-            # Convert list strings to comma separated list, strips leading/trailing whitespace
-            row["templateGroups"] = comma_separate(row["templateGroups"])
-            row["businessIntentOverlays"] = comma_separate(
-                row["businessIntentOverlays"]
+    # Rows routed to a different Orchestrator than last time are processed on the new one,
+    # the preconfig on the previous Orchestrator is left in place
+    if orch_column is not None and state_store is not None:
+        moved_from = state_store.moved_from(target["url"], row["hostname"])
+        if moved_from:
+            result["messages"].append(
+                "Preconfig {} was last processed on {}, now routed to {}".format(
+                    stylize(row["hostname"], blue_text),
+                    ", ".join(moved_from),
+                    target["url"],
+                )
             )
 
-            # Render Jinja template
-            preconfig = ec_template.render(data=row)
+    # Reject rows naming template groups or overlays unknown to Orchestrator
+    if target["references"] is not None:
+        errors = target["references"].check(row)
+        if errors:
+            result["messages"].append(
+                "Preconfig {} references unknown names:".format(
+                    stylize(row["hostname"], red_text)
+                )
+            )
+            result["messages"].extend("  " + error for error in errors)
+            return False
 
-            # Validate preconfig via Orchestrator
-            validate = orch.validate_preconfig(
-                row["hostname"], row["serial_number"], preconfig, auto_apply
+    # Reject preconfigs failing local checks without an Orchestrator round-trip
+    if local_validation:
+        with metrics.time("local_validate"):
+            errors = validate_preconfig_yaml(preconfig)
+        if errors:
+            result["messages"].append(
+                "Preconfig {} failed local validation:".format(
+                    stylize(row["hostname"], red_text)
+                )
             )
+            result["messages"].extend("  " + error for error in errors)
+            return False
 
-            if validate.status_code == 200:
+    # Offline runs write preconfigs passing local checks
+    if offline:
+        write_preconfig_file(row["hostname"], preconfig)
+        return True
 
-                # Write local YAML file
-                output_filename = "{}_preconfig.yml".format(row["hostname"])
+    # Skip rows identical to the preconfig already on Orchestrator
+    if preconfig_sync is not None:
+        result["sync_action"], result["existing_preconfig"] = preconfig_sync.compare(
+            row["hostname"], row["serial_number"], preconfig, auto_apply
+        )
+        if result["sync_action"] == SYNC_UNCHANGED:
+            result["preconfig_id"] = result["existing_preconfig"].get("id")
+            write_preconfig_file(row["hostname"], preconfig)
+            preconfig_sync.record(SYNC_UNCHANGED)
+            result["status"] = STATUS_UNCHANGED
+            result["messages"].append(
+                "EC Preconfig {} already on Orchestrator, skipping".format(
+                    stylize(row["hostname"], blue_text)
+                )
+            )
+            return False
 
-                with open(
-                    local_config_directory + output_filename, "w"
-                ) as preconfig_file:
-                    write_data = preconfig_file.write(preconfig)
+    with metrics.time("validate"):
+        validate = target["orch"].validate_preconfig(
+            row["hostname"], row["serial_number"], preconfig, auto_apply
+        )
 
-                # If option was chosen, upload preconfig to Orchestrator with selected auto-apply settings
-                if upload_to_orch == True:
+    if validate.status_code == 200:
+        write_preconfig_file(row["hostname"], preconfig)
+        return True
+    else:
+        result["messages"].append("Preconfig failed validation")
+        return False
 
-                    orch.create_preconfig(
-                        row["hostname"],
-                        row["serial_number"],
-                        preconfig,
-                        auto_apply,
-                    )
-                    print(
-                        "Posted EC Preconfig {}".format(
-                            stylize(row["hostname"], blue_text)
-                        )
+
+# Upload preconfig to Orchestrator with selected auto-apply settings
+def upload_row(target, result, row, preconfig):
+    preconfig_sync = target["preconfig_sync"]
+
+    # When syncing, replace the differing preconfig already on Orchestrator
+    if preconfig_sync is not None and result["sync_action"] == SYNC_UPDATE:
+        existing = result["existing_preconfig"]
+        result["preconfig_id"] = existing["id"]
+        with metrics.time("upload"):
+            modified = target["orch_helper"].modify_preconfig(
+                existing["id"],
+                row["hostname"],
+                row["serial_number"],
+                preconfig,
+                auto_apply,
+                existing.get("tag", ""),
+                existing.get("comment", ""),
+            )
+        if modified:
+            preconfig_sync.record(SYNC_UPDATE)
+            result["messages"].append(
+                "Updated EC Preconfig {}".format(stylize(row["hostname"], blue_text))
+            )
+        else:
+            result["status"] = STATUS_ERROR
+            result["messages"].append("Preconfig update failed")
+        return
+
+    with metrics.time("upload"):
+        created = target["orch"].create_preconfig(
+            row["hostname"],
+            row["serial_number"],
+            preconfig,
+            auto_apply,
+        )
+    # OrchHelper based clients report a failed create as False
+    if created is False:
+        result["status"] = STATUS_ERROR
+        result["messages"].append("Preconfig upload failed")
+        return
+    # OrchHelper returns the new preconfig's id when Orchestrator reports it
+    if isinstance(created, (str, int)) and not isinstance(created, bool):
+        result["preconfig_id"] = created
+    if preconfig_sync is not None:
+        preconfig_sync.record(SYNC_CREATE)
+    result["messages"].append(
+        "Posted EC Preconfig {}".format(stylize(row["hostname"], blue_text))
+    )
+
+
+# Print the outcome of a processed row and record it for the next run
+def report_row(target, result):
+    for message in result["messages"]:
+        print(target_prefix(target) + message)
+
+    # Resumed rows are recorded with the outcome of the interrupted run
+    outcome = result.get("outcome", result["status"])
+    if (
+        state_store is not None
+        and "preconfig_hash" in result
+        and outcome != STATUS_UNCHANGED
+    ):
+        state_store.record(
+            target["url"],
+            result["hostname"],
+            result["preconfig_hash"],
+            result["template"]["hash"],
+            outcome,
+        )
+
+
+# Styled console message as plain text
+def plain_text(message):
+    return re.sub(r"\x1b\[[0-9;]*m", "", message)
+
+
+# Journal a row as soon as it finishes, so an interrupted run can be resumed past it
+def journal_row(target, result):
+    journal.write(
+        RECORD_ROW,
+        row=result["row_number"],
+        hostname=result["hostname"],
+        orchestrator=target["name"],
+        status=result["status"],
+        outcome=result.get("outcome", result["status"]),
+        phase=result["phase"],
+        template=result["template"]["name"] if result.get("template") else None,
+        preconfig_id=result.get("preconfig_id"),
+        preconfig_hash=result.get("preconfig_hash"),
+        messages=[plain_text(message) for message in result["messages"]],
+    )
+
+
+# YAML of an existing preconfig for --sync to compare against, None if it could not be fetched
+def get_config_data(orch_helper, preconfig_id):
+    try:
+        response = orch_helper.get_preconfig(preconfig_id)
+        if response is False:
+            return None
+        return response.json().get("configData")
+    except (requests.exceptions.RequestException, ValueError, AttributeError):
+        return None
+
+
+# Log in to the Orchestrator for a routing value and set up its render/validate/upload pipeline
+# Runs on the Orchestrator's own thread, so several Orchestrators are set up in parallel
+def open_target(key):
+    if key and orchestrator_map:
+        entry = orchestrator_map.get(key, {"url": None})
+    else:
+        entry = {"url": key or orch_url}
+    target = {
+        "name": key or orch_url,
+        "url": entry["url"],
+        "error": None,
+        "hostnames": [],
+        "limiter": new_limiter(),
+        "orch": None,
+        "orch_helper": None,
+        "preconfig_sync": None,
+        "references": None,
+        "approvals": 0,
+        "approved_ids": set(),
+        "login": None,
+    }
+
+    # Set up render/validate/upload pipeline, uploading only if option was chosen
+    target["pipeline"] = PreconfigPipeline(
+        partial(render_row, target),
+        partial(validate_row, target),
+        partial(upload_row, target) if upload_to_orch == True else None,
+        workers=workers,
+        report=partial(report_row, target),
+        streaming=vars(args)["stream"],
+        finished=partial(journal_row, target) if journal is not None else None,
+    )
+
+    if target["url"] is None:
+        target["error"] = "{} not in {}".format(key, vars(args)["orch_map"])
+        return target
+
+    # Offline runs never log in
+    if offline:
+        return target
+
+    # Connect to Orchestrator
+    user = entry.get("user", orch_user)
+    password = entry.get("password", orch_pw)
+    try:
+        target["orch"] = connect_orchestrator(
+            target["url"], target["limiter"], key if orch_column is not None else ""
+        )
+        logged_in = target["orch"].login(user, password)
+    except Exception as e:
+        logged_in = False
+        print("{}{}".format(target_prefix(target), stylize(e, red_text)))
+    if logged_in is False:
+        target["error"] = "Orchestrator {} login failed".format(target["url"])
+        target["orch"] = None
+        return target
+    # Logging in again when a long watch outlives the session
+    target["login"] = partial(target["orch"].login, user, password)
+
+    # Retrieve all template group and overlay names once to check every row's references
+    # A listing that fails leaves its names unchecked instead of failing the Orchestrator's rows
+    if reference_check:
+        with metrics.time("reference_fetch"):
+            template_groups = fetch_names(target["orch"], "get_all_template_groups")
+            overlays = fetch_names(target["orch"], "get_all_overlays")
+        target["references"] = ReferenceIndex(
+            template_groups,
+            overlays,
+            referenced_names.get(key, {}) if referenced_names is not None else None,
+        )
+        unchecked = target["references"].unchecked()
+        if unchecked:
+            print(
+                "{}Unable to retrieve {}, not checking their names".format(
+                    target_prefix(target),
+                    " and ".join(stylize(kind + "s", orange_text) for kind in unchecked),
+                )
+            )
+        # Names the pre-pass found unknown, reported before any of their rows is processed
+        unknown = target["references"].unknown_references()
+        if unknown:
+            print(
+                "{}Names unknown to Orchestrator, their rows will be rejected:".format(
+                    target_prefix(target)
+                )
+            )
+            for kind, name, rows, row_numbers in unknown:
+                print(
+                    "{}  {} {} used by {} rows ({}{})".format(
+                        target_prefix(target),
+                        kind,
+                        stylize(name, red_text),
+                        rows,
+                        "row " if rows == 1 else "rows ",
+                        ", ".join(str(row_number) for row_number in row_numbers)
+                        + (", ..." if rows > len(row_numbers) else ""),
                     )
-                else:
-                    pass
-            else:
-                print("Preconfig failed validation")
+                )
 
-            row_number = row_number + 1
+    # OrchHelper for the calls the SDK client lacks: streamed preconfig listings when syncing
+    # and the discovered appliance list when watching
+    if (vars(args)["sync"] and upload_to_orch == True) or vars(args)["watch"]:
+        if isinstance(target["orch"], HelperOrchestrator):
+            target["orch_helper"] = target["orch"].helper
+        else:
+            target["orch_helper"] = OrchHelper(
+                target["url"],
+                user,
+                password,
+                pool_size=pool_size,
+                limiter=target["limiter"],
+                cache=response_cache,
+                **helper_options
+            )
+            target["orch_helper"].login()
+            target["login"] = target["orch_helper"].login
 
+    # If syncing uploads, retrieve existing preconfigs with their YAML in one bulk call
+    if vars(args)["sync"] and upload_to_orch == True:
+        # Parsed as the listing arrives, the full response body is never held in memory and
+        # only a hash of each preconfig's YAML is kept
+        existing_preconfigs = target["orch_helper"].iter_all_preconfig(filter=None)
+        if existing_preconfigs is not False:
+            target["preconfig_sync"] = PreconfigSync(
+                existing_preconfigs, partial(get_config_data, target["orch_helper"])
+            )
         else:
             print(
-                "No hostname for Silver Peak EdgeConnect from row {}: no preconfig created".format(
-                    stylize(row_number, red_text)
+                "{}Unable to retrieve existing preconfigs, uploading all valid preconfigs".format(
+                    target_prefix(target)
+                )
+            )
+    return target
+
+
+# Hand a CSV row to its Orchestrator's pipeline with the template selected for it
+def process_row(target, row_number, row, template):
+    if row["hostname"] == "":
+        target["pipeline"].skip(
+            row_number,
+            "",
+            "No hostname for Silver Peak EdgeConnect from row {}: no preconfig created".format(
+                stylize(row_number, red_text)
+            ),
+        )
+    elif target["error"] is not None:
+        target["pipeline"].skip(
+            row_number,
+            row["hostname"],
+            "{} for row {}: no preconfig created".format(
+                target["error"], stylize(row_number, red_text)
+            ),
+        )
+    elif template.get("error") is not None:
+        target["pipeline"].skip(
+            row_number,
+            row["hostname"],
+            "Unable to load jinja template {} for row {}: {}".format(
+                stylize(template["name"], red_text), row_number, template["error"]
+            ),
+            status=STATUS_INVALID,
+        )
+    else:
+        # Reject rows missing values the template requires before rendering them
+        if column_check:
+            with metrics.time("column_check"):
+                errors = template["schema"].check(row)
+            if errors:
+                target["pipeline"].skip(
+                    row_number,
+                    row["hostname"],
+                    "Row {} for {} is missing required values:".format(
+                        row_number, stylize(row["hostname"], red_text)
+                    ),
+                    status=STATUS_INVALID,
+                    details=["  " + error for error in errors],
+                )
+                return
+        # Track hosts added for Orchestrator approval, only kept when appliances are approved
+        if track_hostnames:
+            target["hostnames"].append(sys.intern(row["hostname"]))
+        target["pipeline"].submit(row_number, row, template)
+
+
+# Pre-pass over the whole inventory collecting the template group and overlay names each
+# Orchestrator's rows reference, so unknown names are reported before any per-row request.
+# stdin can only be read once, its rows are checked against Orchestrator's names as they come
+referenced_names = None
+if reference_check and not offline and csv_filename != "-":
+    with metrics.time("reference_scan"):
+        reference_rows = open_input_rows(
+            csv_filename,
+            vars(args)["input_format"],
+            list_columns,
+            columns=set(("hostname", orch_column, "templateGroups", "businessIntentOverlays")),
+        )
+        with closing(reference_rows):
+            referenced_names = collect_references(
+                reference_rows,
+                (lambda row: row.get(orch_column) or "") if orch_column is not None else None,
+            )
+
+# Hosts are matched to denied appliances after the run or while watching, otherwise not kept
+track_hostnames = not offline and (auto_apply_denied == True or vars(args)["watch"])
+
+# Route rows to one thread per Orchestrator
+fanout = FanOut(open_target, process_row)
+
+# Compare the CSV header with the columns a template requires
+def check_header(template):
+    missing_columns = template["schema"].missing_columns(input_rows.fieldnames)
+    if missing_columns:
+        print(
+            "CSV has no {} column{} required by {}".format(
+                ", ".join(stylize(column, red_text) for column in missing_columns),
+                "s" if len(missing_columns) > 1 else "",
+                template["name"],
+            )
+        )
+
+
+# Rows handed on per template, by template name
+template_rows = {}
+
+# Read site inventory rows lazily
+with closing(input_rows):
+    # Compare the CSV header with the columns the templates read
+    if input_rows.fieldnames:
+        for entry in known_templates:
+            check_header(entry)
+        # Columns of templates named by a column are only known once rows name them
+        if not template_selector.open_ended():
+            used_columns = set(("serial_number", orch_column))
+            used_columns.update(template_selector.columns())
+            for entry in known_templates:
+                used_columns.update(entry["schema"].columns)
+            unused_columns = [
+                column for column in input_rows.fieldnames if column not in used_columns
+            ]
+            if unused_columns:
+                print(
+                    "CSV columns not used by {}: {}".format(
+                        ", ".join(entry["name"] for entry in known_templates),
+                        ", ".join(
+                            stylize(column, orange_text) for column in unused_columns
+                        ),
+                    )
                 )
+
+    # With --template-window above 1, rows are grouped per template a window of rows at a time,
+    # so each template is looked up once per group and renders its rows back to back. Grouping
+    # reorders rows within the window, so by default rows are handed on one at a time in CSV
+    # order, and a single template needs no grouping
+    for template_name, group in group_rows(
+        metrics.timed_iter("csv_parse", input_rows),
+        template_selector,
+        vars(args)["template_window"] if selecting_templates else 1,
+    ):
+        try:
+            template = templates.get(template_name)
+        except TemplateError as e:
+            template = {"name": template_name, "error": e}
+        if template_name not in template_rows:
+            template_rows[template_name] = 0
+            # Templates named by a column are checked against the header on first use
+            if (
+                input_rows.fieldnames
+                and template.get("error") is None
+                and template_name not in template_selector.known_templates()
+            ):
+                check_header(template)
+        template_rows[template_name] = template_rows[template_name] + len(group)
+
+        # For each row/site in configuration file, generate Silver Peak and Aruba configurations
+        for row_number, row in group:
+            if orch_column is not None:
+                fanout.submit(row.get(orch_column) or "", row_number, row, template)
+            else:
+                fanout.submit("", row_number, row, template)
+
+# Wait for every Orchestrator to take its rows
+targets = fanout.close()
+for key, error in fanout.errors.items():
+    print(
+        "{}: {}, {} rows not processed".format(
+            stylize(key or orch_url, red_text), error, fanout.dropped.get(key, 0)
+        )
+    )
+
+# Wait for outstanding rows, reported in CSV order per Orchestrator
+row_count = 0
+run_summary = {}
+for target in targets.values():
+    row_results = target["pipeline"].close()
+    row_count = row_count + len(row_results)
+    target_summary = target["pipeline"].summary()
+    for status, count in target_summary.items():
+        run_summary[status] = run_summary.get(status, 0) + count
+    if orch_column is not None:
+        print(
+            "{}Processed {} rows: {}".format(
+                target_prefix(target),
+                len(row_results),
+                ", ".join(
+                    "{} {}".format(count, status)
+                    for status, count in target_summary.items()
+                ),
             )
+        )
 
-            row_number = row_number + 1
+# Wait for queued preconfig files
+with metrics.time("write_flush"):
+    output_writer.close()
+for output_filename, error in output_writer.errors:
+    print(
+        "Unable to write {}: {}".format(stylize(output_filename, red_text), error)
+    )
 
+# Save outcome of processed rows for the next run
+if state_store is not None:
+    state_store.save()
+
+# Console summary of row outcomes, merged across Orchestrators
+print(
+    "Processed {} rows: {}".format(
+        row_count,
+        ", ".join("{} {}".format(count, status) for status, count in run_summary.items()),
+    )
+)
+for status, count in run_summary.items():
+    metrics.set_counter("rows", count, {"status": status})
+writer_summary = output_writer.summary()
+print(
+    "Preconfig files{}: {} written, {} unchanged, {} failed".format(
+        " in " + vars(args)["archive"] if vars(args)["archive"] else "",
+        stylize(writer_summary["written"], green_text),
+        writer_summary["unchanged"],
+        writer_summary["failed"],
+    )
+)
+for outcome in ("written", "unchanged", "failed"):
+    metrics.set_counter("output_files", writer_summary[outcome], {"outcome": outcome})
+if selecting_templates:
+    template_summary = templates.summary()
+    print(
+        "Rows per template: {}; {} templates loaded, {} evicted".format(
+            ", ".join(
+                "{} {}".format(stylize(name, blue_text), rows)
+                for name, rows in template_rows.items()
+            ),
+            template_summary["loaded"],
+            template_summary["evictions"],
+        )
+    )
+for name, rows in template_rows.items():
+    metrics.set_counter("template_rows", rows, {"template": name})
+# Unknown template group and overlay names, rows summed across Orchestrators
+for kind, name, rows in merge_summaries(
+    target["references"].summary()
+    for target in targets.values()
+    if target["references"] is not None
+):
+    print("Unknown {} {} used by {} rows".format(kind, stylize(name, red_text), rows))
+for target in targets.values():
+    if target["preconfig_sync"] is not None:
+        print(
+            "{}Orchestrator preconfig sync: {}".format(
+                target_prefix(target), target["preconfig_sync"].summary()
+            )
+        )
+    if target["limiter"] is not None and target["orch"] is not None:
+        limiter_summary = target["limiter"].summary()
+        print(
+            "{}Orchestrator concurrency limit {} (range {}-{}), {} decreases, {} of {} responses overloaded, {} requests/sec{}".format(
+                target_prefix(target),
+                stylize(limiter_summary["limit"], green_text),
+                limiter_summary["lowest_limit"],
+                limiter_summary["highest_limit"],
+                limiter_summary["decreases"],
+                limiter_summary["overloaded"],
+                limiter_summary["requests"],
+                limiter_summary["requests_per_second"],
+                " (capped at {})".format(limiter_summary["max_rps"])
+                if limiter_summary["max_rps"]
+                else "",
+            )
+        )
+        labels = {"orchestrator": target["name"]}
+        metrics.set_counter(
+            "orchestrator_concurrency_limit", limiter_summary["limit"], labels
+        )
+        metrics.set_counter(
+            "orchestrator_requests_per_second",
+            limiter_summary["requests_per_second"],
+            labels,
+        )
 
-# If auto-apply option was chosen, also approve any matching appliances in denied discovered list
-if auto_apply_denied == True:
 
-    # Retrieve all denied discovered appliances from Orchestrator
-    all_denied_appliances = orch.get_all_denied_appliances()
+# Approve any matching appliances in an Orchestrator's denied discovered list
+# Returns the console lines to print, so Orchestrators approving in parallel do not interleave
+def approve_denied(target):
+    orch = target["orch"]
+    lines = []
 
-    # Retrieve all preconfigs from Orchestrator
-    all_preconfigs = orch.get_all_preconfig()
+    # Retrieve all denied discovered appliances and all preconfigs from Orchestrator,
+    # indexing reachable denied appliances by site and preconfigs by name
+    with metrics.time("approval_fetch"):
+        if isinstance(orch, HelperOrchestrator):
+            # Both listings are fetched at once and indexed while they arrive
+            with ThreadPoolExecutor(max_workers=1) as fetch_pool:
+                denied_index = fetch_pool.submit(
+                    lambda: index_denied_appliances(orch.iter_all_denied_appliances())
+                )
+                preconfig_index = index_preconfigs(orch.iter_all_preconfig())
+                denied_index = denied_index.result()
+        else:
+            denied_index = index_denied_appliances(orch.get_all_denied_appliances())
+            preconfig_index = index_preconfigs(orch.get_all_preconfig())
 
-    # Dict of Denied Appliances to approve with discovered_id and preconfig_id to apply
-    approve_dict = {}
+    # Match indexes against each EdgeConnect host in the source csv
+    with metrics.time("approval_match"):
+        match = match_denied_appliances(
+            target["hostnames"], preconfig_index, denied_index
+        )
+    approve_dict = match["approve"]
 
-    # For each EdgeConnect host in the source csv
-    # check against all preconfigs for matching tag
-    # and check against all discovered denied appliances with the same tag that are reachable
-    for host in silverpeak_hostname_list:
-        for preconfig in all_preconfigs:
-            for appliance in all_denied_appliances:
-                if (
-                    host == preconfig["name"] == appliance["applianceInfo"]["site"]
-                    and appliance["applianceInfo"]["reachabilityStatus"] == 1
-                ):
-                    approve_dict[host] = {
-                        "discovered_id": appliance["id"],
-                        "preconfig_id": preconfig["id"],
-                    }
-                else:
-                    pass
+    lines.append(
+        "{}Matched {} denied appliances to preconfigs, {} hosts without a reachable denied match".format(
+            target_prefix(target),
+            stylize(len(approve_dict), green_text),
+            len(match["unmatched"]),
+        )
+    )
+    for host in match["duplicates"]:
+        lines.append(
+            "{}Multiple matches for {}: {} preconfigs, {} denied appliances, using the last of each".format(
+                target_prefix(target),
+                stylize(host, orange_text),
+                match["duplicates"][host]["preconfigs"],
+                match["duplicates"][host]["appliances"],
+            )
+        )
 
     # Approve and apply corresponding preconfig for each of the matched appliances
     # This simulates the functionality of 'auto-approve' with previously denied/deleted devices
     for appliance in approve_dict:
-        orch.approve_and_apply_preconfig(
-            approve_dict[appliance]["preconfig_id"],
-            approve_dict[appliance]["discovered_id"],
-        )
+        # Approved before the run being resumed was interrupted
+        if resume and journal.is_approved(target["name"], appliance):
+            lines.append(
+                "{}{} already approved, skipping".format(
+                    target_prefix(target), stylize(appliance, blue_text)
+                )
+            )
+            continue
+        with metrics.time("approve"):
+            approved = orch.approve_and_apply_preconfig(
+                approve_dict[appliance]["preconfig_id"],
+                approve_dict[appliance]["discovered_id"],
+            )
+        target["approvals"] = target["approvals"] + 1
+        if approved is not False:
+            target["approved_ids"].add(approve_dict[appliance]["discovered_id"])
+        if journal is not None:
+            # OrchHelper based clients report a failed approval as False
+            journal.write(
+                RECORD_APPROVAL,
+                hostname=appliance,
+                orchestrator=target["name"],
+                preconfig_id=approve_dict[appliance]["preconfig_id"],
+                discovered_id=approve_dict[appliance]["discovered_id"],
+                outcome=APPROVAL_FAILED if approved is False else APPROVAL_APPROVED,
+            )
+    return lines
+
+
+# Orchestrators that were logged in to
+connected_targets = [target for target in targets.values() if target["orch"] is not None]
+
+# If auto-apply option was chosen, also approve any matching appliances in denied discovered
+# lists, on each Orchestrator in parallel
+if auto_apply_denied == True and connected_targets:
+    with ThreadPoolExecutor(max_workers=len(connected_targets)) as approval_pool:
+        for approval in [
+            approval_pool.submit(approve_denied, target) for target in connected_targets
+        ]:
+            for line in approval.result():
+                print(line)
 
 else:
     pass
 
-# Logout from Orchestrator if logged in
-orch.logout()
+
+# Approval watcher for an Orchestrator, polling its denied and discovered lists
+def new_watcher(target):
+    # OrchHelper listings report a failed request as False, so a failed poll is not taken as
+    # empty lists
+    helper = target["orch_helper"]
+    return ApprovalWatcher(
+        target["hostnames"],
+        [helper.iter_all_denied_appliances, helper.iter_all_discovered_appliances],
+        helper.iter_all_preconfig,
+        helper.approve_and_apply_preconfig,
+        seen=target["approved_ids"],
+        preconfig_refresh=max(60.0, vars(args)["watch_interval"]),
+    )
+
+
+# Poll an Orchestrator for new appliances and approve those matching a preconfig
+# Returns the console lines to print, so Orchestrators polled in parallel do not interleave
+def watch_poll(target):
+    lines = []
+    with metrics.time("watch_poll"):
+        events = target["watcher"].poll()
+    if events is None:
+        # Log in again in case the session expired, the next poll retries the listings
+        lines.append(
+            "{}Unable to list denied and discovered appliances, logging in again".format(
+                target_prefix(target)
+            )
+        )
+        try:
+            target["login"]()
+        except Exception as e:
+            lines.append("{}{}".format(target_prefix(target), stylize(e, red_text)))
+        return lines
+    for event, host, detail in events:
+        if event == EVENT_WAITING:
+            lines.append(
+                "{}{} appeared without a preconfig on Orchestrator, waiting for one".format(
+                    target_prefix(target), stylize(host, orange_text)
+                )
+            )
+        elif event == EVENT_DUPLICATE:
+            lines.append(
+                "{}Multiple matches for {}: {} preconfigs, {} appliances, using the last of each".format(
+                    target_prefix(target),
+                    stylize(host, orange_text),
+                    detail["preconfigs"],
+                    detail["appliances"],
+                )
+            )
+        else:
+            target["approvals"] = target["approvals"] + 1
+            lines.append(
+                "{}{} {} with preconfig {}".format(
+                    target_prefix(target),
+                    "Approved" if event == EVENT_APPROVED else "Failed to approve",
+                    stylize(host, green_text if event == EVENT_APPROVED else red_text),
+                    detail["preconfig_id"],
+                )
+            )
+            if journal is not None:
+                journal.write(
+                    RECORD_APPROVAL,
+                    hostname=host,
+                    orchestrator=target["name"],
+                    preconfig_id=detail["preconfig_id"],
+                    discovered_id=detail["discovered_id"],
+                    outcome=APPROVAL_APPROVED
+                    if event == EVENT_APPROVED
+                    else APPROVAL_FAILED,
+                    watch=True,
+                )
+    return lines
+
+
+# Keep approving appliances matching a preconfig as they come online, on each Orchestrator in
+# parallel, until interrupted or --watch-duration has passed
+if vars(args)["watch"] and offline:
+    print(stylize("--watch needs Orchestrator, not watching in an --offline run", red_text))
+elif vars(args)["watch"] and connected_targets:
+    watch_interval = vars(args)["watch_interval"]
+    if vars(args)["watch_duration"] is not None:
+        watch_deadline = time.monotonic() + vars(args)["watch_duration"]
+    else:
+        watch_deadline = None
+    for target in connected_targets:
+        target["watcher"] = new_watcher(target)
+    print(
+        "Watching denied and discovered appliances every {}s for {} hosts, Ctrl-C to stop".format(
+            watch_interval,
+            stylize(
+                sum(len(set(target["hostnames"])) for target in connected_targets),
+                green_text,
+            ),
+        )
+    )
+    try:
+        with ThreadPoolExecutor(max_workers=len(connected_targets)) as watch_pool:
+            while True:
+                poll_started = time.monotonic()
+                for lines in watch_pool.map(watch_poll, connected_targets):
+                    for line in lines:
+                        print(line)
+                # Approvals are on disk before the next poll, however long the watch runs
+                if journal is not None:
+                    journal.flush()
+                next_poll = poll_started + watch_interval
+                if watch_deadline is not None and next_poll > watch_deadline:
+                    break
+                time.sleep(max(0.0, next_poll - time.monotonic()))
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    except Exception as e:
+        # Anything a failed poll does not cover ends the watch, the run still logs out and
+        # writes its summary
+        print("Stopped watching: {}".format(stylize(e, red_text)))
+    for target in connected_targets:
+        watch_summary = target["watcher"].summary()
+        print(
+            "{}Watched {} polls ({} failed): {} new appliances, {} approved, {} failed, {} hosts waiting for a preconfig, {} preconfig listings".format(
+                target_prefix(target),
+                watch_summary["polls"],
+                watch_summary["failed_polls"],
+                watch_summary["new"],
+                stylize(watch_summary["approved"], green_text),
+                watch_summary["failed"],
+                watch_summary["waiting"],
+                watch_summary["preconfig_fetches"],
+            )
+        )
+        labels = {"orchestrator": target["name"]}
+        for counter in ("polls", "new", "approved", "failed"):
+            metrics.set_counter("watch_" + counter, watch_summary[counter], labels)
+
+# Logout from Orchestrators if logged in
+for target in connected_targets:
+    target["orch"].logout()
+    if target["orch_helper"] is not None and not isinstance(
+        target["orch"], HelperOrchestrator
+    ):
+        target["orch_helper"].logout()
+
+# Close the journal with the outcome of the run
+if journal is not None:
+    journal.write(
+        RECORD_SUMMARY,
+        rows=run_summary,
+        approvals=sum(target["approvals"] for target in targets.values()),
+    )
+    journal.close()
+
+# Orchestrator lookup cache effectiveness
+if response_cache is not None:
+    cache_summary = response_cache.summary()
+    print(
+        "Orchestrator lookup cache: {} hits ({} from disk), {} misses, {} invalidated, {} evicted".format(
+            stylize(cache_summary["hits"], green_text),
+            cache_summary["disk_hits"],
+            cache_summary["misses"],
+            cache_summary["invalidations"],
+            cache_summary["evictions"],
+        )
+    )
+    for counter in ("hits", "misses", "invalidations", "evictions"):
+        metrics.set_counter("orchestrator_cache_" + counter, cache_summary[counter])
+
+# Write per-phase timing metrics for this run
+for phase, phase_summary in metrics.snapshot()["phases"].items():
+    print(
+        "{}: {} in {:.3f}s, p50 {:.1f}ms, p99 {:.1f}ms".format(
+            phase,
+            phase_summary["count"],
+            phase_summary["total_seconds"],
+            phase_summary["p50_seconds"] * 1000,
+            phase_summary["p99_seconds"] * 1000,
+        )
+    )
+if vars(args)["metrics_json"]:
+    metrics.write_json(vars(args)["metrics_json"])
+if vars(args)["metrics_prom"]:
+    metrics.write_prometheus(vars(args)["metrics_prom"])
+
+# Per-endpoint Orchestrator latency and trace file
+if tracer is not None:
+    for endpoint, endpoint_summary in tracer.summary().items():
+        print(
+            "{}: {} requests in {:.3f}s, p50 {:.1f}ms, p99 {:.1f}ms, max {:.1f}ms".format(
+                stylize(endpoint, blue_text),
+                endpoint_summary["count"],
+                endpoint_summary["total_seconds"],
+                endpoint_summary["p50_seconds"] * 1000,
+                endpoint_summary["p99_seconds"] * 1000,
+                endpoint_summary["max_seconds"] * 1000,
+            )
+        )
+    if vars(args)["trace"]:
+        tracer.write(vars(args)["trace"], vars(args)["trace_format"])
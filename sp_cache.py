@@ -0,0 +1,256 @@
+#
+# sp_cache.py - response cache for read-only Orchestrator lookups
+#
+# CachingTransport wraps an sp_transport transport and answers GET requests to the endpoints in
+# its ResponseCache's TTL table from the cache while they are fresh. Entries are kept in a size
+# bounded LRU and, optionally, in a directory shared by later runs, one file per Orchestrator
+# and request so separate invocations during a rollout window reuse each other's lookups.
+#
+# Any other request that may change Orchestrator state invalidates the cached entries of the
+# resource it writes to, e.g. posting a template group drops the cached template group list
+# and that group. Responses stored while an invalidation happened are not kept.
+#
+# Cached responses may contain preconfig YAML, the cache directory is created readable by its
+# owner only.
+#
+
+# Standard library imports
+import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote, unquote, urlparse
+
+# Local application imports
+from preconfig_metrics import write_atomic
+from sp_trace import REST_PREFIX, endpoint_template
+from sp_transport import IDEMPOTENT_POST_SUFFIXES, ReplayResponse, request_path
+
+# Seconds an endpoint's responses stay fresh, by endpoint template
+# Denied and discovered appliances change as appliances come online and are never cached
+DEFAULT_TTLS = {
+    "/template/templateGroups": 300,
+    "/template/templateGroups/{id}": 300,
+    "/gms/overlays/config": 300,
+    "/appliance": 60,
+    "/gms/appliance/preconfiguration": 30,
+}
+
+
+def related_resources(write_path):
+    # Resources changed by a write besides the one written and those above and below it
+    if write_path.startswith(("/template/templateCreate", "/template/templateSelection/")):
+        return ("/template/templateGroups",)
+    if write_path.startswith("/appliance/") or "/apply/" in write_path:
+        # Approving or deleting appliances, applying preconfigs
+        return ("/appliance",)
+    return ()
+
+
+def resource_path(path):
+    # /gms/rest/template/templateGroups/Branch?source=... -> /template/templateGroups/Branch
+    path = path.split("?", 1)[0]
+    if path.startswith(REST_PREFIX):
+        path = path[len(REST_PREFIX):]
+    return path.rstrip("/")
+
+
+def invalidated_by(write_path, cached_path):
+    # True if writing write_path may change the response cached for cached_path
+    # A write affects the resource written, the collections above it and everything below it
+    if cached_path == write_path:
+        return True
+    if write_path.startswith(cached_path + "/") or cached_path.startswith(write_path + "/"):
+        return True
+    for resource in related_resources(write_path):
+        if cached_path == resource or cached_path.startswith(resource + "/"):
+            return True
+    return False
+
+
+class ResponseCache:
+    # ttls maps endpoint templates (see sp_trace.endpoint_template) to seconds, defaults to
+    # DEFAULT_TTLS, endpoints not listed are not cached
+    # max_entries bounds the in-memory LRU, max_entry_bytes the size of a cached response
+    # directory is an optional store shared across runs, None keeps the cache in memory only
+    def __init__(self, ttls=None, max_entries=256, max_entry_bytes=16777216, directory=None):
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        self.lock = threading.Lock()
+        # (host, request path) -> (expires, record)
+        self.entries = OrderedDict()
+        # Incremented by every invalidation, so responses fetched across one are not stored
+        self.generation = 0
+        self.counters = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def ttl(self, path):
+        return self.ttls.get(endpoint_template(path))
+
+    def get(self, host, path):
+        # Fresh cached record for a request or None, counting hits and misses
+        key = (host, path)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.counters["hits"] = self.counters["hits"] + 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+        entry = self.read_entry(host, path, now)
+        with self.lock:
+            if entry is None:
+                self.counters["misses"] = self.counters["misses"] + 1
+                return None
+            self.counters["hits"] = self.counters["hits"] + 1
+            self.counters["disk_hits"] = self.counters["disk_hits"] + 1
+            self.remember(key, entry)
+        return entry[1]
+
+    def put(self, host, path, record, generation):
+        # Store a record fetched while the cache was at generation
+        expires = time.time() + self.ttl(path)
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.remember((host, path), (expires, record))
+            self.counters["stores"] = self.counters["stores"] + 1
+        self.write_entry(host, path, expires, record)
+
+    def remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.counters["evictions"] = self.counters["evictions"] + 1
+
+    def invalidate(self, host, path):
+        # Drop cached entries of host changed by a write to path
+        write_path = resource_path(path)
+        with self.lock:
+            self.generation = self.generation + 1
+            for key in list(self.entries):
+                if key[0] == host and invalidated_by(write_path, resource_path(key[1])):
+                    del self.entries[key]
+                    self.counters["invalidations"] = self.counters["invalidations"] + 1
+        if self.directory:
+            host_directory = self.host_directory(host)
+            if os.path.isdir(host_directory):
+                for filename in os.listdir(host_directory):
+                    if filename.endswith(".json") and invalidated_by(
+                        write_path, resource_path(unquote(filename[: -len(".json")]))
+                    ):
+                        self.remove_file(os.path.join(host_directory, filename))
+
+    def summary(self):
+        with self.lock:
+            summary = dict(self.counters)
+            summary["entries"] = len(self.entries)
+        lookups = summary["hits"] + summary["misses"]
+        summary["hit_ratio"] = round(summary["hits"] / lookups, 3) if lookups else 0.0
+        return summary
+
+    # On-disk store, one JSON file per Orchestrator host and request path
+
+    def host_directory(self, host):
+        return os.path.join(self.directory, quote(host, safe=""))
+
+    def entry_filename(self, host, path):
+        return os.path.join(self.host_directory(host), quote(path, safe="") + ".json")
+
+    def read_entry(self, host, path, now):
+        if not self.directory:
+            return None
+        filename = self.entry_filename(host, path)
+        try:
+            with open(filename) as entry_file:
+                stored = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+        if stored["expires"] <= now:
+            self.remove_file(filename)
+            return None
+        return stored["expires"], stored["record"]
+
+    def write_entry(self, host, path, expires, record):
+        if not self.directory:
+            return
+        # Best effort, another run may be writing the same entry
+        try:
+            os.makedirs(self.host_directory(host), mode=0o700, exist_ok=True)
+            write_atomic(
+                self.entry_filename(host, path), json.dumps({"expires": expires, "record": record})
+            )
+        except OSError:
+            pass
+
+    def remove_file(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+def is_state_changing(method, url):
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return False
+    return not (method == "POST" and urlparse(url).path.endswith(IDEMPOTENT_POST_SUFFIXES))
+
+
+def response_record(response):
+    # Cacheable form of a response, in the sp_transport recording format
+    return {
+        "status": response.status_code,
+        "content_type": response.headers.get("Content-Type", ""),
+        "body": base64.b64encode(response.content).decode("ascii"),
+    }
+
+
+class CachingTransport:
+    def __init__(self, transport, cache):
+        self.transport = transport
+        self.cache = cache
+
+    def request(self, method, url, **kwargs):
+        host = urlparse(url).netloc
+        path = request_path(url)
+        if method != "GET" or self.cache.ttl(path) is None:
+            try:
+                return self.transport.request(method, url, **kwargs)
+            finally:
+                # Invalidate even when the write failed, it may still have been applied
+                if is_state_changing(method, url):
+                    self.cache.invalidate(host, path)
+
+        record = self.cache.get(host, path)
+        if record is not None:
+            return ReplayResponse(record)
+
+        generation = self.cache.generation
+        response = self.transport.request(method, url, **kwargs)
+        if response.status_code == 200:
+            # Streamed responses are only read into the cache when their size is known and small
+            if kwargs.get("stream"):
+                length = response.headers.get("Content-Length", "")
+                if not length.isdigit() or int(length) > self.cache.max_entry_bytes:
+                    return response
+            if len(response.content) <= self.cache.max_entry_bytes:
+                self.cache.put(host, path, response_record(response), generation)
+        return response
+
+    def close(self):
+        self.transport.close()
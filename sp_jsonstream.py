@@ -0,0 +1,110 @@
+#
+# sp_jsonstream.py - incremental parsing of JSON list responses from Orchestrator
+#
+# Listings such as all preconfigs or all denied appliances are a single JSON list. Rather than
+# loading the whole body and parsing it at once, iter_json_array parses the body as it arrives
+# and yields each entry as soon as it is complete, so callers can index entries while the rest
+# of the listing is still being received and the raw body is never held in memory as a whole.
+#
+
+# Standard library imports
+import codecs
+import json
+
+# Body bytes read per chunk
+CHUNK_SIZE = 65536
+
+WHITESPACE = " \t\r\n"
+
+# Parser states
+EXPECT_START = 0
+EXPECT_FIRST = 1
+EXPECT_ENTRY = 2
+EXPECT_SEPARATOR = 3
+DONE = 4
+
+decoder = json.JSONDecoder()
+
+
+def skip_whitespace(text, position):
+    while position < len(text) and text[position] in WHITESPACE:
+        position = position + 1
+    return position
+
+
+class JSONArrayParser:
+    # Push parser for a JSON list arriving in chunks of UTF-8 bytes, for callers that receive the
+    # chunks themselves, e.g. from an asyncio response
+
+    def __init__(self):
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.state = EXPECT_START
+
+    def feed(self, chunk):
+        # Returns the list entries completed by chunk
+        # Raises ValueError if the body is not a JSON list
+        entries = []
+        buffer = self.buffer + self.text_decoder.decode(chunk)
+        position = 0
+        state = self.state
+        while state != DONE:
+            position = skip_whitespace(buffer, position)
+            if position >= len(buffer):
+                break
+            character = buffer[position]
+            if state == EXPECT_START:
+                if character != "[":
+                    raise ValueError("expected a JSON list, got {0!r}".format(buffer[position : position + 20]))
+                position = position + 1
+                state = EXPECT_FIRST
+            elif state == EXPECT_SEPARATOR or (state == EXPECT_FIRST and character == "]"):
+                if character == "]":
+                    state = DONE
+                elif character == "," and state == EXPECT_SEPARATOR:
+                    state = EXPECT_ENTRY
+                else:
+                    raise ValueError("expected , or ] in JSON list, got {0!r}".format(character))
+                position = position + 1
+            else:
+                # An entry is complete once it decodes and is followed by a delimiter, a number
+                # at the end of the buffer may still continue in the next chunk
+                try:
+                    entry, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    break
+                if end >= len(buffer) or buffer[end] not in WHITESPACE + ",]":
+                    break
+                entries.append(entry)
+                position = end
+                state = EXPECT_SEPARATOR
+        self.buffer = buffer[position:]
+        self.state = state
+        return entries
+
+    def close(self):
+        # Raises ValueError if the body ended before the end of the list
+        if self.state != DONE:
+            # Decode what is left for the parser's own error message
+            if self.buffer.strip():
+                decoder.raw_decode(self.buffer, skip_whitespace(self.buffer, 0))
+            raise ValueError("JSON list ended early")
+
+
+def iter_json_array(chunks):
+    # Yields the entries of the JSON list whose UTF-8 bytes arrive as chunks
+    # Raises ValueError if the body is not a JSON list or ends early
+    parser = JSONArrayParser()
+    for chunk in chunks:
+        for entry in parser.feed(chunk):
+            yield entry
+    parser.close()
+
+
+def iter_response_list(response, chunk_size=CHUNK_SIZE):
+    # Entries of a JSON list response, requested with stream=True, closing it when done
+    try:
+        for entry in iter_json_array(response.iter_content(chunk_size)):
+            yield entry
+    finally:
+        response.close()
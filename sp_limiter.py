@@ -0,0 +1,158 @@
+#
+# sp_limiter.py - adaptive concurrency and rate limiting toward Orchestrator
+#
+# AdaptiveLimiter bounds the requests in flight with an AIMD limit: every response while latency
+# is normal raises the limit by 1/limit (about +1 per round of requests), while a 429, a 5xx, a
+# connection error or raised latency halves it. Only requests started after the last decrease
+# can decrease it again, so one burst of slow responses counts as a single congestion event.
+# Like TCP slow start, the limit starts at min_limit and grows by 1 per response until the first
+# decrease.
+# Latency is raised when the recent (moving average) response time of an endpoint exceeds
+# latency_target if given, otherwise latency_tolerance times its baseline: the fastest response
+# seen from that endpoint, i.e. how fast it answers when not loaded. The baseline creeps up
+# slowly so it follows an Orchestrator that has become slower for good.
+#
+# An optional hard requests-per-second cap spaces request starts evenly.
+# LimitingTransport applies a limiter to an sp_transport transport.
+#
+
+# Standard library imports
+import threading
+import time
+
+# Local application imports
+from sp_trace import endpoint_template
+
+# Weight of each response in the recent latency moving average
+RECENT_WEIGHT = 0.2
+# Baseline growth per slower response, doubling after about 700 responses
+BASELINE_DRIFT = 1.001
+
+
+class AdaptiveLimiter:
+    # min_limit / max_limit bound the in-flight limit
+    # adaptive=False keeps the limit fixed at max_limit (e.g. only to apply max_rps)
+    # max_rps caps request starts per second, None for no cap
+    def __init__(
+        self,
+        min_limit=1,
+        max_limit=10,
+        adaptive=True,
+        max_rps=None,
+        latency_target=None,
+        latency_tolerance=2.0,
+        decrease_ratio=0.5,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.adaptive = adaptive
+        self.limit = float(self.min_limit if adaptive else self.max_limit)
+        self.slow_start = adaptive
+        self.max_rps = max_rps
+        self.latency_target = latency_target
+        self.latency_tolerance = latency_tolerance
+        self.decrease_ratio = decrease_ratio
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        # Waiting requests are admitted first come, first served by ticket number
+        self.next_ticket = 0
+        self.serving = 0
+        self.next_start = 0.0
+        self.last_decrease = 0.0
+        self.baselines = {}
+        # Counters for summary()
+        self.requests = 0
+        self.overloaded = 0
+        self.decreases = 0
+        self.lowest_limit = self.limit
+        self.highest_limit = self.limit
+        self.first_start = None
+        self.last_finish = None
+
+    def acquire(self):
+        # Blocks until a request may start, returns its start time for release()
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket = self.next_ticket + 1
+            while ticket != self.serving or self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.serving = self.serving + 1
+            self.in_flight = self.in_flight + 1
+            # Let the next ticket in if there is room
+            self.condition.notify_all()
+            now = time.monotonic()
+            start = now
+            if self.max_rps:
+                start = max(now, self.next_start)
+                self.next_start = start + 1.0 / self.max_rps
+            if self.first_start is None:
+                self.first_start = start
+        if start > now:
+            time.sleep(start - now)
+        return start
+
+    def release(self, started, endpoint, status=None, failed=False):
+        # status is the HTTP status, failed=True for requests ending in an exception
+        now = time.monotonic()
+        latency = now - started
+        with self.condition:
+            self.in_flight = self.in_flight - 1
+            self.requests = self.requests + 1
+            self.last_finish = now
+
+            # Per endpoint recent latency and baseline
+            recent, baseline = self.baselines.get(endpoint, (latency, latency))
+            recent = recent + (latency - recent) * RECENT_WEIGHT
+            baseline = min(latency, baseline * BASELINE_DRIFT)
+            self.baselines[endpoint] = (recent, baseline)
+            threshold = self.latency_target or baseline * self.latency_tolerance
+
+            overloaded = failed or status == 429 or (status or 0) >= 500 or recent > threshold
+            if overloaded:
+                self.overloaded = self.overloaded + 1
+            if self.adaptive:
+                if not overloaded:
+                    increase = 1.0 if self.slow_start else 1.0 / self.limit
+                    self.limit = min(float(self.max_limit), self.limit + increase)
+                elif started >= self.last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_ratio)
+                    self.last_decrease = now
+                    self.decreases = self.decreases + 1
+                    self.slow_start = False
+                self.lowest_limit = min(self.lowest_limit, self.limit)
+                self.highest_limit = max(self.highest_limit, self.limit)
+            self.condition.notify_all()
+
+    def summary(self):
+        with self.condition:
+            elapsed = (self.last_finish - self.first_start) if self.requests else 0.0
+            return {
+                "limit": round(self.limit, 2),
+                "lowest_limit": round(self.lowest_limit, 2),
+                "highest_limit": round(self.highest_limit, 2),
+                "decreases": self.decreases,
+                "requests": self.requests,
+                "overloaded": self.overloaded,
+                "requests_per_second": round(self.requests / elapsed, 2) if elapsed > 0 else 0.0,
+                "max_rps": self.max_rps,
+            }
+
+
+class LimitingTransport:
+    def __init__(self, transport, limiter):
+        self.transport = transport
+        self.limiter = limiter
+
+    def request(self, method, url, **kwargs):
+        started = self.limiter.acquire()
+        endpoint = "{0} {1}".format(method, endpoint_template(url))
+        try:
+            response = self.transport.request(method, url, **kwargs)
+        except Exception:
+            self.limiter.release(started, endpoint, failed=True)
+            raise
+        self.limiter.release(started, endpoint, response.status_code)
+        return response
+
+    def close(self):
+        self.transport.close()
@@ -6,24 +6,123 @@
 # Last update: Jul 2020
 # 
 
+import base64
+
 import requests
 
+from sp_cache import CachingTransport
+from sp_jsonstream import iter_response_list
+from sp_limiter import LimitingTransport
+from sp_trace import TracingTransport
+from sp_transport import RetryTransport, SessionTransport
+
 #optional python module for supporting hidden password entry. See getpass.getpass() function.
 import getpass 
 
 
-class OrchHelper:
+def orch_url_prefix(url):
+    # Orchestrator REST API base URL
+    # https:// is assumed unless url already carries a scheme (e.g. a local stand-in server for testing)
+    if url.startswith("http://") or url.startswith("https://"):
+        return url + "/gms/rest"
+    return "https://" + url + "/gms/rest"
+
+
+class OrchHelperBase:
+    # Connection settings, login payloads and CSRF-token handling shared by
+    # OrchHelper and the asyncio client in sp_orchhelper_async.AsyncOrchHelper
     def __init__(self, url, user, password):
         self.url = url
         self.user = user
         self.password = password
-        self.url_prefix = "https://" + url + "/gms/rest"
-        self.session = requests.Session()
+        self.url_prefix = orch_url_prefix(url)
         self.headers = {}
         self.apiSrcId = "?source=menu_rest_apis_id"  #for API calls w/ just source as query param
         self.apiSrcId2 = "&source=menu_rest_apis_id" #for API calls w/ multiple query params
         self.supportedAuthModes = ["local","radius","tacacs"] #remote authentication modes supported via this helper module
         self.authMode = "local"   # change this to the desired auth mode before invoking login() function.
+
+    def api_url(self, url):
+        # Full request URL including the source query parameter
+        apiSrcStr = self.apiSrcId if ("?" not in url) else self.apiSrcId2
+        return self.url_prefix + url + apiSrcStr
+
+    def login_body(self):
+        return {"user": self.user, "password": self.password, "loginType": self.supportedAuthModes.index(self.authMode)}
+
+    def mfa_login_body(self, mfacode):
+        return {"user": self.user, "password": self.password, "token": int(mfacode)}
+
+    def send_mfa_body(self):
+        return {"user": self.user, "password": self.password, "TempCode": True}
+
+    def preconfig_body(self, hostname, serialNum, yamlPreconfig, autoApply, tag="", comment=""):
+        # Preconfig create/modify body, YAML is sent base64 encoded in configData
+        return {
+            "name": hostname,
+            "serialNum": serialNum,
+            "tag": tag,
+            "comment": comment,
+            "autoApply": autoApply,
+            "configData": base64.b64encode(yamlPreconfig.encode("utf-8")).decode("ascii"),
+        }
+
+    def set_csrf_token(self, cookies):
+        # cookies is an iterable of (name, value) pairs from the login response
+        # get and set X-XSRF-TOKEN
+        for name, value in cookies:
+            if name == "orchCsrfToken":
+                self.headers["X-XSRF-TOKEN"] = value
+
+
+class OrchHelper(OrchHelperBase):
+    # transport sends the REST calls, defaults to a requests.Session
+    # see sp_transport for RecordingTransport / ReplayTransport
+    # limiter is an sp_limiter.AdaptiveLimiter bounding requests in flight (and per second),
+    # each retry attempt passes through it
+    #
+    # pool_size is the number of kept-alive connections, match it to the number of threads
+    # issuing requests; with a full pool further requests wait for a free connection rather
+    # than opening connections that are closed again after one request
+    # connect_timeout and read_timeout are in seconds
+    # retries, backoff and backoff_max configure sp_transport.RetryTransport, retries=0 disables it
+    # cache is an sp_cache.ResponseCache answering read-only lookups while fresh, writes
+    # invalidate the entries they affect
+    # tracer is an sp_trace.RequestTracer receiving a span for every request that reaches
+    # Orchestrator, cache hits are answered above it and not traced
+    def __init__(
+        self,
+        url,
+        user,
+        password,
+        transport=None,
+        pool_size=10,
+        connect_timeout=10,
+        read_timeout=120,
+        retries=3,
+        backoff=0.5,
+        backoff_max=30.0,
+        limiter=None,
+        cache=None,
+        tracer=None,
+    ):
+        OrchHelperBase.__init__(self, url, user, password)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.timeout = (connect_timeout, read_timeout)
+        if transport is None:
+            transport = SessionTransport(self.session)
+        if limiter is not None:
+            transport = LimitingTransport(transport, limiter)
+        if retries:
+            transport = RetryTransport(transport, retries, backoff, backoff_max)
+        if tracer is not None:
+            transport = TracingTransport(transport, tracer)
+        if cache is not None:
+            transport = CachingTransport(transport, cache)
+        self.transport = transport
         #requests.packages.urllib3.disable_warnings() #disable certificate warning messages 
 
 ########## login ##########
@@ -38,14 +137,10 @@ class OrchHelper:
             return False
         
         try:
-            response = self.post("/authentication/login",
-                                 {"user": self.user, "password": self.password, "loginType": self.supportedAuthModes.index(self.authMode)})
+            response = self.post("/authentication/login", self.login_body())
             if response.status_code == 200:
                 print ("{0}: Orchestrator login success".format(self.url))
-                # get and set X-XSRF-TOKEN
-                for cookie in response.cookies:
-                    if cookie.name == "orchCsrfToken":
-                        self.headers["X-XSRF-TOKEN"] = cookie.value
+                self.set_csrf_token((cookie.name, cookie.value) for cookie in response.cookies)
                 return True
             else:
                 print ("{0}: Orchestrator login failed: {1}".format(self.url, response.text))
@@ -64,13 +159,10 @@ class OrchHelper:
         # Returns True if login succeeds, False if exception raised or failure to login
         
         try:
-            response = self.post("/authentication/login", {"user": self.user, "password": self.password, "token": int(mfacode)})
+            response = self.post("/authentication/login", self.mfa_login_body(mfacode))
             if response.status_code == 200:
                 print ("{0}: Orchestrator MFA login success".format(self.url))
-                # get and set X-XSRF-TOKEN
-                for cookie in response.cookies:
-                    if cookie.name == "orchCsrfToken":
-                        self.headers["X-XSRF-TOKEN"] = cookie.value
+                self.set_csrf_token((cookie.name, cookie.value) for cookie in response.cookies)
                 return True
             else:
                 print ("{0}: Orchestrator MFA login failed: {1}".format(self.url, response.text))
@@ -83,7 +175,7 @@ class OrchHelper:
         # send request to Orchestrator to issue MFA token to user
         # returns True on success, False on failure or exception
         try:
-            response = self.post("/authentication/loginToken",{"user": self.user, "password": self.password, "TempCode": True})
+            response = self.post("/authentication/loginToken", self.send_mfa_body())
         except:
             print("Exception - unable to submit token request")
             return False
@@ -163,6 +255,11 @@ class OrchHelper:
             print("Failed to retrieve appliances from Orch at {0}".format(self.url))
             return False
 
+    def iter_all_appliances(self):
+        # Streaming variant of get_all_appliances, returns an iterator over the appliances parsed
+        # as the response arrives, or False on failure
+        return self.get_list("/appliance", "appliances")
+
     #def delete_appliance():
         # DELETE /appliance/{nePk}
         # Delete an appliance from network.
@@ -192,9 +289,18 @@ class OrchHelper:
         # GET /appliance/{nePk}
         # Get appliance information
 
-    #def get_all_discovered():
-        # GET /appliance/discovered
-        # Returns the all discovered appliances
+    def get_all_discovered_appliances(self):
+        # GET operation to retrive all discovered appliances awaiting approval
+        response = self.get("/appliance/discovered")
+        if response.status_code == 200:
+            return response
+        else:
+            print("Failed to retrieve discovered appliances from Orch at {0}".format(self.url))
+            return False
+
+    def iter_all_discovered_appliances(self):
+        # Streaming variant of get_all_discovered_appliances, iterator over the appliances or False
+        return self.get_list("/appliance/discovered", "discovered appliances")
 
     #def get_all_approved():
         # GET /appliance/approved
@@ -209,6 +315,10 @@ class OrchHelper:
             print("Failed to retrieve discovered denied appliances from Orch at {0}".format(self.url))
             return False
 
+    def iter_all_denied_appliances(self):
+        # Streaming variant of get_all_denied_appliances, iterator over the appliances or False
+        return self.get_list("/appliance/denied", "discovered denied appliances")
+
     #def add_and_approve_discovered_appliances():
         # POST /appliance/discovered/approve/{key}
         # Add and approve discovered appliances
@@ -392,16 +502,65 @@ class OrchHelper:
 ########## applianceWizard ##########
 ########## appliancePreconfig ##########
 
-    def get_all_preconfig(self):
+    def get_all_preconfig(self, filter="metadata"):
         # GET operation to retrieve list of preconfigs
         # JSON response is a list object
-        response = self.get("/gms/appliance/preconfiguration?filter=metadata")
+        # filter=None also returns the base64 encoded YAML of each preconfig in configData
+        url = "/gms/appliance/preconfiguration"
+        if filter is not None:
+            url = url + "?filter=" + filter
+        response = self.get(url)
         if response.status_code == 200:
             return response
         else:
             print("Failed to retrieve preconfig metadata from Orch at {0}".format(self.url))
             return False
 
+    def iter_all_preconfig(self, filter="metadata"):
+        # Streaming variant of get_all_preconfig, iterator over the preconfigs or False
+        # The preconfiguration API has no paging, the list is parsed incrementally instead
+        url = "/gms/appliance/preconfiguration"
+        if filter is not None:
+            url = url + "?filter=" + filter
+        return self.get_list(url, "preconfig metadata")
+
+    def get_preconfig(self, preconfigId):
+        # GET operation to retrieve a single preconfig, including its base64 encoded YAML in configData
+        response = self.get("/gms/appliance/preconfiguration/" + str(preconfigId))
+        if response.status_code == 200:
+            return response
+        else:
+            print("Failed to retrieve preconfig id:{0} from Orch at {1}".format(preconfigId,self.url))
+            return False
+
+    def validate_preconfig(self, hostname, serialNum, yamlPreconfig, autoApply, tag="", comment=""):
+        # POST operation to validate a preconfig without creating it
+        # Returns the response so callers can inspect status_code and any validation errors in the body
+        return self.post("/gms/appliance/preconfiguration/validate", self.preconfig_body(hostname, serialNum, yamlPreconfig, autoApply, tag, comment))
+
+    def create_preconfig(self, hostname, serialNum, yamlPreconfig, autoApply, tag="", comment=""):
+        # POST operation to create a new preconfig
+        # Returns the new preconfig's id, or True if Orchestrator's response does not hold one
+        response = self.post("/gms/appliance/preconfiguration", self.preconfig_body(hostname, serialNum, yamlPreconfig, autoApply, tag, comment))
+        if response.status_code == 200:
+            try:
+                preconfig_id = response.json().get("id")
+            except (ValueError, AttributeError):
+                preconfig_id = None
+            return preconfig_id if preconfig_id is not None else True
+        else:
+            print("Failed to create preconfig {0} from Orch at {1}".format(hostname,self.url))
+            return False
+
+    def modify_preconfig(self, preconfigId, hostname, serialNum, yamlPreconfig, autoApply, tag="", comment=""):
+        # POST operation to replace an existing preconfig by preconfig id number (preconfigId)
+        response = self.post("/gms/appliance/preconfiguration/" + str(preconfigId), self.preconfig_body(hostname, serialNum, yamlPreconfig, autoApply, tag, comment))
+        if response.status_code == 200:
+            return True
+        else:
+            print("Failed to modify preconfig id:{0} from Orch at {1}".format(preconfigId,self.url))
+            return False
+
     def delete_preconfig(self, preconfigId):
         # DELETE operation to delete specific preconfig by preconfig id number (preconfigId)
         response = self.delete("/gms/appliance/preconfiguration/" + preconfigId)
@@ -437,6 +596,17 @@ class OrchHelper:
 ########## session ##########
 ########## interfaceLabels ##########
 ########## overlays ##########
+
+    def get_all_overlays(self):
+        # GET operation to retrieve the configuration of all business intent overlays
+        # JSON response is a list object
+        response = self.get("/gms/overlays/config")
+        if response.status_code == 200:
+            return response
+        else:
+            print("Failed to retrieve overlays from Orch at {0}".format(self.url))
+            return False
+
 ########## portProfiles ##########
 ########## actionLog ##########
 ########## overlayAssociation ##########
@@ -507,21 +677,36 @@ class OrchHelper:
 ########## statsRetention ##########
 ########## apiKey ##########
 
+    def request(self, method, url, **kwargs):
+        # All REST calls go through the transport
+        return self.transport.request(method, self.api_url(url), verify=False, timeout=self.timeout, headers=self.headers, **kwargs)
+
     def post(self, url, data):
-        apiSrcStr = self.apiSrcId if ("?" not in url) else self.apiSrcId2
-        return self.session.post(self.url_prefix + url + apiSrcStr, json=data, verify=False, timeout=120, headers=self.headers)
+        return self.request("POST", url, json=data)
+
+    def empty_post(self, url):
+        # POST without a request body, used by the preconfig apply calls
+        return self.request("POST", url)
 
     def get(self, url):
-        apiSrcStr = self.apiSrcId if ("?" not in url) else self.apiSrcId2
-        return self.session.get(self.url_prefix + url + apiSrcStr, verify=False, timeout=120, headers=self.headers)
+        return self.request("GET", url)
+
+    def get_list(self, url, description):
+        # GET a JSON list without loading the whole response, see sp_jsonstream
+        # Returns an iterator over the list entries, or False on failure
+        response = self.request("GET", url, stream=True)
+        if response.status_code == 200:
+            return iter_response_list(response)
+        else:
+            response.close()
+            print("Failed to retrieve {0} from Orch at {1}".format(description, self.url))
+            return False
 
     def delete(self, url):
-        apiSrcStr = self.apiSrcId if ("?" not in url) else self.apiSrcId2
-        return self.session.delete(self.url_prefix + url + apiSrcStr, verify=False, timeout=120, headers=self.headers)
+        return self.request("DELETE", url)
 
     def put(self, url, data):
-        apiSrcStr = self.apiSrcId if ("?" not in url) else self.apiSrcId2
-        return self.session.put(self.url_prefix + url + apiSrcStr, json=data, verify=False, timeout=120, headers=self.headers)
+        return self.request("PUT", url, json=data)
 
 # sample test code - only applies if this module is run as main
 # this tests:
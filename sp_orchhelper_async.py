@@ -0,0 +1,381 @@
+#
+# sp_orchhelper_async.py - asyncio counterpart of sp_orchhelper.OrchHelper
+# Same method names and return values as OrchHelper, but every call is a coroutine so that
+# thousands of preconfig, approval and template group calls can be in flight on one event loop.
+# The streaming iter_all_* variants return an async iterator (use async for) or False.
+#
+# Your use of this Software is pursuant to the Silver Peak Disclaimer (see the README file for this repository)
+#
+
+import json
+
+import aiohttp
+
+from sp_jsonstream import CHUNK_SIZE, JSONArrayParser
+from sp_orchhelper import OrchHelperBase
+
+
+class AsyncResponse:
+    # Buffered response exposing the parts of requests.Response used by callers of OrchHelper
+    # (status_code, text, content, cookies, json()), so return values match the sync client
+    def __init__(self, status_code, content, cookies):
+        self.status_code = status_code
+        self.content = content
+        self.cookies = cookies
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def __len__(self):
+        # Allows len() on list responses as in the sync sample code
+        return len(self.json())
+
+
+async def iter_response_list(response, chunk_size=CHUNK_SIZE):
+    # Entries of a JSON list response parsed as it arrives, releasing the response when done
+    parser = JSONArrayParser()
+    try:
+        async for chunk in response.content.iter_chunked(chunk_size):
+            for entry in parser.feed(chunk):
+                yield entry
+        parser.close()
+    finally:
+        response.release()
+
+
+class AsyncOrchHelper(OrchHelperBase):
+    # limit caps concurrent connections to the Orchestrator across all in-flight calls
+    def __init__(self, url, user, password, limit=100):
+        OrchHelperBase.__init__(self, url, user, password)
+        self.limit = limit
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        # Session must be created from within the running event loop
+        # The default cookie jar drops cookies set by hosts addressed by IP, losing the login session
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit, ssl=False),
+                cookie_jar=aiohttp.CookieJar(unsafe=True),
+                timeout=aiohttp.ClientTimeout(total=120),
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+########## login ##########
+
+    async def login(self):
+        # basic login function without multi-factor authentication
+        # Returns True if login succeeds, False if exception raised or failure to login
+
+        if self.authMode not in self.supportedAuthModes:
+            print("{0}: authentication mode not supported".format(self.authMode))
+            return False
+
+        try:
+            response = await self.post("/authentication/login", self.login_body())
+            if response.status_code == 200:
+                print ("{0}: Orchestrator login success".format(self.url))
+                self.set_csrf_token((name, morsel.value) for name, morsel in response.cookies.items())
+                return True
+            else:
+                print ("{0}: Orchestrator login failed: {1}".format(self.url, response.text))
+                return False
+        except:
+            print("{0}: Exception - unable to connect to Orchestrator".format(self.url))
+            return False
+
+    async def mfa_login(self, mfacode):
+        # alternative login function for multi-factor authentication, see OrchHelper.mfa_login
+        try:
+            response = await self.post("/authentication/login", self.mfa_login_body(mfacode))
+            if response.status_code == 200:
+                print ("{0}: Orchestrator MFA login success".format(self.url))
+                self.set_csrf_token((name, morsel.value) for name, morsel in response.cookies.items())
+                return True
+            else:
+                print ("{0}: Orchestrator MFA login failed: {1}".format(self.url, response.text))
+                return False
+        except:
+            print("{0}: Exception - unable to connect to Orchestrator".format(self.url))
+            return False
+
+    async def send_mfa(self):
+        # send request to Orchestrator to issue MFA token to user
+        # returns True on success, False on failure or exception
+        try:
+            response = await self.post("/authentication/loginToken", self.send_mfa_body())
+        except:
+            print("Exception - unable to submit token request")
+            return False
+        return True if response.status_code in [200,204] else False
+
+    async def logout(self):
+        try:
+            response = await self.get("/authentication/logout")
+            if response.status_code == 200:
+                print ("{0}: Orchestrator logout success".format(self.url))
+            else:
+                print ("{0}: Orchestrator logout failed: {1}".format(self.url, response.text))
+        except:
+            print("{0}: Exception - unable to logout of Orchestrator".format(self.url))
+
+########## appliance ##########
+
+    async def get_all_appliances(self):
+        # GET operation to retrive all in-use appliances
+        # JSON response is a list object
+        response = await self.get("/appliance")
+        if response.status_code == 200:
+            return response
+        else:
+            print("Failed to retrieve appliances from Orch at {0}".format(self.url))
+            return False
+
+    async def iter_all_appliances(self):
+        # Streaming variant of get_all_appliances, async iterator over the appliances or False
+        return await self.get_list("/appliance", "appliances")
+
+    async def delete_appliance_for_rediscovery(self, nePk):
+        # DELETE operation to delete specific appliance for rediscovery
+        response = await self.delete("/appliance/deleteForDiscovery/" + nePk)
+        if response.status_code == 200:
+            return True
+        else:
+            print("Failed to delete appliance id:{0} from Orch at {1}".format(nePk,self.url))
+            return False
+
+    async def get_all_discovered_appliances(self):
+        # GET operation to retrive all discovered appliances awaiting approval
+        response = await self.get("/appliance/discovered")
+        if response.status_code == 200:
+            return response
+        else:
+            print("Failed to retrieve discovered appliances from Orch at {0}".format(self.url))
+            return False
+
+    async def iter_all_discovered_appliances(self):
+        # Streaming variant of get_all_discovered_appliances, async iterator over the appliances or False
+        return await self.get_list("/appliance/discovered", "discovered appliances")
+
+    async def get_all_denied_appliances(self):
+        # GET operation to retrive all discovered denied appliances
+        response = await self.get("/appliance/denied")
+        if response.status_code == 200:
+            return response
+        else:
+            print("Failed to retrieve discovered denied appliances from Orch at {0}".format(self.url))
+            return False
+
+    async def iter_all_denied_appliances(self):
+        # Streaming variant of get_all_denied_appliances, async iterator over the appliances or False
+        return await self.get_list("/appliance/denied", "discovered denied appliances")
+
+########## template ##########
+
+    async def get_all_template_groups(self):
+        # GET operation to retrieve all template groups
+        response = await self.get("/template/templateGroups")
+        if response.status_code == 200:
+            return response
+        else:
+            print("Failed to retrieve template groups from Orch at {0}".format(self.url))
+            return False
+
+    async def get_template_group(self, templateGroup):
+        # GET operation to retrieve template group contents
+        response = await self.get("/template/templateGroups/" + templateGroup)
+        if response.status_code == 200:
+            return response
+        else:
+            print("Failed to retrieve template group {0} from Orch at {1}".format(templateGroup, self.url))
+            return False
+
+    async def post_template_group(self, templateGroup, templateGroupBody):
+        # POST operation to update existing template group
+        response = await self.post("/template/templateGroups/" + templateGroup, templateGroupBody)
+        if response.status_code == 200:
+            return True
+        else:
+            print (response.status_code)
+            print("Failed to create or update template group {0} from Orch at {1}".format(templateGroup,self.url))
+            return False
+
+    async def select_templates_for_template_group(self, templateGroup, selectedTemplates):
+        # POST operation to select templates for existing template group
+        response = await self.post("/template/templateSelection/" + templateGroup, selectedTemplates)
+        if response.status_code == 200:
+            return True
+        else:
+            print("Failed to select templates {0} for template group {1} from Orch at {2}".format(selectedTemplates,templateGroup,self.url))
+            return False
+
+    async def create_template_group(self, templateGroupBody):
+        # POST operation to create new template group
+        response = await self.post("/template/templateCreate", templateGroupBody)
+        if response.status_code == 200:
+            return True
+        elif response.status_code == 204:
+            print("Created a !!EMPTY!! template group {0} with no selected templates from Orch at {1}".format(templateGroupBody['name'],self.url))
+            return True
+        else:
+            print (response.status_code)
+            print("Failed to create template group {0} from Orch at {1}".format(templateGroupBody['name'],self.url))
+            return False
+
+########## broadcastCli ##########
+
+    async def broadcast_cli(self, appliance_list, cli_commands):
+        # POST operation to send broadcast CLI commands to list of appliances
+        response = await self.post("/broadcastCli",{"neList": appliance_list, "cmdList": cli_commands})
+        if response.status_code == 200:
+            return True
+        else:
+            print("Failed to perform broadcast cli on the appliances {0} from Orch at {1}".format(appliance_list,self.url))
+            return False
+
+########## appliancePreconfig ##########
+
+    async def get_all_preconfig(self, filter="metadata"):
+        # GET operation to retrieve list of preconfigs
+        # JSON response is a list object
+        # filter=None also returns the base64 encoded YAML of each preconfig in configData
+        url = "/gms/appliance/preconfiguration"
+        if filter is not None:
+            url = url + "?filter=" + filter
+        response = await self.get(url)
+        if response.status_code == 200:
+            return response
+        else:
+            print("Failed to retrieve preconfig metadata from Orch at {0}".format(self.url))
+            return False
+
+    async def iter_all_preconfig(self, filter="metadata"):
+        # Streaming variant of get_all_preconfig, async iterator over the preconfigs or False
+        url = "/gms/appliance/preconfiguration"
+        if filter is not None:
+            url = url + "?filter=" + filter
+        return await self.get_list(url, "preconfig metadata")
+
+    async def get_preconfig(self, preconfigId):
+        # GET operation to retrieve a single preconfig, including its base64 encoded YAML in configData
+        response = await self.get("/gms/appliance/preconfiguration/" + str(preconfigId))
+        if response.status_code == 200:
+            return response
+        else:
+            print("Failed to retrieve preconfig id:{0} from Orch at {1}".format(preconfigId,self.url))
+            return False
+
+    async def validate_preconfig(self, hostname, serialNum, yamlPreconfig, autoApply, tag="", comment=""):
+        # POST operation to validate a preconfig without creating it
+        # Returns the response so callers can inspect status_code and any validation errors in the body
+        return await self.post("/gms/appliance/preconfiguration/validate", self.preconfig_body(hostname, serialNum, yamlPreconfig, autoApply, tag, comment))
+
+    async def create_preconfig(self, hostname, serialNum, yamlPreconfig, autoApply, tag="", comment=""):
+        # POST operation to create a new preconfig
+        # Returns the new preconfig's id, or True if Orchestrator's response does not hold one
+        response = await self.post("/gms/appliance/preconfiguration", self.preconfig_body(hostname, serialNum, yamlPreconfig, autoApply, tag, comment))
+        if response.status_code == 200:
+            try:
+                preconfig_id = response.json().get("id")
+            except (ValueError, AttributeError):
+                preconfig_id = None
+            return preconfig_id if preconfig_id is not None else True
+        else:
+            print("Failed to create preconfig {0} from Orch at {1}".format(hostname,self.url))
+            return False
+
+    async def modify_preconfig(self, preconfigId, hostname, serialNum, yamlPreconfig, autoApply, tag="", comment=""):
+        # POST operation to replace an existing preconfig by preconfig id number (preconfigId)
+        response = await self.post("/gms/appliance/preconfiguration/" + str(preconfigId), self.preconfig_body(hostname, serialNum, yamlPreconfig, autoApply, tag, comment))
+        if response.status_code == 200:
+            return True
+        else:
+            print("Failed to modify preconfig id:{0} from Orch at {1}".format(preconfigId,self.url))
+            return False
+
+    async def delete_preconfig(self, preconfigId):
+        # DELETE operation to delete specific preconfig by preconfig id number (preconfigId)
+        response = await self.delete("/gms/appliance/preconfiguration/" + preconfigId)
+        if response.status_code == 200:
+            return True
+        else:
+            print("Failed to delete preconfig id:{0} from Orch at {1}".format(preconfigId,self.url))
+            return False
+
+    async def approve_and_apply_preconfig(self, preconfigId, discovered_id):
+        # POST operation to approve a discovered appliance and apply specific preconfig (preconfigId)
+        response = await self.empty_post("/gms/appliance/preconfiguration/{0}/apply/discovered/{1}".format(preconfigId,discovered_id))
+        if response.status_code == 200:
+            return True
+        else:
+            print("Failed to approve appliance (discovery id:{0}) and apply preconfiguration (preconfigId:{1}) discovered denied appliances from Orch at {2}".format(discovered_id,preconfigId,self.url))
+            return False
+
+    async def apply_preconfig_to_existing(self, preconfigId, nePk):
+        # POST operation to apply preconfig to an existing managed appliance
+        response = await self.empty_post("/gms/appliance/preconfiguration/{0}/apply/{1}".format(preconfigId,nePk))
+        if response.status_code == 200:
+            return True
+        else:
+            print("Failed to apply preconfig (id: {0}) to appliance (nePk:{1}) from Orch at {2}".format(preconfigId,nePk,self.url))
+            return False
+
+########## overlays ##########
+
+    async def get_all_overlays(self):
+        # GET operation to retrieve the configuration of all business intent overlays
+        response = await self.get("/gms/overlays/config")
+        if response.status_code == 200:
+            return response
+        else:
+            print("Failed to retrieve overlays from Orch at {0}".format(self.url))
+            return False
+
+    async def request(self, method, url, **kwargs):
+        session = await self.open()
+        async with session.request(method, self.api_url(url), headers=self.headers, **kwargs) as response:
+            content = await response.read()
+            return AsyncResponse(response.status, content, response.cookies)
+
+    async def post(self, url, data):
+        return await self.request("POST", url, json=data)
+
+    async def empty_post(self, url):
+        return await self.request("POST", url)
+
+    async def get(self, url):
+        return await self.request("GET", url)
+
+    async def get_list(self, url, description):
+        # GET a JSON list without buffering the whole response, see sp_jsonstream
+        # Returns an async iterator over the list entries, or False on failure
+        session = await self.open()
+        response = await session.request("GET", self.api_url(url), headers=self.headers)
+        if response.status == 200:
+            return iter_response_list(response)
+        else:
+            response.release()
+            print("Failed to retrieve {0} from Orch at {1}".format(description, self.url))
+            return False
+
+    async def delete(self, url):
+        return await self.request("DELETE", url)
+
+    async def put(self, url, data):
+        return await self.request("PUT", url, json=data)
@@ -0,0 +1,212 @@
+#
+# sp_trace.py - request tracing for sp_orchhelper.OrchHelper
+#
+# TracingTransport wraps an sp_transport transport and hands a span for every REST call to a
+# RequestTracer: endpoint template, method, status, bytes sent/received, duration and retries.
+# The tracer keeps a latency histogram per endpoint, logs requests slower than a threshold and
+# writes the spans as a Chrome trace (chrome://tracing, Perfetto) or OpenTelemetry JSON file.
+# OrchHelper places it beneath its response cache, so only requests reaching Orchestrator are
+# traced and cache hits do not show up as near-zero latencies.
+#
+
+# Standard library imports
+import json
+import os
+import threading
+import time
+import uuid
+
+# Local application imports
+from preconfig_metrics import PhaseHistogram
+from sp_transport import request_path
+
+REST_PREFIX = "/gms/rest"
+
+# Path segments whose following segment is a name rather than part of the endpoint
+NAME_PARENTS = ("templateGroups", "templateSelection", "deleteForDiscovery", "discovered")
+
+TRACE_FORMATS = ("chrome", "otel")
+
+
+def endpoint_template(url):
+    # /gms/rest/gms/appliance/preconfiguration/12/apply/discovered/3.NE -> /gms/appliance/preconfiguration/{id}/apply/discovered/{id}
+    path = request_path(url).split("?", 1)[0]
+    if path.startswith(REST_PREFIX):
+        path = path[len(REST_PREFIX):]
+    segments = path.split("/")
+    for index in range(1, len(segments)):
+        if any(character.isdigit() for character in segments[index]) or segments[index - 1] in NAME_PARENTS:
+            segments[index] = "{id}"
+    return "/".join(segments)
+
+
+def response_bytes(response, streamed):
+    # Body size, taken from Content-Length for streamed responses so tracing does not read them
+    if response is None:
+        return 0
+    if streamed:
+        return int(response.headers.get("Content-Length") or 0)
+    return len(response.content)
+
+
+def request_bytes(response):
+    # Size of the prepared request body when the response carries its request
+    body = getattr(getattr(response, "request", None), "body", None)
+    return len(body) if body else 0
+
+
+class RequestTracer:
+    # slow_threshold in seconds, requests taking longer are logged to slow_log (a file name) or
+    # printed when slow_log is None
+    # max_spans bounds the spans kept for the trace file, histograms always cover every request
+
+    def __init__(self, slow_threshold=None, slow_log=None, max_spans=1000000):
+        self.slow_threshold = slow_threshold
+        self.slow_log = slow_log
+        self.max_spans = max_spans
+        self.lock = threading.Lock()
+        self.spans = []
+        self.dropped_spans = 0
+        self.histograms = {}
+        self.trace_id = uuid.uuid4().hex
+
+    def record(self, span):
+        endpoint = "{0} {1}".format(span["method"], span["endpoint"])
+        with self.lock:
+            histogram = self.histograms.get(endpoint)
+            if histogram is None:
+                histogram = self.histograms[endpoint] = PhaseHistogram()
+            histogram.observe(span["duration"])
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped_spans = self.dropped_spans + 1
+
+        if self.slow_threshold is not None and span["duration"] >= self.slow_threshold:
+            line = "Slow request: {0} {1} {2:.3f}s status {3} retries {4}".format(
+                span["method"], span["path"], span["duration"], span["status"], span["retries"]
+            )
+            if self.slow_log:
+                with self.lock:
+                    with open(self.slow_log, "a") as slow_file:
+                        slow_file.write("{0} {1}\n".format(time.strftime("%Y-%m-%dT%H:%M:%S"), line))
+            else:
+                print(line)
+
+    def summary(self):
+        # Endpoint ("METHOD template") -> latency summary, slowest total first
+        with self.lock:
+            summaries = [(endpoint, histogram.summary()) for endpoint, histogram in self.histograms.items()]
+        return dict(sorted(summaries, key=lambda item: -item[1]["total_seconds"]))
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        with self.lock:
+            spans = list(self.spans)
+        events = []
+        for span in spans:
+            events.append(
+                {
+                    "name": "{0} {1}".format(span["method"], span["endpoint"]),
+                    "cat": "orchestrator",
+                    "ph": "X",
+                    "ts": int(span["start"] * 1000000),
+                    "dur": int(span["duration"] * 1000000),
+                    "pid": pid,
+                    "tid": span["thread"],
+                    "args": dict(
+                        (key, span[key]) for key in ("path", "status", "bytes_out", "bytes_in", "retries", "error")
+                    ),
+                }
+            )
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"endpoints": self.summary(), "dropped_spans": self.dropped_spans},
+        }
+
+    def otel_trace(self):
+        with self.lock:
+            spans = list(self.spans)
+        otel_spans = []
+        for span in spans:
+            attributes = [
+                ("http.request.method", {"stringValue": span["method"]}),
+                ("url.path", {"stringValue": span["path"]}),
+                ("http.route", {"stringValue": span["endpoint"]}),
+                ("http.request.body.size", {"intValue": str(span["bytes_out"])}),
+                ("http.response.body.size", {"intValue": str(span["bytes_in"])}),
+                ("http.request.resend_count", {"intValue": str(span["retries"])}),
+            ]
+            if span["status"] is not None:
+                attributes.append(("http.response.status_code", {"intValue": str(span["status"])}))
+            if span["error"]:
+                attributes.append(("error.type", {"stringValue": span["error"]}))
+            failed = span["error"] or (span["status"] or 0) >= 500
+            otel_spans.append(
+                {
+                    "traceId": self.trace_id,
+                    "spanId": uuid.uuid4().hex[:16],
+                    "name": "{0} {1}".format(span["method"], span["endpoint"]),
+                    # SPAN_KIND_CLIENT
+                    "kind": 3,
+                    "startTimeUnixNano": str(int(span["start"] * 1000000000)),
+                    "endTimeUnixNano": str(int((span["start"] + span["duration"]) * 1000000000)),
+                    "attributes": [{"key": key, "value": value} for key, value in attributes],
+                    # STATUS_CODE_ERROR / STATUS_CODE_UNSET
+                    "status": {"code": 2 if failed else 0},
+                }
+            )
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [{"key": "service.name", "value": {"stringValue": "silverpeak-preconfig"}}]
+                    },
+                    "scopeSpans": [{"scope": {"name": "sp_trace"}, "spans": otel_spans}],
+                }
+            ]
+        }
+
+    def write(self, filename, format="chrome"):
+        trace = self.chrome_trace() if format == "chrome" else self.otel_trace()
+        with open(filename, "w") as trace_file:
+            json.dump(trace, trace_file)
+
+
+class TracingTransport:
+    def __init__(self, transport, tracer):
+        self.transport = transport
+        self.tracer = tracer
+
+    def request(self, method, url, **kwargs):
+        start = time.time()
+        started = time.perf_counter()
+        response = None
+        error = ""
+        try:
+            response = self.transport.request(method, url, **kwargs)
+            return response
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.tracer.record(
+                {
+                    "method": method,
+                    "path": request_path(url),
+                    "endpoint": endpoint_template(url),
+                    "start": start,
+                    "duration": time.perf_counter() - started,
+                    "status": response.status_code if response is not None else None,
+                    "bytes_out": request_bytes(response),
+                    "bytes_in": response_bytes(response, kwargs.get("stream", False)),
+                    # Set on the response by retrying transports
+                    "retries": getattr(response, "retries", 0),
+                    "error": error,
+                    "thread": threading.get_ident(),
+                }
+            )
+
+    def close(self):
+        self.transport.close()
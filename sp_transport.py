@@ -0,0 +1,219 @@
+#
+# sp_transport.py - pluggable HTTP transports for sp_orchhelper.OrchHelper
+#
+# SessionTransport sends requests over a requests.Session (the default).
+# RecordingTransport wraps another transport and writes every request/response pair and its
+# timing to a JSON lines file.
+# ReplayTransport serves a recording back without any network access, optionally sleeping for
+# the recorded response times (speed=1.0) or a fraction of them (speed=10.0 is ten times faster).
+#
+# RetryTransport retries idempotent requests on connection errors and transient statuses with
+# exponential backoff and full jitter; non-idempotent POSTs are only retried when the connection
+# could not be established, so a preconfig is never created twice.
+#
+# Request bodies and headers are not recorded and response cookie values are redacted, so
+# credentials sent at login and the session and CSRF cookies never reach the recording file.
+#
+
+# Standard library imports
+import base64
+import json
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+# Third party imports
+import requests
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+# Recorded in place of cookie values, replayed logins send it as their CSRF token
+REDACTED = "REDACTED"
+
+# POST endpoints that do not change Orchestrator state
+IDEMPOTENT_POST_SUFFIXES = ("/preconfiguration/validate",)
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+def request_path(url):
+    # Host independent key for a request URL so recordings replay against any Orchestrator
+    parsed = urlparse(url)
+    return parsed.path + ("?" + parsed.query if parsed.query else "")
+
+
+class SessionTransport:
+    def __init__(self, session):
+        self.session = session
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def is_idempotent(method, url):
+    return method in IDEMPOTENT_METHODS or (
+        method == "POST" and urlparse(url).path.endswith(IDEMPOTENT_POST_SUFFIXES)
+    )
+
+
+def connection_not_established(error):
+    # True if the request can not have reached Orchestrator
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return "NewConnectionError" in type(getattr(reason, "reason", reason)).__name__
+
+
+class RetryTransport:
+    # retries is the number of retries after the first attempt
+    # Backoff before retry n is uniform between 0 and min(backoff_max, backoff * 2 ** n) seconds,
+    # or the Retry-After the Orchestrator asked for if that is longer
+    # The number of retries taken is set on the response as response.retries
+    def __init__(self, transport, retries=3, backoff=0.5, backoff_max=30.0, retry_statuses=RETRY_STATUSES):
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.retry_statuses = retry_statuses
+
+    def delay(self, attempt, response=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+        if retry_after.isdigit():
+            delay = max(delay, min(self.backoff_max, int(retry_after)))
+        return delay
+
+    def request(self, method, url, **kwargs):
+        idempotent = is_idempotent(method, url)
+        attempt = 0
+        while True:
+            try:
+                response = self.transport.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                retryable = isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)) and (
+                    idempotent or connection_not_established(e)
+                )
+                if not retryable or attempt >= self.retries:
+                    raise
+                time.sleep(self.delay(attempt))
+            else:
+                if not idempotent or response.status_code not in self.retry_statuses or attempt >= self.retries:
+                    response.retries = attempt
+                    return response
+                # Return the connection of a streamed response to the pool before retrying
+                response.close()
+                time.sleep(self.delay(attempt, response))
+            attempt = attempt + 1
+
+    def close(self):
+        self.transport.close()
+
+
+class RecordingTransport:
+    # Records everything passing through transport to filename, replacing its content unless
+    # append is set
+    # Streamed responses are read in full to record them
+    def __init__(self, transport, filename, append=False):
+        self.transport = transport
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.file = open(filename, "a" if append else "w")
+
+    def request(self, method, url, **kwargs):
+        started = time.perf_counter()
+        response = self.transport.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - started
+        record = {
+            "method": method,
+            "path": request_path(url),
+            "started": round(started - self.start, 6),
+            "elapsed": round(elapsed, 6),
+            "status": response.status_code,
+            "content_type": response.headers.get("Content-Type", ""),
+            "cookies": [[cookie.name, REDACTED] for cookie in response.cookies],
+            "body": base64.b64encode(response.content).decode("ascii"),
+        }
+        with self.lock:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+        return response
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class ReplayCookie:
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+class ReplayResponse:
+    # Recorded response exposing the parts of requests.Response used by OrchHelper callers
+    def __init__(self, record):
+        self.status_code = record["status"]
+        self.content = base64.b64decode(record["body"])
+        self.headers = {"Content-Type": record.get("content_type", "")}
+        self.cookies = [ReplayCookie(name, value) for name, value in record.get("cookies", [])]
+        self.elapsed = record.get("elapsed", 0.0)
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start : start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class ReplayMissError(Exception):
+    # Raised when a request has no (remaining) recorded response
+    pass
+
+
+class ReplayTransport:
+    # speed None replays as fast as possible, otherwise recorded response times are divided by speed
+    # Recorded responses for the same method and path are served in recorded order; once exhausted
+    # the last one is repeated so loops polling an endpoint keep working
+    def __init__(self, filename, speed=None):
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.records = {}
+        with open(filename) as recording:
+            for line in recording:
+                if line.strip():
+                    record = json.loads(line)
+                    self.records.setdefault((record["method"], record["path"]), []).append(record)
+        self.positions = dict((key, 0) for key in self.records)
+
+    def request(self, method, url, **kwargs):
+        key = (method, request_path(url))
+        with self.lock:
+            records = self.records.get(key)
+            if not records:
+                raise ReplayMissError("no recorded response for {0} {1}".format(*key))
+            position = self.positions[key]
+            record = records[min(position, len(records) - 1)]
+            self.positions[key] = position + 1
+        if self.speed:
+            time.sleep(record.get("elapsed", 0.0) / self.speed)
+        return ReplayResponse(record)
+
+    def close(self):
+        pass
@@ -0,0 +1,8 @@
+# The modules under test sit at the top of the repository, next to the main script, and the
+# mock Orchestrator under benchmarks/
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
@@ -0,0 +1,139 @@
+# Standard library imports
+import time
+
+# Local application imports
+from sp_cache import CachingTransport, ResponseCache, invalidated_by
+from sp_transport import ReplayResponse
+
+BASE = "https://orch.example.com/gms/rest"
+HOST = "orch.example.com"
+GROUPS = "/gms/rest/template/templateGroups"
+APPLIANCES = "/gms/rest/appliance"
+
+
+def record(body):
+    return {"status": 200, "content_type": "application/json", "body": body}
+
+
+class FakeResponse:
+    def __init__(self, content, status_code=200):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {"Content-Type": "application/json"}
+
+
+class FakeTransport:
+    # Answers every request with a new body and records the requests made
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url))
+        return FakeResponse('{{"n": {0}}}'.format(len(self.requests)).encode(), self.status_code)
+
+    def close(self):
+        pass
+
+
+def test_get_after_put_is_a_hit():
+    cache = ResponseCache()
+    assert cache.get(HOST, GROUPS) is None
+    cache.put(HOST, GROUPS, record("e30="), cache.generation)
+    assert cache.get(HOST, GROUPS) == record("e30=")
+    assert cache.get("other.example.com", GROUPS) is None
+    summary = cache.summary()
+    assert (summary["hits"], summary["misses"], summary["stores"]) == (1, 2, 1)
+
+
+def test_expired_entries_are_dropped():
+    cache = ResponseCache(ttls={"/template/templateGroups": 0.05})
+    cache.put(HOST, GROUPS, record("e30="), cache.generation)
+    time.sleep(0.1)
+    assert cache.get(HOST, GROUPS) is None
+    assert cache.summary()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    for path in (GROUPS, APPLIANCES):
+        cache.put(HOST, path, record("e30="), cache.generation)
+    cache.get(HOST, GROUPS)
+    cache.put(HOST, GROUPS + "/Branch", record("e30="), cache.generation)
+    assert cache.get(HOST, APPLIANCES) is None
+    assert cache.get(HOST, GROUPS) is not None
+    assert cache.summary()["evictions"] == 1
+
+
+def test_invalidate_drops_related_entries_only():
+    cache = ResponseCache()
+    for path in (GROUPS, GROUPS + "/Branch", APPLIANCES):
+        cache.put(HOST, path, record("e30="), cache.generation)
+    cache.invalidate(HOST, GROUPS + "/Branch")
+    assert cache.get(HOST, GROUPS) is None
+    assert cache.get(HOST, GROUPS + "/Branch") is None
+    assert cache.get(HOST, APPLIANCES) is not None
+
+
+def test_response_fetched_across_an_invalidation_is_not_stored():
+    cache = ResponseCache()
+    generation = cache.generation
+    cache.invalidate(HOST, GROUPS)
+    cache.put(HOST, GROUPS, record("e30="), generation)
+    assert cache.get(HOST, GROUPS) is None
+
+
+def test_invalidated_by():
+    assert invalidated_by("/template/templateGroups/Branch", "/template/templateGroups")
+    assert invalidated_by("/template/templateCreate/Branch", "/template/templateGroups/Other")
+    assert invalidated_by("/gms/appliance/preconfiguration/12/apply/discovered/3.NE", "/appliance")
+    assert not invalidated_by("/gms/overlays/config", "/appliance")
+
+
+def test_directory_store_is_shared_between_caches(tmp_path):
+    first = ResponseCache(directory=str(tmp_path))
+    first.put(HOST, GROUPS, record("e30="), first.generation)
+    second = ResponseCache(directory=str(tmp_path))
+    assert second.get(HOST, GROUPS) == record("e30=")
+    assert second.summary()["disk_hits"] == 1
+    second.invalidate(HOST, GROUPS)
+    assert ResponseCache(directory=str(tmp_path)).get(HOST, GROUPS) is None
+
+
+def test_transport_answers_repeated_gets_from_the_cache():
+    transport = FakeTransport()
+    caching = CachingTransport(transport, ResponseCache())
+    first = caching.request("GET", BASE + "/template/templateGroups")
+    second = caching.request("GET", BASE + "/template/templateGroups")
+    assert isinstance(second, ReplayResponse)
+    assert second.content == first.content
+    assert len(transport.requests) == 1
+
+
+def test_transport_does_not_cache_uncached_endpoints_or_errors():
+    transport = FakeTransport()
+    caching = CachingTransport(transport, ResponseCache())
+    for _ in range(2):
+        caching.request("GET", BASE + "/gms/appliance/discovered")
+    assert len(transport.requests) == 2
+
+    transport = FakeTransport(status_code=500)
+    caching = CachingTransport(transport, ResponseCache())
+    for _ in range(2):
+        caching.request("GET", BASE + "/template/templateGroups")
+    assert len(transport.requests) == 2
+
+
+def test_writes_invalidate_but_validation_does_not():
+    transport = FakeTransport()
+    cache = ResponseCache()
+    caching = CachingTransport(transport, cache)
+    caching.request("GET", BASE + "/gms/appliance/preconfiguration")
+    caching.request("POST", BASE + "/gms/appliance/preconfiguration/validate")
+    caching.request("GET", BASE + "/gms/appliance/preconfiguration")
+    assert len(transport.requests) == 2
+
+    caching.request("POST", BASE + "/gms/appliance/preconfiguration")
+    caching.request("GET", BASE + "/gms/appliance/preconfiguration")
+    assert len(transport.requests) == 4
+    assert cache.summary()["invalidations"] == 1
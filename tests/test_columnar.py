@@ -0,0 +1,55 @@
+# Standard library imports
+import copy
+import csv
+
+# Third party imports
+import pytest
+
+# Local application imports
+from preconfig_inputs import open_input_rows, split_list_columns
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+# Values with surrounding whitespace, as hand-edited spreadsheets carry them
+ROWS = [
+    {"hostname": "site-1", "site": " Lab 1 ", "templateGroups": "Default , Branch", "businessIntentOverlays": ""},
+    {"hostname": " site-2", "site": "\tLab 2", "templateGroups": " Hub", "businessIntentOverlays": "RealTime,  Bulk "},
+    {"hostname": "site-3", "site": "", "templateGroups": "", "businessIntentOverlays": " "},
+    {"hostname": "  ", "site": "Lab 4", "templateGroups": "Default", "businessIntentOverlays": "RealTime"},
+]
+
+
+def write_csv(path):
+    with open(path, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(ROWS[0]))
+        writer.writeheader()
+        writer.writerows(ROWS)
+
+
+def write_parquet(path):
+    pq.write_table(pa.Table.from_pylist(ROWS), path)
+
+
+def read(filename, input_format):
+    rows = open_input_rows(filename, input_format)
+    return [(row_number, row) for row_number, row in rows]
+
+
+@pytest.mark.parametrize("input_format, write", [("columnar-csv", write_csv), ("parquet", write_parquet)])
+def test_columnar_rows_match_csv_rows(tmp_path, input_format, write):
+    csv_filename = str(tmp_path / "inventory.csv")
+    write_csv(csv_filename)
+    filename = str(tmp_path / ("inventory." + input_format))
+    write(filename)
+
+    expected = [(row_number, split_list_columns(copy.deepcopy(row))) for row_number, row in read(csv_filename, "csv")]
+    assert read(filename, input_format) == expected
+    # Values are untrimmed, only list items are stripped
+    assert expected[0][1]["site"] == " Lab 1 "
+    assert expected[1][1]["hostname"] == " site-2"
+    assert expected[1][1]["businessIntentOverlays"] == ["RealTime", "Bulk"]
+    # A whitespace-only hostname is kept for the row to be reported, not dropped as blank
+    assert expected[3][1] == {
+        "hostname": "  ", "site": "Lab 4", "templateGroups": ["Default"], "businessIntentOverlays": ["RealTime"]
+    }
@@ -0,0 +1,65 @@
+# Third party imports
+from jinja2 import DictLoader, Environment
+
+# Local application imports
+from preconfig_columns import REQUIRED_ALWAYS, REQUIRED_CONDITIONAL, ColumnSchema, compile_column_schema
+
+TEMPLATE = """hostname: {{ data['hostname'] }}
+site: {{ data['site'] | default("lab") }}
+{% if data['configure_dhcp'] == "TRUE" %}
+dhcpStart: {{ data['dhcp_start'] }}
+{% endif %}
+{% if data['ntp'] is defined %}ntp: {{ data['ntp'] }}{% endif %}
+groups:
+{% for group in data['templateGroups'] %}  - {{ group }}
+{% endfor %}
+"""
+
+
+def schema():
+    environment = Environment(loader=DictLoader({"site.jinja2": TEMPLATE}))
+    return compile_column_schema(environment, "site.jinja2")
+
+
+def test_complete_row_passes():
+    row = {"hostname": "site-1", "configure_dhcp": "TRUE", "dhcp_start": "10.0.0.10", "templateGroups": "Default"}
+    assert schema().check(row) == []
+
+
+def test_required_columns():
+    column_schema = schema()
+    assert column_schema.required("hostname") == REQUIRED_ALWAYS
+    assert column_schema.required("templateGroups") == REQUIRED_ALWAYS
+    assert column_schema.required("dhcp_start") == REQUIRED_CONDITIONAL
+    assert column_schema.list_columns == ("templateGroups",)
+
+
+def test_empty_and_missing_values_are_reported():
+    errors = schema().check({"hostname": " ", "configure_dhcp": "FALSE"})
+    assert errors == ["hostname is empty", "templateGroups is missing"]
+
+
+def test_conditional_column_only_required_when_condition_holds():
+    column_schema = schema()
+    row = {"hostname": "site-1", "templateGroups": "Default", "configure_dhcp": "TRUE", "dhcp_start": ""}
+    assert column_schema.check(row) == ["dhcp_start is empty, required when configure_dhcp is 'TRUE'"]
+    row["configure_dhcp"] = "FALSE"
+    assert column_schema.check(row) == []
+
+
+def test_optional_columns_may_be_left_out():
+    row = {"hostname": "site-1", "templateGroups": "Default"}
+    assert schema().check(row) == []
+
+
+def test_header_checks():
+    column_schema = schema()
+    assert column_schema.missing_columns(["hostname", "site"]) == ["templateGroups"]
+    assert column_schema.unused_columns(["hostname", "warehouse_id"]) == ["warehouse_id"]
+
+
+def test_round_trip_through_dict():
+    column_schema = schema()
+    restored = ColumnSchema.from_dict(column_schema.to_dict())
+    row = {"hostname": "site-1", "templateGroups": "Default", "configure_dhcp": "TRUE"}
+    assert restored.check(row) == column_schema.check(row)
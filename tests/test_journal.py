@@ -0,0 +1,114 @@
+# Standard library imports
+import json
+
+# Local application imports
+from preconfig_journal import (
+    APPROVAL_APPROVED,
+    APPROVAL_FAILED,
+    RECORD_APPROVAL,
+    RECORD_ROW,
+    RECORD_RUN,
+    RECORD_SUMMARY,
+    RunJournal,
+    is_unfinished,
+)
+
+ORCH = "https://orch.example.com"
+
+
+def interrupted_run(filename):
+    journal = RunJournal(filename)
+    journal.write(RECORD_RUN, csv="hosts.csv")
+    journal.write(RECORD_ROW, orchestrator=ORCH, hostname="site-1", status="uploaded", preconfig_hash="a")
+    journal.write(RECORD_ROW, orchestrator=ORCH, hostname="site-2", status="failed", preconfig_hash="b")
+    journal.write(
+        RECORD_APPROVAL, orchestrator=ORCH, hostname="site-1", outcome=APPROVAL_APPROVED
+    )
+    journal.write(RECORD_APPROVAL, orchestrator=ORCH, hostname="site-2", outcome=APPROVAL_FAILED)
+    journal.close()
+
+
+def records(filename):
+    with open(filename) as journal_file:
+        return [json.loads(line) for line in journal_file if line.strip()]
+
+
+def test_resume_loads_rows_and_approvals(tmp_path):
+    filename = str(tmp_path / "journal.jsonl")
+    interrupted_run(filename)
+    journal = RunJournal(filename, resume=True)
+    assert journal.completed(ORCH, "site-1", "a", ("uploaded",))["hostname"] == "site-1"
+    # Changed preconfig, other status, other Orchestrator
+    assert journal.completed(ORCH, "site-1", "changed", ("uploaded",)) is None
+    assert journal.completed(ORCH, "site-2", "b", ("uploaded",)) is None
+    assert journal.completed("https://other.example.com", "site-1", "a", ("uploaded",)) is None
+    assert journal.is_approved(ORCH, "site-1")
+    assert not journal.is_approved(ORCH, "site-2")
+    journal.write(RECORD_SUMMARY, rows=2)
+    journal.close()
+    assert [record["type"] for record in records(filename)][-2:] == [RECORD_APPROVAL, RECORD_SUMMARY]
+
+
+def test_resume_past_a_line_cut_off_mid_write(tmp_path):
+    filename = str(tmp_path / "journal.jsonl")
+    interrupted_run(filename)
+    with open(filename, "a") as journal_file:
+        journal_file.write('{"type": "row", "hostname": "site-3", "sta')
+    journal = RunJournal(filename, resume=True)
+    assert journal.completed(ORCH, "site-1", "a", ("uploaded",)) is not None
+    journal.write(RECORD_ROW, orchestrator=ORCH, hostname="site-3", status="uploaded", preconfig_hash="c")
+    journal.close()
+
+    resumed = RunJournal(filename, resume=True)
+    assert resumed.completed(ORCH, "site-3", "c", ("uploaded",)) is not None
+    resumed.close()
+
+
+def test_resumed_rows_keep_their_outcome(tmp_path):
+    filename = str(tmp_path / "journal.jsonl")
+    journal = RunJournal(filename)
+    journal.write(
+        RECORD_ROW, orchestrator=ORCH, hostname="site-1", status="skipped", outcome="uploaded", preconfig_hash="a"
+    )
+    journal.close()
+    assert RunJournal(filename, resume=True).completed(ORCH, "site-1", "a", ("uploaded",)) is not None
+
+
+def test_new_run_moves_an_unfinished_journal_aside(tmp_path):
+    filename = str(tmp_path / "journal.jsonl")
+    interrupted_run(filename)
+    assert is_unfinished(filename)
+    journal = RunJournal(filename)
+    journal.close()
+    assert journal.rotated is not None
+    assert len(records(journal.rotated)) == 5
+    assert records(filename) == []
+
+    # The moved journal can still be resumed
+    resumed = RunJournal(journal.rotated, resume=True)
+    assert resumed.is_approved(ORCH, "site-1")
+    resumed.close()
+
+
+def test_new_run_overwrites_a_finished_journal(tmp_path):
+    filename = str(tmp_path / "journal.jsonl")
+    journal = RunJournal(filename)
+    journal.write(RECORD_RUN, csv="hosts.csv")
+    journal.write(RECORD_SUMMARY, rows=0)
+    journal.close()
+    assert not is_unfinished(filename)
+    journal = RunJournal(filename)
+    journal.close()
+    assert journal.rotated is None
+    assert list(tmp_path.iterdir()) == [tmp_path / "journal.jsonl"]
+
+
+def test_records_are_written_in_batches(tmp_path):
+    filename = str(tmp_path / "journal.jsonl")
+    journal = RunJournal(filename, batch_size=3, flush_interval=3600)
+    for i in range(2):
+        journal.write(RECORD_ROW, orchestrator=ORCH, hostname="site-{0}".format(i), status="uploaded")
+    assert records(filename) == []
+    journal.write(RECORD_ROW, orchestrator=ORCH, hostname="site-2", status="uploaded")
+    assert len(records(filename)) == 3
+    journal.close()
@@ -0,0 +1,62 @@
+# Third party imports
+import pytest
+
+# Local application imports
+from sp_jsonstream import iter_json_array, iter_response_list
+
+
+def chunked(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def test_entries_split_across_chunks():
+    body = '[{"id": "1", "name": "café"}, 12345, [1, 2], "x", true, null]'.encode("utf-8")
+    expected = [{"id": "1", "name": "café"}, 12345, [1, 2], "x", True, None]
+    for size in (1, 2, 3, 7, len(body)):
+        assert list(iter_json_array(chunked(body, size))) == expected
+
+
+def test_number_at_chunk_boundary_is_not_cut_short():
+    assert list(iter_json_array([b"[12", b"34, 5", b"6]"])) == [1234, 56]
+
+
+def test_empty_list_and_whitespace():
+    assert list(iter_json_array([b"  [ ", b" ]  "])) == []
+
+
+def test_not_a_list():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"id": 1}']))
+
+
+def test_body_ending_early():
+    entries = iter_json_array([b'[{"id": 1}, {"id": 2}, {"id"'])
+    assert next(entries) == {"id": 1}
+    assert next(entries) == {"id": 2}
+    with pytest.raises(ValueError):
+        next(entries)
+
+
+def test_missing_separator():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b"[1 2]"]))
+
+
+class Response:
+    def __init__(self, body):
+        self.body = body
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return iter(chunked(self.body, chunk_size))
+
+    def close(self):
+        self.closed = True
+
+
+def test_response_closed_when_listing_stops_early():
+    response = Response(b'[{"id": 1}, {"id": 2}]')
+    entries = iter_response_list(response, chunk_size=4)
+    assert next(entries) == {"id": 1}
+    entries.close()
+    assert response.closed
@@ -0,0 +1,115 @@
+# Standard library imports
+import threading
+
+# Third party imports
+import pytest
+import requests
+
+# Local application imports
+from sp_limiter import AdaptiveLimiter, LimitingTransport
+
+ENDPOINT = "GET /appliance"
+# Well above any response time in these tests, so only statuses change the limit
+LATENCY_TARGET = 10.0
+
+
+def finish(limiter, status=200, failed=False):
+    limiter.release(limiter.acquire(), ENDPOINT, status, failed)
+
+
+def test_slow_start_grows_by_one_per_response():
+    limiter = AdaptiveLimiter(min_limit=1, max_limit=4, latency_target=LATENCY_TARGET)
+    for expected in (2, 3, 4, 4):
+        finish(limiter)
+        assert limiter.limit == expected
+
+
+def test_overload_halves_the_limit_and_ends_slow_start():
+    limiter = AdaptiveLimiter(min_limit=1, max_limit=8, latency_target=LATENCY_TARGET)
+    for i in range(7):
+        finish(limiter)
+    assert limiter.limit == 8
+    finish(limiter, status=503)
+    assert limiter.limit == 4
+    # Additive increase once out of slow start
+    finish(limiter)
+    assert limiter.limit == pytest.approx(4.25)
+    summary = limiter.summary()
+    assert summary["decreases"] == 1
+    assert summary["overloaded"] == 1
+
+
+def test_requests_started_before_a_decrease_do_not_decrease_again():
+    limiter = AdaptiveLimiter(min_limit=1, max_limit=8, latency_target=LATENCY_TARGET)
+    for i in range(7):
+        finish(limiter)
+    started = [limiter.acquire() for i in range(3)]
+    limiter.release(started[0], ENDPOINT, 429)
+    limiter.release(started[1], ENDPOINT, 500)
+    limiter.release(started[2], ENDPOINT, failed=True)
+    assert limiter.limit == 4
+    assert limiter.summary()["decreases"] == 1
+
+
+def test_limit_never_drops_below_min_limit():
+    limiter = AdaptiveLimiter(min_limit=2, max_limit=4, latency_target=LATENCY_TARGET)
+    for i in range(3):
+        finish(limiter, status=503)
+    assert limiter.limit == 2
+
+
+def test_slow_responses_halve_the_limit():
+    limiter = AdaptiveLimiter(min_limit=4, max_limit=8, latency_target=0.5)
+    started = limiter.acquire()
+    # Answered a second after it started
+    limiter.release(started - 1.0, ENDPOINT, 200)
+    assert limiter.limit == 4
+    assert limiter.summary()["overloaded"] == 1
+
+
+def test_fixed_limit():
+    limiter = AdaptiveLimiter(max_limit=3, adaptive=False)
+    finish(limiter, status=503)
+    finish(limiter)
+    assert limiter.limit == 3
+
+
+def test_acquire_waits_for_a_free_slot():
+    limiter = AdaptiveLimiter(max_limit=1, adaptive=False)
+    started = limiter.acquire()
+    acquired = threading.Event()
+
+    def second():
+        limiter.release(limiter.acquire(), ENDPOINT, 200)
+        acquired.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not acquired.wait(0.1)
+    limiter.release(started, ENDPOINT, 200)
+    assert acquired.wait(5)
+    thread.join()
+
+
+def test_max_rps_spaces_request_starts():
+    limiter = AdaptiveLimiter(max_limit=10, adaptive=False, max_rps=50)
+    starts = []
+    for i in range(3):
+        started = limiter.acquire()
+        starts.append(started)
+        limiter.release(started, ENDPOINT, 200)
+    assert starts[2] - starts[0] >= 0.04 - 1e-6
+
+
+class FailingTransport:
+    def request(self, method, url, **kwargs):
+        raise requests.exceptions.ConnectionError("refused")
+
+
+def test_transport_releases_failed_requests():
+    limiter = AdaptiveLimiter(min_limit=1, max_limit=4, latency_target=LATENCY_TARGET)
+    transport = LimitingTransport(FailingTransport(), limiter)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        transport.request("GET", "https://orch/gms/rest/appliance")
+    assert limiter.in_flight == 0
+    assert limiter.summary()["overloaded"] == 1
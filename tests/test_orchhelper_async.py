@@ -0,0 +1,71 @@
+# Standard library imports
+import asyncio
+
+# Local application imports
+from mock_orchestrator import MockOrchestrator
+from sp_orchhelper_async import AsyncOrchHelper
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_login_session_survives_on_an_ip_address():
+    async def login(url):
+        async with AsyncOrchHelper(url, "admin", "admin") as orch:
+            assert await orch.login()
+            cookies = dict((cookie.key, cookie.value) for cookie in orch.session.cookie_jar)
+            appliances = await orch.get_all_appliances()
+            return cookies, appliances
+
+    with MockOrchestrator() as mock:
+        assert mock.url.startswith("http://127.0.0.1:")
+        cookies, appliances = run(login(mock.url))
+    assert cookies["orchCsrfToken"] == "mock-csrf-token"
+    assert "JSESSIONID" in cookies
+    assert appliances is not False
+
+
+def test_calls_after_login_are_authenticated():
+    async def calls(url):
+        async with AsyncOrchHelper(url, "admin", "admin") as orch:
+            await orch.login()
+            created = await orch.create_preconfig("site-1", "", "hostname: site-1\n", False)
+            preconfig = await orch.get_preconfig(created)
+            overlays = await orch.get_all_overlays()
+            return created, preconfig, overlays
+
+    with MockOrchestrator(overlays=[{"name": "RealTime"}]) as mock:
+        created, preconfig, overlays = run(calls(mock.url))
+    assert created not in (False, True)
+    assert preconfig.json()["name"] == "site-1"
+    assert overlays.json() == [{"name": "RealTime"}]
+
+
+def test_streamed_listings():
+    preconfigs = [{"id": str(i), "name": "site-{0}".format(i)} for i in range(1, 2001)]
+    denied = [{"id": "1.NE", "applianceInfo": {"site": "site-1", "reachabilityStatus": 1}}]
+
+    async def listings(url):
+        async with AsyncOrchHelper(url, "admin", "admin") as orch:
+            await orch.login()
+            names = [preconfig["name"] async for preconfig in await orch.iter_all_preconfig()]
+            denied_ids = [appliance["id"] async for appliance in await orch.iter_all_denied_appliances()]
+            discovered = [appliance async for appliance in await orch.iter_all_discovered_appliances()]
+            return names, denied_ids, discovered
+
+    with MockOrchestrator(preconfigs=preconfigs, denied_appliances=denied) as mock:
+        names, denied_ids, discovered = run(listings(mock.url))
+    assert names == [preconfig["name"] for preconfig in preconfigs]
+    assert denied_ids == ["1.NE"]
+    assert discovered == []
+
+
+def test_failed_listing_returns_false():
+    async def listing(url):
+        async with AsyncOrchHelper(url, "admin", "admin") as orch:
+            # Not logged in
+            return await orch.iter_all_preconfig()
+
+    with MockOrchestrator() as mock:
+        assert run(listing(mock.url)) is False
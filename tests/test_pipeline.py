@@ -0,0 +1,155 @@
+# Standard library imports
+import threading
+import time
+
+# Third party imports
+import pytest
+
+# Local application imports
+from preconfig_pipeline import (
+    STATUS_ERROR,
+    STATUS_INVALID,
+    STATUS_SKIPPED,
+    STATUS_UNCHANGED,
+    STATUS_UPLOADED,
+    PreconfigPipeline,
+    RowStatusLog,
+)
+
+ROWS = 40
+
+
+class Stages:
+    # Pipeline stages recording what ran, the first row is the slowest to validate
+    # invalid are row numbers failing validation, unchanged rows stop at validation as unchanged
+
+    def __init__(self, invalid=(), unchanged=(), fail_validate=(), fail_upload=()):
+        self.invalid = set(invalid)
+        self.unchanged = set(unchanged)
+        self.fail_validate = set(fail_validate)
+        self.fail_upload = set(fail_upload)
+        self.lock = threading.Lock()
+        self.events = []
+        self.reported = []
+
+    def record(self, event, result):
+        with self.lock:
+            self.events.append((event, result["row_number"]))
+
+    def render(self, result, row):
+        return "hostname: {0}\n".format(row["hostname"])
+
+    def validate(self, result, row, preconfig):
+        if result["row_number"] == 1:
+            time.sleep(0.05)
+        self.record("validate", result)
+        if result["row_number"] in self.fail_validate:
+            raise ValueError("validation timed out")
+        if result["row_number"] in self.unchanged:
+            result["status"] = STATUS_UNCHANGED
+            return False
+        return result["row_number"] not in self.invalid
+
+    def upload(self, result, row, preconfig):
+        self.record("upload", result)
+        if result["row_number"] in self.fail_upload:
+            raise ValueError("upload refused")
+
+    def report(self, result):
+        self.reported.append((result["row_number"], result["status"]))
+
+    def pipeline(self, workers, streaming=False, **kwargs):
+        return PreconfigPipeline(
+            self.render, self.validate, self.upload, workers=workers, report=self.report, streaming=streaming, **kwargs
+        )
+
+
+def run(pipeline, rows=ROWS):
+    for row_number in range(1, rows + 1):
+        pipeline.submit(row_number, {"hostname": "site-{0}".format(row_number)})
+    return pipeline.close()
+
+
+def run_within(pipeline, seconds=10):
+    # Runs the rows on a thread, failing the test rather than hanging it when a row never returns
+    # its in-flight slot, which blocks submit() and close()
+    closed = []
+    runner = threading.Thread(target=lambda: closed.append(run(pipeline)), daemon=True)
+    runner.start()
+    runner.join(seconds)
+    assert closed, "rows never returned their in-flight slots"
+    return closed[0]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_results_are_reported_in_csv_order(workers):
+    stages = Stages(invalid=[3])
+    results = run(stages.pipeline(workers))
+    assert [result["row_number"] for result in results] == list(range(1, ROWS + 1))
+    assert [row_number for row_number, status in stages.reported] == list(range(1, ROWS + 1))
+    assert stages.reported[2] == (3, STATUS_INVALID)
+    if workers > 1:
+        # Validation really finished out of order
+        validated = [row_number for event, row_number in stages.events if event == "validate"]
+        assert validated != sorted(validated)
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_upload_runs_only_after_a_successful_validation(workers):
+    stages = Stages(invalid=[2], unchanged=[3], fail_validate=[4], fail_upload=[5])
+    results = run(stages.pipeline(workers), rows=6)
+    uploaded = [row_number for event, row_number in stages.events if event == "upload"]
+    assert sorted(uploaded) == [1, 5, 6]
+    for row_number in uploaded:
+        assert stages.events.index(("validate", row_number)) < stages.events.index(("upload", row_number))
+    assert [result["status"] for result in results] == [
+        STATUS_UPLOADED,
+        STATUS_INVALID,
+        STATUS_UNCHANGED,
+        STATUS_ERROR,
+        STATUS_ERROR,
+        STATUS_UPLOADED,
+    ]
+    assert results[3]["messages"] == ["validate failed: validation timed out"]
+    assert results[4]["phase"] == "upload"
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_streaming_reports_in_order_into_a_status_log(workers):
+    stages = Stages(invalid=[7])
+    pipeline = stages.pipeline(workers, streaming=True)
+    pipeline.skip(0, "", "no hostname")
+    results = run(pipeline)
+    assert isinstance(results, RowStatusLog)
+    assert len(results) == ROWS + 1
+    assert [row_number for row_number, status in stages.reported] == list(range(0, ROWS + 1))
+    statuses = list(results)
+    assert statuses[0] == ("", STATUS_SKIPPED)
+    assert statuses[7] == ("site-7", STATUS_INVALID)
+    assert statuses[ROWS] == ("site-{0}".format(ROWS), STATUS_UPLOADED)
+    assert pipeline.summary() == {STATUS_SKIPPED: 1, STATUS_INVALID: 1, STATUS_UPLOADED: ROWS - 1}
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_failing_callbacks_do_not_hang_close(streaming):
+    stages = Stages()
+
+    def finished(result):
+        if result["row_number"] % 3 == 0:
+            raise OSError("journal disk full")
+
+    def report(result):
+        stages.report(result)
+        if result["row_number"] % 5 == 0:
+            raise OSError("report disk full")
+
+    pipeline = PreconfigPipeline(
+        stages.render, stages.validate, stages.upload, workers=2, report=report, streaming=streaming, finished=finished
+    )
+    results = run_within(pipeline)
+    assert len(results) == ROWS
+    assert [row_number for row_number, status in stages.reported] == list(range(1, ROWS + 1))
+    if not streaming:
+        assert results[2]["messages"] == ["finished callback failed: journal disk full"]
+        assert results[4]["messages"] == ["report callback failed: report disk full"]
+        assert results[2]["status"] == STATUS_UPLOADED
@@ -0,0 +1,124 @@
+# Third party imports
+import requests
+
+# Local application imports
+from preconfig_fanout import FanOut
+from preconfig_references import (
+    EXAMPLE_ROWS,
+    ReferenceIndex,
+    collect_references,
+    entry_names,
+    fetch_names,
+    merge_summaries,
+)
+
+GROUPS = [{"name": "Default Template Group"}, {"name": "Branch"}]
+OVERLAYS = [{"name": "RealTime"}, {"name": "CriticalApps"}]
+
+
+class FakeClient:
+    # Orchestrator client returning the listings given, raising them when they are exceptions
+    def __init__(self, template_groups):
+        self.template_groups = template_groups
+
+    def get_all_template_groups(self):
+        if isinstance(self.template_groups, Exception):
+            raise self.template_groups
+        return self.template_groups
+
+
+def site(number, groups="Default Template Group", overlays="RealTime", **columns):
+    row = {"hostname": "site-{0}".format(number), "templateGroups": groups, "businessIntentOverlays": overlays}
+    row.update(columns)
+    return number, row
+
+
+def test_entry_names():
+    assert entry_names(GROUPS) == {"Default Template Group", "Branch"}
+    assert entry_names([]) == set()
+    # Failed requests and error bodies are not an empty listing
+    assert entry_names(False) is None
+    assert entry_names({"error": "forbidden"}) is None
+    assert entry_names(["Branch"]) is None
+
+
+def test_failed_listings_are_unchecked():
+    assert fetch_names(FakeClient(GROUPS), "get_all_template_groups") == {"Default Template Group", "Branch"}
+    assert fetch_names(FakeClient(GROUPS), "get_all_overlays") is None
+    assert fetch_names(FakeClient(False), "get_all_template_groups") is None
+    assert fetch_names(FakeClient(requests.exceptions.ConnectionError()), "get_all_template_groups") is None
+    assert fetch_names(FakeClient(ValueError("not JSON")), "get_all_template_groups") is None
+
+    index = ReferenceIndex(None, entry_names(OVERLAYS))
+    assert index.unchecked() == ["template group"]
+    # Any template group passes, overlays are still checked
+    row = {"templateGroups": ["Anything"], "businessIntentOverlays": ["RealTime", "Bulk"]}
+    assert index.check(row) == ["Unknown overlay Bulk"]
+
+
+def test_collect_references():
+    rows = [site(number) for number in range(1, 9)]
+    rows.append(site(9, groups=["Branch", "Branch"], overlays=[]))
+    rows.append(site(10, hostname=""))
+    references = collect_references(rows)
+    assert list(references) == [""]
+    groups = references[""][("templateGroups", "Default Template Group")]
+    # Every row is counted, only the first row numbers are kept
+    assert groups == [8, list(range(1, EXAMPLE_ROWS + 1))]
+    # A name repeated in a row counts the row once, rows without a hostname are not counted
+    assert references[""][("templateGroups", "Branch")] == [1, [9]]
+    assert references[""][("businessIntentOverlays", "RealTime")][0] == 8
+
+
+def test_collect_references_per_orchestrator():
+    rows = [site(1, orch="east"), site(2, groups="Branch", orch="west"), site(3, orch="")]
+    references = collect_references(rows, lambda row: row.get("orch") or "")
+    assert list(references) == ["east", "west", ""]
+    assert list(references["west"]) == [("templateGroups", "Branch"), ("businessIntentOverlays", "RealTime")]
+
+
+def test_unknown_names_are_counted_across_the_csv_before_any_row():
+    rows = [site(number, groups="Default Template Group,Brnach") for number in range(1, 8)]
+    rows.append(site(8, overlays="RealTime,Bulk"))
+    referenced = collect_references(rows)[""]
+    index = ReferenceIndex(entry_names(GROUPS), entry_names(OVERLAYS), referenced)
+    assert index.unknown_references() == [
+        ("template group", "Brnach", 7, list(range(1, EXAMPLE_ROWS + 1))),
+        ("overlay", "Bulk", 1, [8]),
+    ]
+
+    # Checking the rows reports their unknown names without counting them again
+    row = {"templateGroups": ["Default Template Group", "Brnach"], "businessIntentOverlays": ["RealTime"]}
+    assert index.check(row) == ["Unknown template group Brnach, did you mean Branch?"]
+    assert index.summary() == [("template group", "Brnach", 7), ("overlay", "Bulk", 1)]
+
+
+def test_rows_are_counted_as_checked_without_a_pre_pass():
+    index = ReferenceIndex(entry_names(GROUPS), entry_names(OVERLAYS))
+    assert index.unknown_references() == []
+    row = {"templateGroups": ["Hub"], "businessIntentOverlays": ["RealTime"]}
+    for _ in range(3):
+        index.check(row)
+    assert index.summary() == [("template group", "Hub", 3)]
+
+
+def test_merge_summaries():
+    east = [("template group", "Hub", 3), ("overlay", "Bulk", 1)]
+    west = [("overlay", "Bulk", 4)]
+    assert merge_summaries([east, west]) == [("overlay", "Bulk", 5), ("template group", "Hub", 3)]
+    assert merge_summaries([]) == []
+
+
+def test_failed_partition_counts_its_rows():
+    def open_partition(key):
+        if key == "down":
+            raise ConnectionError("login failed")
+        return []
+
+    fanout = FanOut(open_partition, lambda partition, row_number, row: partition.append(row_number))
+    for row_number in range(1, 7):
+        fanout.submit("down" if row_number % 3 == 0 else "up", row_number, {})
+    partitions = fanout.close()
+    assert partitions["up"] == [1, 2, 4, 5]
+    assert str(fanout.errors["down"]) == "login failed"
+    assert fanout.dropped == {"down": 2}
@@ -0,0 +1,93 @@
+# Third party imports
+import yaml
+
+# Local application imports
+from preconfig_schema import validate_preconfig_yaml
+
+
+def preconfig(**sections):
+    # A preconfig passing every local check, with sections replaced or added
+    document = {
+        "applianceInfo": {"hostname": "site-1", "networkRole": "non-hub"},
+        "templateGroups": {"groups": ["Default Template Group"]},
+        "deploymentInfo": {
+            "deploymentMode": "inline-router",
+            "deploymentInterfaces": [
+                {"interfaceName": "lan0", "interfaceType": "lan", "ipAddressMask": "10.1.1.1/24"},
+                {
+                    "interfaceName": "wan0",
+                    "interfaceType": "wan",
+                    "ipAddressMask": "192.0.2.2/30",
+                    "nextHop": "192.0.2.1",
+                },
+            ],
+            "dhcpInfo": [
+                {
+                    "dhcpInterfaceName": "lan0",
+                    "dhcpType": "server",
+                    "dhcpAddressMask": "10.1.1.0/24",
+                    "startIpAddress": "10.1.1.100",
+                    "endIpAddress": "10.1.1.200",
+                    "gatewayIpAddress": "10.1.1.1",
+                }
+            ],
+        },
+    }
+    document.update(sections)
+    return yaml.safe_dump(document)
+
+
+def dhcp(**values):
+    deployment = yaml.safe_load(preconfig())["deploymentInfo"]
+    deployment["dhcpInfo"][0].update(values)
+    return preconfig(deploymentInfo=deployment)
+
+
+def test_valid_preconfig_passes():
+    assert validate_preconfig_yaml(preconfig()) == []
+
+
+def test_unparsable_yaml():
+    errors = validate_preconfig_yaml("applianceInfo: [unclosed")
+    assert len(errors) == 1
+    assert errors[0].startswith("YAML does not parse")
+
+
+def test_missing_required_sections():
+    assert validate_preconfig_yaml("") == ["preconfig: missing"]
+    errors = validate_preconfig_yaml(yaml.safe_dump({"applianceInfo": {"hostname": "site-1"}}))
+    assert errors == ["deploymentInfo: missing"]
+
+
+def test_bad_values_are_reported_with_their_path():
+    errors = validate_preconfig_yaml(
+        preconfig(bgpSystemConfig={"asn": 0, "routerId": "10.0.0"}, applianceInfo={"hostname": "site-1", "networkRole": "spoke"})
+    )
+    assert "applianceInfo.networkRole: spoke is not one of hub, non-hub" in errors
+    assert "bgpSystemConfig.asn: 0 is not an AS number (1-4294967295)" in errors
+    assert "bgpSystemConfig.routerId: 10.0.0 is not an IP address" in errors
+
+
+def test_empty_group_and_overlay_lists_are_accepted():
+    assert validate_preconfig_yaml(preconfig(templateGroups={"groups": []})) == []
+    assert validate_preconfig_yaml(preconfig(businessIntentOverlays={"overlays": [None]})) == []
+
+
+def test_dhcp_range_outside_network():
+    errors = validate_preconfig_yaml(dhcp(endIpAddress="10.2.0.1"))
+    assert errors == ["deploymentInfo.dhcpInfo[0].endIpAddress: 10.2.0.1 is not in 10.1.1.0/24"]
+
+
+def test_dhcp_range_reversed():
+    errors = validate_preconfig_yaml(dhcp(startIpAddress="10.1.1.200", endIpAddress="10.1.1.100"))
+    assert errors == ["deploymentInfo.dhcpInfo[0].startIpAddress: 10.1.1.200 is after endIpAddress 10.1.1.100"]
+
+
+def test_dhcp_range_mixing_ip_versions():
+    errors = validate_preconfig_yaml(dhcp(endIpAddress="2001:db8::1"))
+    assert "deploymentInfo.dhcpInfo[0].endIpAddress: 2001:db8::1 is not the same IP version as startIpAddress 10.1.1.100" in errors
+
+
+def test_dhcp_interface_must_be_a_deployment_interface():
+    errors = validate_preconfig_yaml(dhcp(dhcpInterfaceName="lan9"))
+    assert errors == ["deploymentInfo.dhcpInfo[0].dhcpInterfaceName: lan9 is not a deployment interface"]
@@ -0,0 +1,102 @@
+# Standard library imports
+import json
+import os
+import subprocess
+import sys
+
+# Local application imports
+from mock_orchestrator import MockOrchestrator
+from preconfig_state import PreconfigStateStore
+
+PACKAGE_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+MAIN_SCRIPT = os.path.join(PACKAGE_DIRECTORY, "silverpeak-preconfig-from-jinja.py")
+
+EAST = "https://east.example.com"
+WEST = "https://west.example.com"
+
+
+def test_state_is_kept_per_orchestrator(tmp_path):
+    store = PreconfigStateStore(str(tmp_path / "state.json"))
+    store.record(EAST, "site-1", "preconfig", "template", "uploaded")
+    assert store.is_unchanged(EAST, "site-1", "preconfig", "template", upload=True)
+    # The same host and preconfig was never processed on the other Orchestrator
+    assert not store.is_unchanged(WEST, "site-1", "preconfig", "template", upload=True)
+    assert not store.is_unchanged(EAST, "site-1", "changed", "template", upload=True)
+    assert not store.is_unchanged(EAST, "site-1", "preconfig", "changed", upload=True)
+
+    store.save()
+    store = PreconfigStateStore(str(tmp_path / "state.json"))
+    assert store.is_unchanged(EAST, "site-1", "preconfig", "template", upload=True)
+    assert not store.is_unchanged(WEST, "site-1", "preconfig", "template", upload=True)
+
+
+def test_validated_rows_are_only_unchanged_when_not_uploading(tmp_path):
+    store = PreconfigStateStore(str(tmp_path / "state.json"))
+    store.record(EAST, "site-1", "preconfig", "template", "valid")
+    assert store.is_unchanged(EAST, "site-1", "preconfig", "template", upload=False)
+    assert not store.is_unchanged(EAST, "site-1", "preconfig", "template", upload=True)
+
+
+def test_state_file_keyed_by_hostname_only_is_ignored(tmp_path):
+    filename = tmp_path / "state.json"
+    filename.write_text(
+        json.dumps({"site-1": {"preconfig_hash": "preconfig", "template_hash": "template", "outcome": "uploaded"}})
+    )
+    store = PreconfigStateStore(str(filename))
+    assert not store.is_unchanged(EAST, "site-1", "preconfig", "template", upload=True)
+
+
+def test_moved_from(tmp_path):
+    store = PreconfigStateStore(str(tmp_path / "state.json"))
+    store.record(EAST, "site-1", "preconfig", "template", "uploaded")
+    assert store.moved_from(WEST, "site-1") == [EAST]
+    assert store.moved_from(EAST, "site-1") == []
+    assert store.moved_from(WEST, "site-2") == []
+
+
+def run_main(directory, inventory, orchestrator_map):
+    # Runs the main script uploading every row, routed by region, with its state file in directory
+    (directory / "inventory.csv").write_text(
+        "hostname,serial_number,region\n" + "".join("{0},SN-{0},{1}\n".format(*row) for row in inventory)
+    )
+    (directory / "orchestrators.json").write_text(json.dumps(orchestrator_map))
+    if not (directory / "templates").exists():
+        os.symlink(os.path.join(PACKAGE_DIRECTORY, "templates"), str(directory / "templates"))
+    command = [
+        sys.executable, MAIN_SCRIPT,
+        "--csv", "inventory.csv",
+        "--orch-column", "region", "--orch-map", "orchestrators.json",
+        "--upload", "yes", "--autoapply", "", "--retries", "1", "--template-cache", "",
+        "--no-column-check", "--no-local-validation", "--no-reference-check",
+    ]
+    environment = dict(os.environ, ORCH_USER="admin", ORCH_PASSWORD="admin")
+    completed = subprocess.run(
+        command, cwd=str(directory), env=environment, stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=120,
+    )
+    output = completed.stdout.decode("utf-8")
+    assert completed.returncode == 0, output
+    return output
+
+
+def uploaded(orchestrator):
+    return sorted(preconfig["name"] for preconfig in orchestrator.preconfigs.values())
+
+
+def test_rows_routed_to_a_new_orchestrator_are_processed(tmp_path):
+    with MockOrchestrator() as east, MockOrchestrator() as west:
+        orchestrator_map = {"east": east.url, "west": west.url}
+        run_main(tmp_path, [("site-1", "east"), ("site-2", "east")], orchestrator_map)
+        assert uploaded(east) == ["site-1", "site-2"]
+        assert uploaded(west) == []
+
+        # site-1 moves to west: unchanged on east, but never uploaded to west
+        output = run_main(tmp_path, [("site-1", "west"), ("site-2", "east")], orchestrator_map)
+        assert uploaded(west) == ["site-1"]
+        assert "site-1 was last processed on {0}, now routed to {1}".format(east.url, west.url) in output
+        assert "site-2 unchanged since last run, skipping" in output
+        assert uploaded(east) == ["site-1", "site-2"]
+
+        output = run_main(tmp_path, [("site-1", "west"), ("site-2", "east")], orchestrator_map)
+        assert "site-1 unchanged since last run, skipping" in output
+        assert uploaded(west) == ["site-1"]
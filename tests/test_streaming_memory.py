@@ -0,0 +1,37 @@
+# Streaming runs must keep peak memory flat as the inventory grows, see
+# benchmarks/bench_streaming_memory.py for the larger runs and the end to end main script check
+
+# Third party imports
+import pytest
+
+# Local application imports
+from bench_streaming_memory import check_growth, peak_memory, write_inventory
+
+ROWS = [500, 5000]
+# Fixed allowance on top of the per-row status log
+TOLERANCE = 512 * 1024
+
+
+@pytest.fixture(scope="module")
+def inventories(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("inventories")
+    filenames = []
+    for rows in ROWS:
+        filename = str(directory / "inventory_{0}.csv.gz".format(rows))
+        write_inventory(filename, rows)
+        filenames.append(filename)
+    return str(directory), filenames
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_streaming_peak_memory_stays_flat(inventories, workers):
+    directory, filenames = inventories
+    peaks = [peak_memory(filename, True, workers, directory) for filename in filenames]
+    assert check_growth("streaming peak", ROWS, peaks, TOLERANCE), peaks
+
+
+def test_buffered_peak_memory_grows(inventories):
+    # The same check fails for a buffered run, so it does detect memory growing with row count
+    directory, filenames = inventories
+    peaks = [peak_memory(filename, False, 4, directory) for filename in filenames]
+    assert not check_growth("buffered peak", ROWS, peaks, TOLERANCE), peaks
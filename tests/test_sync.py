@@ -0,0 +1,80 @@
+# Standard library imports
+import base64
+
+# Local application imports
+from preconfig_sync import SYNC_CREATE, SYNC_UNCHANGED, SYNC_UPDATE, PreconfigSync
+
+EXISTING_YAML = "# site-1\nhostname: site-1\nvlans: [10, 20]\n"
+
+
+def encode(yaml_text):
+    return base64.b64encode(yaml_text.encode("utf-8")).decode("ascii")
+
+
+def existing(yaml_text=EXISTING_YAML, **fields):
+    preconfig = {"id": "7", "name": "site-1", "serialNum": "SN-1", "autoApply": False, "configData": encode(yaml_text)}
+    preconfig.update(fields)
+    return preconfig
+
+
+class ConfigData:
+    # get_config_data returning the configData given, recording the preconfig ids fetched
+    def __init__(self, yaml_text=EXISTING_YAML):
+        self.config_data = None if yaml_text is None else encode(yaml_text)
+        self.fetched = []
+
+    def __call__(self, preconfig_id):
+        self.fetched.append(preconfig_id)
+        return self.config_data
+
+
+def test_only_a_hash_of_existing_yaml_is_kept():
+    sync = PreconfigSync(iter([existing()]))
+    assert "configData" not in sync.existing["site-1"]
+    assert sync.existing["site-1"]["id"] == "7"
+
+
+def test_identical_text_is_unchanged_without_a_fetch():
+    config_data = ConfigData()
+    sync = PreconfigSync([existing()], config_data)
+    assert sync.compare("site-1", "SN-1", EXISTING_YAML, False) == (SYNC_UNCHANGED, sync.existing["site-1"])
+    assert config_data.fetched == []
+
+
+def test_differing_text_is_fetched_again_and_compared_parsed():
+    config_data = ConfigData()
+    sync = PreconfigSync([existing()], config_data)
+    # Comments, flow style and key order do not count as changes
+    reformatted = "vlans:\n  - 10\n  - 20\nhostname: site-1\n"
+    assert sync.compare("site-1", "SN-1", reformatted, False)[0] == SYNC_UNCHANGED
+    assert config_data.fetched == ["7"]
+
+    assert sync.compare("site-1", "SN-1", "hostname: site-1\nvlans: [10, 30]\n", False)[0] == SYNC_UPDATE
+    assert config_data.fetched == ["7", "7"]
+
+
+def test_differing_text_is_a_change_when_it_cannot_be_compared():
+    reformatted = "vlans: [10, 20]\nhostname: site-1\n"
+    assert PreconfigSync([existing()]).compare("site-1", "SN-1", reformatted, False)[0] == SYNC_UPDATE
+    # Existing preconfig could not be fetched again
+    sync = PreconfigSync([existing()], ConfigData(None))
+    assert sync.compare("site-1", "SN-1", reformatted, False)[0] == SYNC_UPDATE
+    # Rendered preconfig does not parse
+    sync = PreconfigSync([existing()], ConfigData())
+    assert sync.compare("site-1", "SN-1", "hostname: [site-1\n", False)[0] == SYNC_UPDATE
+
+
+def test_serial_number_and_auto_apply_changes_update_without_a_fetch():
+    config_data = ConfigData()
+    sync = PreconfigSync([existing()], config_data)
+    assert sync.compare("site-1", "SN-2", EXISTING_YAML, False)[0] == SYNC_UPDATE
+    assert sync.compare("site-1", "SN-1", EXISTING_YAML, True)[0] == SYNC_UPDATE
+    assert sync.compare("site-2", "SN-2", EXISTING_YAML, False) == (SYNC_CREATE, None)
+    assert config_data.fetched == []
+
+
+def test_summary():
+    sync = PreconfigSync([])
+    for action in (SYNC_CREATE, SYNC_CREATE, SYNC_UNCHANGED):
+        sync.record(action)
+    assert sync.summary() == "2 created, 0 updated, 1 unchanged"
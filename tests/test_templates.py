@@ -0,0 +1,74 @@
+# Standard library imports
+import os
+import re
+import subprocess
+import sys
+
+# Local application imports
+from preconfig_templates import TemplateSelector, group_rows
+
+PACKAGE_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+MAIN_SCRIPT = os.path.join(PACKAGE_DIRECTORY, "silverpeak-preconfig-from-jinja.py")
+
+# Hubs and branches interleaved, as an inventory sorted by site would have them
+ROLES = ["hub", "branch", "branch", "hub", "branch", "hub"]
+
+
+def inventory():
+    return [(row_number, {"hostname": "site-{0}".format(row_number), "role": role}) for row_number, role in enumerate(ROLES, 1)]
+
+
+def selector():
+    return TemplateSelector("branch.jinja2", templates={"hub": "hub.jinja2"}, column="role")
+
+
+def test_select():
+    rules = [{"match": {"role": ["hub", "dc"]}, "template": "hub.jinja2"}]
+    by_rules = TemplateSelector("branch.jinja2", rules=rules)
+    assert by_rules.select({"role": " dc "}) == "hub.jinja2"
+    assert by_rules.select({"role": "branch"}) == "branch.jinja2"
+    assert by_rules.select({}) == "branch.jinja2"
+    assert selector().select({"role": "lab"}) == "branch.jinja2"
+    assert TemplateSelector("branch.jinja2", column="template").select({"template": "lab.jinja2"}) == "lab.jinja2"
+
+
+def test_rows_keep_input_order_by_default():
+    groups = list(group_rows(iter(inventory()), selector()))
+    assert [rows[0][0] for template, rows in groups] == list(range(1, len(ROLES) + 1))
+    assert all(len(rows) == 1 for template, rows in groups)
+    assert groups[0][0] == "hub.jinja2"
+
+
+def test_rows_are_grouped_per_template_within_a_window():
+    groups = list(group_rows(iter(inventory()), selector(), window=4))
+    assert [(template, [row_number for row_number, row in rows]) for template, rows in groups] == [
+        ("hub.jinja2", [1, 4]),
+        ("branch.jinja2", [2, 3]),
+        ("branch.jinja2", [5]),
+        ("hub.jinja2", [6]),
+    ]
+
+
+def test_main_script_renders_rows_in_csv_order_by_default(tmp_path):
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    for name in ("hub", "branch"):
+        (templates / (name + ".jinja2")).write_text("hostname: {{ data['hostname'] }}\nrole: " + name + "\n")
+    (tmp_path / "inventory.csv").write_text(
+        "hostname,role\n" + "".join("{0},{1}.jinja2\n".format(row["hostname"], row["role"]) for row_number, row in inventory())
+    )
+    command = [
+        sys.executable, MAIN_SCRIPT, "--csv", "inventory.csv", "--jinja", "branch.jinja2",
+        "--template-column", "role", "--offline", "--template-cache", "", "--no-local-validation",
+    ]
+    rendered = []
+    for window in ([], ["--template-window", "4"]):
+        completed = subprocess.run(
+            command + window, cwd=str(tmp_path), stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=120,
+        )
+        output = completed.stdout.decode("utf-8")
+        assert completed.returncode == 0, output
+        rendered.append([int(row_number) for row_number in re.findall(r"from row (\d+)", output)])
+    assert rendered[0] == [1, 2, 3, 4, 5, 6]
+    assert rendered[1] == [1, 4, 2, 3, 5, 6]
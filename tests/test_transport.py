@@ -0,0 +1,190 @@
+# Standard library imports
+import json
+import socket
+
+# Third party imports
+import pytest
+import requests
+
+# Local application imports
+from mock_orchestrator import MockOrchestrator
+from preconfig_client import HelperOrchestrator
+from sp_orchhelper import OrchHelper
+from sp_transport import REDACTED, ReplayMissError, ReplayTransport, RetryTransport
+
+GROUPS = [{"name": "Default Template Group"}]
+
+BASE = "https://orch.example.com/gms/rest"
+PRECONFIG = BASE + "/gms/appliance/preconfiguration"
+
+
+def record_run(url, filename, append=False):
+    # Logs in, lists template groups, validates and creates a preconfig and logs out
+    orch = HelperOrchestrator(url, record=filename, record_append=append, retries=0)
+    assert orch.login("admin", "secret-password")
+    groups = orch.helper.get_all_template_groups().json()
+    valid = orch.validate_preconfig("site-1", "SN-1", "hostname: site-1\n", False).status_code
+    created = orch.create_preconfig("site-1", "SN-1", "hostname: site-1\n", False)
+    orch.logout()
+    return groups, valid, created
+
+
+def test_recording_redacts_cookies_and_credentials(tmp_path):
+    filename = str(tmp_path / "run.jsonl")
+    with MockOrchestrator(template_groups=GROUPS) as orch:
+        record_run(orch.url, filename)
+        session, csrf_token = orch.session_id, orch.csrf_token
+    with open(filename) as recording:
+        text = recording.read()
+    for secret in (session, csrf_token, "secret-password"):
+        assert secret not in text
+    login = json.loads(text.splitlines()[0])
+    assert login["path"].startswith("/gms/rest/authentication/login")
+    assert sorted(login["cookies"]) == [["JSESSIONID", REDACTED], ["orchCsrfToken", REDACTED]]
+
+
+def test_recording_replaces_unless_appending(tmp_path):
+    filename = str(tmp_path / "run.jsonl")
+    with MockOrchestrator(template_groups=GROUPS) as orch:
+        record_run(orch.url, filename)
+        with open(filename) as recording:
+            lines = len(recording.readlines())
+        record_run(orch.url, filename)
+        with open(filename) as recording:
+            assert len(recording.readlines()) == lines
+        record_run(orch.url, filename, append=True)
+        with open(filename) as recording:
+            assert len(recording.readlines()) == 2 * lines
+
+
+def test_replay_serves_the_recording_without_network(tmp_path, monkeypatch):
+    filename = str(tmp_path / "run.jsonl")
+    with MockOrchestrator(template_groups=GROUPS) as orch:
+        url = orch.url
+        recorded = record_run(url, filename)
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("replay opened a connection")
+
+    monkeypatch.setattr(socket.socket, "connect", no_network)
+    monkeypatch.setattr(socket, "create_connection", no_network)
+    orch = HelperOrchestrator(url, replay=filename)
+    assert orch.login("admin", "other-password")
+    assert orch.helper.headers["X-XSRF-TOKEN"] == REDACTED
+    replayed = (
+        orch.helper.get_all_template_groups().json(),
+        orch.validate_preconfig("site-1", "SN-1", "hostname: site-1\n", False).status_code,
+        orch.create_preconfig("site-1", "SN-1", "hostname: site-1\n", False),
+    )
+    orch.logout()
+    assert replayed == recorded == (GROUPS, 200, "1")
+
+
+def test_replay_serves_responses_in_order_then_repeats_the_last(tmp_path):
+    filename = tmp_path / "run.jsonl"
+    records = [
+        {"method": "GET", "path": "/gms/rest/appliance/denied", "status": status, "body": ""}
+        for status in (503, 200)
+    ]
+    filename.write_text("".join(json.dumps(record) + "\n" for record in records))
+    transport = ReplayTransport(str(filename))
+    statuses = [
+        transport.request("GET", "https://any.example.com/gms/rest/appliance/denied").status_code for _ in range(3)
+    ]
+    assert statuses == [503, 200, 200]
+    with pytest.raises(ReplayMissError):
+        transport.request("GET", "https://any.example.com/gms/rest/appliance")
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+class FakeTransport:
+    # Answers with the given statuses or raises the given exceptions in turn, repeating the last
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url))
+        outcome = self.outcomes[min(len(self.requests), len(self.outcomes)) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+    def close(self):
+        pass
+
+
+def retried(method, url, *outcomes):
+    # Number of requests sent and the final status or exception
+    transport = FakeTransport(*outcomes)
+    retry = RetryTransport(transport, retries=3, backoff=0)
+    try:
+        outcome = retry.request(method, url).status_code
+    except requests.exceptions.RequestException as e:
+        outcome = type(e)
+    return len(transport.requests), outcome
+
+
+@pytest.mark.parametrize("method", ["GET", "PUT", "DELETE"])
+@pytest.mark.parametrize("status", [429, 502, 503, 504])
+def test_idempotent_requests_are_retried_on_transient_statuses(method, status):
+    assert retried(method, PRECONFIG, status, status, 200) == (3, 200)
+    # Gives up after the configured retries with the last response
+    assert retried(method, PRECONFIG, status) == (4, status)
+
+
+@pytest.mark.parametrize("status", [400, 401, 404, 500])
+def test_other_statuses_are_not_retried(status):
+    assert retried("GET", PRECONFIG, status, 200) == (1, status)
+
+
+@pytest.mark.parametrize("url", [PRECONFIG, PRECONFIG + "/7", PRECONFIG + "/7/apply/discovered/3.NE"])
+def test_creating_and_modifying_posts_are_never_retried(url):
+    assert retried("POST", url, 503, 200) == (1, 503)
+    # The request may have reached Orchestrator
+    assert retried("POST", url, requests.exceptions.ReadTimeout(), 200) == (1, requests.exceptions.ReadTimeout)
+    assert retried("POST", url, requests.exceptions.ConnectionError(), 200) == (1, requests.exceptions.ConnectionError)
+    # Only a connection never established is safe to retry
+    assert retried("POST", url, requests.exceptions.ConnectTimeout(), 200) == (2, 200)
+
+
+def test_validation_posts_are_retried():
+    assert retried("POST", PRECONFIG + "/validate", 503, 200) == (2, 200)
+    assert retried("POST", PRECONFIG + "/validate", requests.exceptions.ReadTimeout(), 200) == (2, 200)
+
+
+def test_idempotent_requests_are_retried_on_connection_errors():
+    assert retried("GET", PRECONFIG, requests.exceptions.ConnectionError(), 200) == (2, 200)
+    assert retried("GET", PRECONFIG, requests.exceptions.ReadTimeout(), 200) == (2, 200)
+    # Errors other than connection failures and timeouts are raised at once
+    assert retried("GET", PRECONFIG, requests.exceptions.InvalidURL(), 200) == (1, requests.exceptions.InvalidURL)
+
+
+def test_backoff_respects_retry_after():
+    retry = RetryTransport(FakeTransport(200), backoff=0.5, backoff_max=30.0)
+    for attempt in range(4):
+        assert 0 <= retry.delay(attempt) <= 0.5 * 2 ** attempt
+    assert retry.delay(0, FakeResponse(429, {"Retry-After": "5"})) >= 5
+    # Capped at backoff_max
+    assert retry.delay(0, FakeResponse(429, {"Retry-After": "600"})) <= 30.0
+
+
+def test_helper_retries_validation_but_not_creation():
+    with MockOrchestrator() as orch:
+        helper = OrchHelper(orch.url, "admin", "admin", retries=2, backoff=0)
+        assert helper.login()
+        orch.error_rate = 1.0
+        orch.error_status = 503
+        assert helper.validate_preconfig("site-1", "SN-1", "hostname: site-1\n", False).status_code == 503
+        assert not helper.create_preconfig("site-1", "SN-1", "hostname: site-1\n", False)
+        counts = dict(orch.request_counts)
+    assert counts["POST /gms/appliance/preconfiguration/validate"] == 3
+    assert counts["POST /gms/appliance/preconfiguration"] == 1
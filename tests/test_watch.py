@@ -0,0 +1,150 @@
+# Third party imports
+import requests
+
+# Local application imports
+from preconfig_watch import EVENT_APPROVED, EVENT_DUPLICATE, EVENT_FAILED, EVENT_WAITING, ApprovalWatcher
+
+
+def appliance(discovered_id, site, reachable=True):
+    return {"id": discovered_id, "applianceInfo": {"site": site, "reachabilityStatus": 1 if reachable else 2}}
+
+
+class Orchestrator:
+    # Denied appliances, preconfigs and approvals of a fake Orchestrator
+    def __init__(self, denied=(), preconfigs=()):
+        self.denied = list(denied)
+        self.preconfigs = list(preconfigs)
+        self.approved = []
+        self.preconfig_listings = 0
+        # Exceptions or False returned by the next calls, in order
+        self.listing_errors = []
+        self.preconfig_errors = []
+        self.approve_errors = []
+
+    def list_denied(self):
+        if self.listing_errors:
+            error = self.listing_errors.pop(0)
+            if error is False:
+                return False
+            raise error
+        return iter(list(self.denied))
+
+    def list_preconfigs(self):
+        self.preconfig_listings = self.preconfig_listings + 1
+        if self.preconfig_errors:
+            error = self.preconfig_errors.pop(0)
+            if error is False:
+                return False
+            raise error
+        return iter(list(self.preconfigs))
+
+    def approve(self, preconfig_id, discovered_id):
+        if self.approve_errors:
+            error = self.approve_errors.pop(0)
+            if error is False:
+                return False
+            raise error
+        self.approved.append((preconfig_id, discovered_id))
+        return True
+
+
+def watcher(orch, hostnames=("site-1", "site-2"), **kwargs):
+    kwargs.setdefault("preconfig_refresh", 0.0)
+    return ApprovalWatcher(hostnames, [orch.list_denied], orch.list_preconfigs, orch.approve, **kwargs)
+
+
+def events(polled):
+    return [(event, host) for event, host, detail in polled]
+
+
+def test_new_appliance_is_approved_once():
+    orch = Orchestrator(
+        denied=[appliance("1.NE", "site-1"), appliance("2.NE", "other"), appliance("3.NE", "site-2", False)],
+        preconfigs=[{"id": "10", "name": "site-1"}, {"id": "20", "name": "site-2"}],
+    )
+    watch = watcher(orch)
+    assert events(watch.poll()) == [(EVENT_APPROVED, "site-1")]
+    assert orch.approved == [("10", "1.NE")]
+    assert watch.poll() == []
+    assert watch.summary()["watched"] == 2
+
+
+def test_appliance_without_a_preconfig_waits_for_one():
+    orch = Orchestrator(denied=[appliance("1.NE", "site-1")])
+    watch = watcher(orch)
+    assert events(watch.poll()) == [(EVENT_WAITING, "site-1")]
+    # Reported once while waiting
+    assert watch.poll() == []
+    orch.preconfigs.append({"id": "10", "name": "site-1"})
+    assert events(watch.poll()) == [(EVENT_APPROVED, "site-1")]
+    assert watch.summary()["waiting"] == 0
+
+
+def test_failed_listing_fails_the_poll():
+    orch = Orchestrator(denied=[appliance("1.NE", "site-1")], preconfigs=[{"id": "10", "name": "site-1"}])
+    orch.listing_errors = [requests.exceptions.ConnectionError(), False, ValueError("cut off")]
+    watch = watcher(orch)
+    for _ in range(3):
+        assert watch.poll() is None
+    assert watch.summary()["failed_polls"] == 3
+    assert watch.snapshot is None
+    # The appliance is still new once the listing succeeds
+    assert events(watch.poll()) == [(EVENT_APPROVED, "site-1")]
+
+
+def test_failed_approval_is_retried_up_to_max_attempts():
+    orch = Orchestrator(denied=[appliance("1.NE", "site-1")], preconfigs=[{"id": "10", "name": "site-1"}])
+    orch.approve_errors = [requests.exceptions.Timeout(), False, requests.exceptions.ConnectionError()]
+    watch = watcher(orch, max_attempts=3)
+    for _ in range(3):
+        assert events(watch.poll()) == [(EVENT_FAILED, "site-1")]
+    assert watch.poll() == []
+    assert orch.approved == []
+    assert watch.summary()["failed"] == 3
+
+
+def test_failed_approval_succeeds_on_retry():
+    orch = Orchestrator(denied=[appliance("1.NE", "site-1")], preconfigs=[{"id": "10", "name": "site-1"}])
+    orch.approve_errors = [requests.exceptions.Timeout()]
+    watch = watcher(orch)
+    assert events(watch.poll()) == [(EVENT_FAILED, "site-1")]
+    assert events(watch.poll()) == [(EVENT_APPROVED, "site-1")]
+    assert orch.approved == [("10", "1.NE")]
+
+
+def test_failed_preconfig_listing_keeps_the_previous_index():
+    orch = Orchestrator(denied=[appliance("1.NE", "site-1")], preconfigs=[{"id": "10", "name": "site-1"}])
+    watch = watcher(orch)
+    watch.poll()
+    orch.preconfig_errors = [requests.exceptions.ConnectionError(), False]
+    orch.denied.append(appliance("2.NE", "site-2"))
+    assert events(watch.poll()) == [(EVENT_WAITING, "site-2")]
+    assert watch.preconfig_index is not None
+    assert "site-1" in watch.preconfig_index
+
+    orch.denied.append(appliance("3.NE", "site-1"))
+    assert events(watch.poll()) == [(EVENT_APPROVED, "site-1")]
+    assert orch.approved[-1] == ("10", "3.NE")
+
+
+def test_preconfigs_are_refetched_at_most_once_per_interval():
+    now = [0.0]
+    orch = Orchestrator(denied=[appliance("1.NE", "site-1")])
+    watch = watcher(orch, preconfig_refresh=60.0, clock=lambda: now[0])
+    watch.poll()
+    watch.poll()
+    assert orch.preconfig_listings == 1
+    now[0] = 60.0
+    orch.preconfigs.append({"id": "10", "name": "site-1"})
+    assert events(watch.poll()) == [(EVENT_APPROVED, "site-1")]
+    assert orch.preconfig_listings == 2
+
+
+def test_seen_and_duplicate_appliances():
+    orch = Orchestrator(
+        denied=[appliance("1.NE", "site-1"), appliance("2.NE", "site-2"), appliance("3.NE", "site-2")],
+        preconfigs=[{"id": "10", "name": "site-1"}, {"id": "20", "name": "site-2"}],
+    )
+    watch = watcher(orch, seen=["1.NE"])
+    assert sorted(events(watch.poll())) == [(EVENT_APPROVED, "site-2"), (EVENT_DUPLICATE, "site-2")]
+    assert orch.approved == [("20", "3.NE")]
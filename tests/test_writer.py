@@ -0,0 +1,215 @@
+# Standard library imports
+import json
+import os
+import tarfile
+import threading
+import zipfile
+
+# Third party imports
+import pytest
+
+# Local application imports
+import preconfig_writer
+from preconfig_writer import INDEX_NAME, MANIFEST_NAME, ArchiveWriter, DirectoryWriter, OutputWriter, hash_bytes
+
+# A fixed mtime in the past, to tell a rewrite from a kept mtime
+OLD_MTIME_NS = 1_000_000_000_000_000_000
+
+
+def write_all(writer, files):
+    for filename, text in files.items():
+        writer.write(filename, text)
+    writer.close()
+    return writer.summary()
+
+
+def read(path):
+    with open(path) as output_file:
+        return output_file.read()
+
+
+@pytest.mark.parametrize("use_index", [True, False])
+def test_unchanged_file_is_not_rewritten(tmp_path, use_index):
+    write_all(DirectoryWriter(str(tmp_path), use_index=use_index), {"site-1_preconfig.yml": "a: 1\n"})
+    path = tmp_path / "site-1_preconfig.yml"
+    os.utime(path, ns=(OLD_MTIME_NS, OLD_MTIME_NS))
+    if use_index:
+        # Index the file as it is now, as a run that last wrote it would have
+        write_all(DirectoryWriter(str(tmp_path)), {"site-1_preconfig.yml": "a: 1\n"})
+
+    summary = write_all(DirectoryWriter(str(tmp_path), use_index=use_index), {"site-1_preconfig.yml": "a: 1\n"})
+    assert (summary["written"], summary["unchanged"]) == (0, 1)
+    assert os.stat(path).st_mtime_ns == OLD_MTIME_NS
+
+    summary = write_all(DirectoryWriter(str(tmp_path), use_index=use_index), {"site-1_preconfig.yml": "a: 2\n"})
+    assert (summary["written"], summary["unchanged"]) == (1, 0)
+    assert read(path) == "a: 2\n"
+    assert os.stat(path).st_mtime_ns != OLD_MTIME_NS
+
+
+def test_files_are_written_to_a_temp_file_and_renamed(tmp_path, monkeypatch):
+    renames = []
+    replace = os.replace
+
+    def recording_replace(source, destination):
+        # The final name does not exist until the complete temp file is renamed onto it
+        assert not os.path.exists(destination)
+        assert read(source) == "a: 1\n"
+        renames.append((source, destination))
+        replace(source, destination)
+
+    monkeypatch.setattr(preconfig_writer.os, "replace", recording_replace)
+    write_all(DirectoryWriter(str(tmp_path), use_index=False), {"site-1_preconfig.yml": "a: 1\n"})
+    source, destination = renames[0]
+    assert destination == str(tmp_path / "site-1_preconfig.yml")
+    assert source.startswith(destination) and source.endswith(".tmp")
+    assert sorted(os.listdir(tmp_path)) == ["site-1_preconfig.yml"]
+
+
+def test_failed_rename_leaves_the_previous_file(tmp_path, monkeypatch):
+    path = tmp_path / "site-1_preconfig.yml"
+    path.write_text("a: 1\n")
+
+    def failing_replace(source, destination):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(preconfig_writer.os, "replace", failing_replace)
+    writer = DirectoryWriter(str(tmp_path), use_index=False)
+    summary = write_all(writer, {"site-1_preconfig.yml": "a: 2\n"})
+    assert summary["failed"] == 1
+    assert writer.errors == [("site-1_preconfig.yml", "disk full")]
+    assert read(path) == "a: 1\n"
+
+
+def test_index_entry_is_trusted_while_size_and_mtime_match(tmp_path):
+    write_all(DirectoryWriter(str(tmp_path)), {"site-1_preconfig.yml": "a: 1\n"})
+    index = json.loads(read(tmp_path / INDEX_NAME))["files"]["site-1_preconfig.yml"]
+    assert index["sha256"] == hash_bytes(b"a: 1\n")
+
+    # Same size and mtime as indexed, so the file is compared by its indexed hash without reading it
+    path = tmp_path / "site-1_preconfig.yml"
+    path.write_text("b: 1\n")
+    os.utime(path, ns=(index["mtime_ns"], index["mtime_ns"]))
+    summary = write_all(DirectoryWriter(str(tmp_path)), {"site-1_preconfig.yml": "a: 1\n"})
+    assert summary["unchanged"] == 1
+    assert read(path) == "b: 1\n"
+
+
+def test_file_changed_since_indexed_is_compared_by_content(tmp_path):
+    write_all(DirectoryWriter(str(tmp_path)), {"site-1_preconfig.yml": "a: 1\n", "site-2_preconfig.yml": "a: 2\n"})
+    # Edited by hand after the run: the index hash still matches the new preconfig but the file does not
+    path = tmp_path / "site-1_preconfig.yml"
+    path.write_text("edited: true\n")
+    os.utime(path, ns=(OLD_MTIME_NS, OLD_MTIME_NS))
+    # Same content as the preconfig, but not as indexed
+    other = tmp_path / "site-2_preconfig.yml"
+    other.write_text("a: 3\n")
+    os.utime(other, ns=(OLD_MTIME_NS, OLD_MTIME_NS))
+
+    summary = write_all(
+        DirectoryWriter(str(tmp_path)), {"site-1_preconfig.yml": "a: 1\n", "site-2_preconfig.yml": "a: 3\n"}
+    )
+    assert (summary["written"], summary["unchanged"]) == (1, 1)
+    assert read(path) == "a: 1\n"
+    assert os.stat(other).st_mtime_ns == OLD_MTIME_NS
+
+    # Both are indexed as they are now
+    files = json.loads(read(tmp_path / INDEX_NAME))["files"]
+    assert files["site-2_preconfig.yml"]["sha256"] == hash_bytes(b"a: 3\n")
+    assert files["site-2_preconfig.yml"]["mtime_ns"] == OLD_MTIME_NS
+
+
+def test_exists(tmp_path):
+    (tmp_path / "site-1_preconfig.yml").write_text("a: 1\n")
+    for use_index in (True, False):
+        writer = DirectoryWriter(str(tmp_path), use_index=use_index)
+        assert writer.exists("site-1_preconfig.yml")
+        assert not writer.exists("site-2_preconfig.yml")
+        writer.close()
+
+
+@pytest.mark.parametrize("suffix", [".tar.gz", ".tar", ".zip"])
+def test_archive_manifest(tmp_path, suffix):
+    filename = str(tmp_path / ("preconfigs" + suffix))
+    writer = ArchiveWriter(filename)
+    summary = write_all(writer, {"site-1_preconfig.yml": "a: 1\n", "site-2_preconfig.yml": "a: 2\n"})
+    assert summary["written"] == 2
+    assert os.listdir(tmp_path) == [os.path.basename(filename)]
+
+    if suffix == ".zip":
+        with zipfile.ZipFile(filename) as archive:
+            names = archive.namelist()
+            manifest = json.loads(archive.read(MANIFEST_NAME))
+            content = archive.read("site-2_preconfig.yml")
+    else:
+        with tarfile.open(filename) as archive:
+            names = archive.getnames()
+            manifest = json.loads(archive.extractfile(MANIFEST_NAME).read())
+            content = archive.extractfile("site-2_preconfig.yml").read()
+    assert names == ["site-1_preconfig.yml", "site-2_preconfig.yml", MANIFEST_NAME]
+    assert content == b"a: 2\n"
+    assert manifest["files"] == [
+        {"name": "site-1_preconfig.yml", "hostname": "site-1", "size": 5, "sha256": hash_bytes(b"a: 1\n")},
+        {"name": "site-2_preconfig.yml", "hostname": "site-2", "size": 5, "sha256": hash_bytes(b"a: 2\n")},
+    ]
+
+
+def test_archive_repeated_hostname(tmp_path):
+    filename = str(tmp_path / "preconfigs.tar")
+    writer = ArchiveWriter(filename)
+    writer.write("site-1_preconfig.yml", "a: 1\n")
+    writer.write("site-1_preconfig.yml", "a: 1\n")
+    writer.write("site-1_preconfig.yml", "a: 2\n")
+    writer.close()
+    assert writer.summary()["written"] == 1
+    assert writer.summary()["unchanged"] == 1
+    assert writer.errors == [("site-1_preconfig.yml", "already in archive with different content")]
+    with tarfile.open(filename) as archive:
+        assert archive.extractfile("site-1_preconfig.yml").read() == b"a: 1\n"
+
+
+def test_archive_needs_a_supported_suffix(tmp_path):
+    with pytest.raises(ValueError):
+        ArchiveWriter(str(tmp_path / "preconfigs.rar"))
+
+
+class MemoryWriter(OutputWriter):
+    # Keeps written files in memory, failing the names in fail
+
+    def __init__(self, fail=(), **kwargs):
+        self.files = {}
+        self.fail = set(fail)
+        self.threads = set()
+        super().__init__(**kwargs)
+
+    def write_file(self, filename, data):
+        self.threads.add(threading.current_thread().name)
+        if filename in self.fail:
+            raise RuntimeError("cannot write")
+        self.files[filename] = data
+        return True
+
+
+def test_error_fails_only_that_file():
+    writer = MemoryWriter(fail=["b"])
+    summary = write_all(writer, {"a": "1", "b": "2", "c": "3"})
+    assert (summary["written"], summary["failed"]) == (2, 1)
+    assert sorted(writer.files) == ["a", "c"]
+    assert writer.errors == [("b", "cannot write")]
+
+
+def test_writes_in_the_caller_once_the_writer_thread_stopped():
+    writer = MemoryWriter(max_pending=1)
+    # Stop the writer thread without closing the writer
+    writer.queue.put(None)
+    writer.thread.join()
+    # Fill the queue, a put waiting on it would never return
+    writer.queue.put(("queued", b""))
+    assert not writer.put(("x", b""))
+
+    caller = threading.Thread(target=writer.write, args=("a", "1"))
+    caller.start()
+    caller.join(10)
+    assert not caller.is_alive()
+    assert writer.files == {"a": b"1"}
+    assert writer.threads == {caller.name}